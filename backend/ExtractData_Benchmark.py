@@ -0,0 +1,286 @@
+#**********************************************************************
+# Description:
+#   Benchmarks the orchestration of ExtractData_v1.py (scheduling, logging,
+#   lookups, zipping) on a plain machine by running clipAndConvert and the
+#   zip against ExtractData_FakeGP.FakeGeoprocessor.
+#
+# Usage:
+##        python ExtractData_Benchmark.py [--mix vector|raster|mixed] [--jobs 5]
+##               [--workers 4] [--time-scale 0.1] [--size-scale 0.1] [--no-stream]
+##               [--towns 10 [--separate]] [--delta]
+##               [--coordinate-system 3857 [--projected-store]] [--flaky 2] [--broken 1]
+##               [--no-scratch-pool] [--large-layers [--spatial-index]]
+##               [--hang 1 --layer-timeout 5]
+#
+#   Prints wall clock p50/p95 per job and the p50/p95 of every stage, the
+#   same summary ExtractData_MetricsReport.py prints for real jobs, and with
+#   the streaming zip when the first layer could be downloaded on its own.
+#   --towns N makes every job a batch of N town aois (one folder each),
+#   --separate runs the N towns as N jobs instead, for comparison.
+#   --delta makes every job after the first a "since manifest" extract of
+#   the job before it, --changed N touches N layers between jobs.
+#   --coordinate-system reprojects every clip, --projected-store builds the
+#   pre-projected layer store (ExtractData_ProjectedStore.py) after the
+#   first job so the later jobs clip from it.
+#   --flaky N makes the clips of N layers fail once with a transient error,
+#   --broken N makes N layers fail every time; the other layers still ship.
+#   --hang N makes the clips of N layers hang after writing their output,
+#   --layer-timeout gives up on a layer after that many seconds.
+#   --no-scratch-pool creates the job folders and gdb of every job with the
+#   geoprocessor instead of claiming them from the scratch pool.
+#   --large-layers gives the parcel and road layers statewide feature counts
+#   and makes their clips take time per feature of the input, --spatial-index
+#   indexes them first (ExtractData_SpatialIndex.py) so only the features
+#   crossing the aoi boundary are clipped.
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#**********************************************************************
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import ExtractData_v1
+import ExtractData_FakeGP
+import ExtractData_MetricsReport
+import ExtractData_ProjectedStore
+import ExtractData_SpatialIndex
+
+# Vermont in State Plane meters
+STATE_EXTENT = (424000.0, 25000.0, 581000.0, 279000.0)
+MAXAREA_TABLE = "DWARE_Datasets_MaxSize"
+
+MB = 1024 * 1024
+
+# name, data type, output bytes of one clip, compressible
+vector_layers = [("Parcels", "FeatureLayer", 8 * MB, True),
+                 ("RoadCenterlines", "FeatureLayer", 4 * MB, True),
+                 ("Buildings", "FeatureLayer", 6 * MB, True),
+                 ("E911_SiteLocations", "FeatureLayer", 3 * MB, True),
+                 ("Hydrography_Streams", "FeatureLayer", 2 * MB, True),
+                 ("Hydrography_Waterbodies", "FeatureLayer", 1 * MB, True),
+                 ("Wetlands", "FeatureLayer", 2 * MB, True),
+                 ("Soils", "FeatureLayer", 5 * MB, True),
+                 ("TownBoundaries", "FeatureLayer", MB // 2, True),
+                 ("Contours_10ft", "FeatureLayer", 6 * MB, True),
+                 ("RailLines", "FeatureLayer", MB // 4, True),
+                 ("Trails", "FeatureLayer", MB // 2, True)]
+
+raster_layers = [("Ortho_2016_15cm", "MosaicLayer", 60 * MB, False),
+                 ("LandCover_2016", "RasterLayer", 10 * MB, False),
+                 ("DEM_Lidar_0p7m", "RasterLayer", 30 * MB, False),
+                 ("Hillshade_Lidar", "RasterLayer", 20 * MB, False)]
+
+layer_mixes = {"vector": vector_layers,
+               "raster": raster_layers,
+               "mixed": vector_layers[:9] + raster_layers[:3]}
+
+# features and how many times wider than high they are, of the layers --large-layers makes large
+large_layers = {"Parcels": (300000, 1.0),
+                "RoadCenterlines": (80000, 4.0)}
+
+
+def makeLayers(mix):
+    layers = {}
+    for name, dataType, outputBytes, compressible in layer_mixes[mix]:
+        layers["VCGI\\" + name] = {"dataType": dataType,
+                                  "extent": STATE_EXTENT,
+                                  "outputBytes": outputBytes,
+                                  "compressible": compressible,
+                                  "cellSize": 1.0,
+                                  "bands": 3,
+                                  "valueType": "3"}
+        # the feature layers have editor tracking, so the result cache and --delta can trust them
+        if dataType == "FeatureLayer":
+            layers["VCGI\\" + name]["editedAt"] = "2026-10-01 08:00:00"
+    return layers
+
+
+def townAOI(x=490000.0, y=150000.0):
+    # a town sized square, by default in the middle of the state (about 10 x 10 km)
+    return [[[(x, y), (x, y + 10000.0), (x + 10000.0, y + 10000.0), (x + 10000.0, y), (x, y)]]]
+
+
+def townAOIs(count):
+    # count town squares side by side, like a county's towns
+    columns = int(count ** 0.5 + 0.999)
+    return [townAOI(460000.0 + (i % columns) * 10000.0, 120000.0 + (i // columns) * 10000.0)[0] for i in range(count)]
+
+
+def runJob(args, layers, scratch, batchField="", sinceManifest=""):
+    # one extract job the way __main__ runs it
+    ExtractData_v1.gp.scratchworkspace = scratch
+    outputZipFile = os.path.join(scratch, "output.zip")
+    featureFormat = [v.strip() for v in args.feature_format.split("-")]
+    rasterFormat = [v.strip() for v in args.raster_format.split("-")]
+    coordinateSystem = ExtractData_v1.setUpCoordSystemEnvironment(args.coordinate_system, "")
+
+    started = time.time()
+    if args.no_stream:
+        zipFolder = ExtractData_v1.clipAndConvert(layers, "aoi", featureFormat, rasterFormat, coordinateSystem, None, batchField, sinceManifest)
+        ExtractData_v1.zipUpFolder(zipFolder, outputZipFile)
+    else:
+        ExtractData_v1.clipAndConvert(layers, "aoi", featureFormat, rasterFormat, coordinateSystem, outputZipFile, batchField, sinceManifest)
+    ExtractData_v1.CloseLog(ExtractData_v1.TargetLogFile)
+    ExtractData_v1.jobProgress.finish("succeeded")
+    ExtractData_v1.releaseScratchWorkspace()
+    seconds = time.time() - started
+
+    record = ExtractData_v1.jobMetrics.toRecord("succeeded")
+    record["seconds"] = seconds
+    record["firstLayerSeconds"] = firstLayerSeconds(ExtractData_v1.progressPaths(outputZipFile)[0])
+    return record
+
+
+def firstLayerSeconds(progressFile):
+    # when the first layer could be downloaded on its own, from the job's progress events
+    if not os.path.exists(progressFile):
+        return None
+    for line in open(progressFile):
+        event = json.loads(line)
+        if event["state"] == "zipped" and event.get("zip"):
+            return event["time"]
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark clipAndConvert and the zip against a fake geoprocessor")
+    parser.add_argument("--mix", choices=sorted(layer_mixes.keys()), default="mixed", help="layers requested per job")
+    parser.add_argument("--jobs", type=int, default=5, help="number of jobs to run")
+    parser.add_argument("--workers", type=int, default=ExtractData_v1.max_clip_workers, help="max_clip_workers")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplies every geoprocessor latency")
+    parser.add_argument("--size-scale", type=float, default=0.1, help="multiplies every output size")
+    parser.add_argument("--feature-format", default="Shapefile - SHP - .shp")
+    parser.add_argument("--raster-format", default="Tagged Image File Format - TIFF - .tif")
+    parser.add_argument("--no-stream", action="store_true", help="zip after clipping like zipUpFolder used to")
+    parser.add_argument("--cache", action="store_true", help="use the result cache")
+    parser.add_argument("--towns", type=int, default=0, help="make each job a batch of this many town aois")
+    parser.add_argument("--separate", action="store_true", help="run the towns of --towns as separate jobs")
+    parser.add_argument("--delta", action="store_true", help="extract only what changed since the previous job")
+    parser.add_argument("--changed", type=int, default=0, help="layers that change between --delta jobs")
+    parser.add_argument("--coordinate-system", default="same as input", help="output coordinate system, ie. a WKID")
+    parser.add_argument("--projected-store", action="store_true", help="pre-project the requested layers after the first job")
+    parser.add_argument("--flaky", type=int, default=0, help="layers whose first clip of every job fails with a transient error")
+    parser.add_argument("--partial", type=int, default=0, help="layers whose first clip of every job writes its output and then fails")
+    parser.add_argument("--broken", type=int, default=0, help="layers that always fail")
+    parser.add_argument("--hang", type=int, default=0, help="layers whose clips hang after writing their output")
+    parser.add_argument("--layer-timeout", type=float, default=3600, help="seconds before the job gives up on a layer (0 = no limit)")
+    parser.add_argument("--no-scratch-pool", action="store_true", help="don't claim the job folders from the scratch pool")
+    parser.add_argument("--large-layers", action="store_true", help="statewide feature counts for the parcel and road layers")
+    parser.add_argument("--spatial-index", action="store_true", help="index the feature layers before the first job")
+    parser.add_argument("--persistent-pool", action="store_true",
+                        help="keep one clip pool for all jobs like a warm worker (its workers have their own copy of the "
+                             "fake geoprocessor, so --flaky, --partial and --changed don't reach them)")
+    parser.add_argument("--worker-startup", type=float, default=0.0, help="seconds a new clip worker takes to set up the geoprocessor")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch folders")
+    args = parser.parse_args()
+
+    workFolder = tempfile.mkdtemp(prefix="extract_benchmark_")
+    aoiPolygons = townAOI()
+    if args.towns:
+        aoiPolygons = townAOIs(args.towns)
+    layers = makeLayers(args.mix)
+    requested = sorted(layers.keys())
+    fake = ExtractData_FakeGP.FakeGeoprocessor(layers, aoiPolygons,
+                                               maxareas={}, maxareaTable=MAXAREA_TABLE,
+                                               latencies={"checkoutextension": args.worker_startup},
+                                               timeScale=args.time_scale, sizeScale=args.size_scale)
+    ExtractData_v1.setGeoprocessor(fake)
+    ExtractData_v1.haveDataInterop = True
+    ExtractData_v1.max_clip_workers = args.workers
+    ExtractData_v1.maxarea_lookuptable = MAXAREA_TABLE
+    ExtractData_v1.maxarea_snapshot_file = os.path.join(workFolder, "maxarea_snapshot.json")
+    ExtractData_v1.prj_index_file = os.path.join(workFolder, "prj_index.json")
+    ExtractData_v1.metrics_ndjson_file = os.path.join(workFolder, "metrics.ndjson")
+    ExtractData_v1.layer_registry_file = os.path.join(workFolder, "layer_registry.json")
+    ExtractData_v1.projection_stats_file = os.path.join(workFolder, "projection_stats.ndjson")
+    ExtractData_v1.projected_store_folder = ""
+    if args.projected_store:
+        ExtractData_v1.projected_store_folder = os.path.join(workFolder, "projected")
+    ExtractData_v1.result_cache_folder = ""
+    ExtractData_v1.scratch_pool_folder = ""
+    if not args.no_scratch_pool:
+        ExtractData_v1.scratch_pool_folder = os.path.join(workFolder, "scratchpool")
+    ExtractData_v1.layer_retry_backoff = args.time_scale
+    ExtractData_v1.layer_timeout = args.layer_timeout
+    for name in requested[len(requested) - args.broken:]:
+        layers[name]["broken"] = True
+    # a hanging clip sleeps well past the timeout, the job has to stop its worker
+    for name in requested[:args.hang]:
+        layers[name]["hangSeconds"] = args.layer_timeout * 10 or 3600
+    if args.cache:
+        ExtractData_v1.result_cache_folder = os.path.join(workFolder, "cache")
+    if args.large_layers:
+        for name in large_layers:
+            if "VCGI\\" + name in layers:
+                layers["VCGI\\" + name]["featureCount"], layers["VCGI\\" + name]["featureAspect"] = large_layers[name]
+    ExtractData_v1.spatial_index_folder = ""
+    if args.spatial_index:
+        ExtractData_v1.spatial_index_folder = os.path.join(workFolder, "spatialindex")
+
+    records = []
+    try:
+        if args.spatial_index:
+            started = time.time()
+            done = ExtractData_SpatialIndex.refreshIndexes([name for name in requested if "featureCount" in layers[name]])
+            print("indexed %d layers in %.2f s" % (len(done["indexed"]), time.time() - started))
+        if args.persistent_pool:
+            if args.flaky or args.partial or args.changed:
+                print("warning: --flaky, --partial and --changed have no effect with --persistent-pool")
+            ExtractData_v1.startClipPool(args.workers)
+        for job in range(args.jobs):
+            if args.towns and args.separate:
+                # one job per town, the way the towns are submitted without batch mode
+                started = time.time()
+                for town in range(args.towns):
+                    fake.__dict__["aoiPolygons"] = [aoiPolygons[town]]
+                    scratch = os.path.join(workFolder, "job%d_town%d" % (job, town))
+                    os.mkdir(scratch)
+                    record = runJob(args, requested, scratch)
+                    records.append(record)
+                print("job %d: %d towns in %.2f s" % (job, args.towns, time.time() - started))
+                continue
+            sinceManifest = ""
+            if args.delta and job:
+                sinceManifest = os.path.join(workFolder, "job%d" % (job - 1), "output.zip")
+                # an edit adds a row to a layer
+                for name in requested[:args.changed]:
+                    fake.layers[name]["featureCount"] = fake.layers[name].get("featureCount", 0) + 1
+                    fake.layers[name]["editedAt"] = "2026-10-01 08:%02d:00" % job
+            scratch = os.path.join(workFolder, "job%d" % job)
+            os.mkdir(scratch)
+            for name in requested[:args.flaky]:
+                fake.layers[name]["failures"] = 1
+            for name in requested[:args.partial]:
+                fake.layers[name]["partialFailures"] = 1
+            record = runJob(args, requested, scratch, args.towns and "NAME" or "", sinceManifest)
+            records.append(record)
+            if record["firstLayerSeconds"] is not None:
+                print("job %d: %.2f s, first layer ready after %.2f s" % (job, record["seconds"], record["firstLayerSeconds"]))
+            else:
+                print("job %d: %.2f s" % (job, record["seconds"]))
+            for row in ExtractData_v1.layerStatus.toRows(requested):
+                if row["status"] != "extracted" or row["attempts"] > 1:
+                    print("    %-30s %-13s %d attempts" % (row["layer"], row["status"], row["attempts"]))
+            if args.projected_store and job == 0:
+                started = time.time()
+                done = ExtractData_ProjectedStore.refreshStore(minRequests=1)
+                print("projected %d layers in %.2f s" % (len(done["projected"]), time.time() - started))
+    finally:
+        ExtractData_v1.stopClipPool()
+        ExtractData_v1.waitForScratchPool()
+        if not args.keep:
+            shutil.rmtree(workFolder, True)
+
+    print("")
+    print("%s mix, %d layers, %d workers, %s, %s" % (args.mix, len(layer_mixes[args.mix]), args.workers,
+                                                     args.no_stream and "zip after clip" or "streaming zip",
+                                                     args.persistent_pool and "one clip pool" or "a clip pool per job"))
+    ExtractData_MetricsReport.printReport(ExtractData_MetricsReport.summarize(records))
+    if args.keep:
+        print("")
+        print("scratch folders kept in " + workFolder)
@@ -0,0 +1,596 @@
+#**********************************************************************
+# Description:
+#   A pure python stand-in for the arcgisscripting geoprocessor, for
+#   benchmarking and load testing ExtractData_v1.py off an ArcGIS Server.
+#
+#   It implements the calls the extract tool makes (describe, searchcursor,
+#   CreateUniqueName, clip_analysis, clip_management, quickexport, ...).
+#   Every call sleeps for a configurable latency and the clips write
+#   synthetic output files of a configurable size.  Like the real
+#   geoprocessor, method and environment names are case-insensitive.
+#
+# Usage:
+##        import ExtractData_v1, ExtractData_FakeGP
+##        fake = ExtractData_FakeGP.FakeGeoprocessor(layers, aoiPolygons, latencies)
+##        ExtractData_v1.setGeoprocessor(fake)
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#   10/18/2026  - VCGI - Features a search cursor can read, clip time per feature, where clauses, append
+#**********************************************************************
+
+import math
+import os
+import re
+import shutil
+import threading
+import time
+
+# seconds each call takes unless the latencies passed in say otherwise
+default_latencies = {"describe": 0.05,
+                     "exists": 0.01,
+                     "searchcursor": 0.05,
+                     "createuniquename": 0.005,
+                     "createfolder_management": 0.01,
+                     "createfilegdb_management": 0.2,
+                     "createpersonalgdb_management": 0.2,
+                     "makefeaturelayer_management": 0.05,
+                     "copyfeatures_management": 0.2,
+                     "copy_management": 0.2,
+                     "delete_management": 0.05,
+                     "select_analysis": 0.2,
+                     "selectlayerbylocation_management": 0.2,
+                     "getcount_management": 0.1,
+                     "dissolve_management": 0.5,
+                     "clip_analysis": 1.0,
+                     "clip_analysis_feature": 0.00002,
+                     "append_management": 0.1,
+                     "append_feature": 0.000002,
+                     "clip_management": 2.0,
+                     "quickexport_interop": 1.5,
+                     "exportcad_conversion": 1.5,
+                     "getrasterproperties_management": 0.02,
+                     "mosaictonewraster_management": 1.0,
+                     "project_management": 10.0,
+                     "projectraster_management": 20.0,
+                     "listspatialreferences": 0.5,
+                     # a new process importing arcgisscripting and checking out its licenses
+                     "checkoutextension": 0.0}
+
+# the geoprocessor's messages for the ids the extract tool uses
+id_messages = {86131: "Coordinate System WKID %1 is not valid.",
+               86132: "Couldn't find the specified projection file %1.",
+               86133: "Unable to compress zip file contents.",
+               86134: "Error adding %1: %2",
+               86135: "clipped %1...",
+               86136: "failed to clip layer %1...",
+               86137: "Output file format with specified pixel type or number of bands or colormap is not supported",
+               86138: "Extension is invalid for the output raster format.",
+               86139: "..using export to cad..",
+               86140: "failed to export to %1.  The requested formats require the Data Interoperability extension.",
+               86141: "failed to export layer %1 with Quick Export.",
+               86142: "failed to clip layer %1...",
+               86143: "Cannot clip layer: %1.  This tool does not clip layers of type: %2...",
+               86144: "Failure in clipAndConvert..\n"}
+
+
+class FakeExtent(object):
+    def __init__(self, xmin, ymin, xmax, ymax):
+        self.XMin = xmin
+        self.YMin = ymin
+        self.XMax = xmax
+        self.YMax = ymax
+
+    def __str__(self):
+        return "%r %r %r %r" % (self.XMin, self.YMin, self.XMax, self.YMax)
+
+
+class FakeSpatialReference(object):
+    def __init__(self, name, factoryCode=0):
+        self.name = name
+        self.factoryCode = factoryCode
+
+    def exportToString(self):
+        return 'PROJCS["%s"]' % self.name
+
+
+class FakePoint(object):
+    def __init__(self, x, y):
+        self.X = x
+        self.Y = y
+
+
+class FakePolygon(object):
+    # one part per ring, which is all the extract tool looks at
+    def __init__(self, rings):
+        self.rings = rings
+        self.partCount = len(rings)
+
+    def getPart(self, i):
+        return [FakePoint(x, y) for x, y in self.rings[i]]
+
+
+class FakeShape(object):
+    # a feature geometry, for its extent
+    def __init__(self, xmin, ymin, xmax, ymax):
+        self.extent = FakeExtent(xmin, ymin, xmax, ymax)
+
+
+class FakeField(object):
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+
+
+class FakeRow(object):
+    def __init__(self, values):
+        self.values = values
+
+    def getValue(self, name):
+        return self.values[name.lower()]
+
+    def __getattr__(self, name):
+        try:
+            return self.values[name.lower()]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeResult(object):
+    def __init__(self, *outputs):
+        self.outputs = outputs
+
+    def getOutput(self, i):
+        return self.outputs[i]
+
+
+class FakeDescribe(object):
+    def __init__(self, **properties):
+        self.__dict__["properties"] = dict([(k.lower(), v) for k, v in properties.items()])
+
+    def __getattr__(self, name):
+        try:
+            return self.properties[name.lower()]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeGeoprocessor(object):
+    # layers = {layer path: {"dataType": "FeatureLayer" | "RasterLayer" | "MosaicLayer",
+    #                        "extent": (xmin, ymin, xmax, ymax), "sr": name,
+    #                        "outputBytes": bytes a clip writes, "compressible": True/False,
+    #                        "cellSize": raster cell size, "bands": band count, "valueType": "3",
+    #                        "featureCount": features an in_memory clip has (outputBytes / 1k), the
+    #                                        features a search cursor reads from the layer and, when set,
+    #                                        clips take clip_analysis_feature seconds per feature,
+    #                        "featureAspect": how many times wider than high the features are (1),
+    #                        "failures": clips that fail with a transient error before one works,
+    #                        "partialFailures": clips that write their output and then fail that way,
+    #                        "hangSeconds": seconds a clip hangs after writing its output,
+    #                        "editedAt": last edit of a layer with editor tracking,
+    #                        "broken": True when describe fails}}
+    # aoiPolygons = [[ring, ...], ...] the features of the aoi "featureset"
+    # latencies = {lower case call name: seconds}, overrides default_latencies
+    # maxareas = {LAYERNAME: maxarea} rows of the maxarea lookup table
+    # timeScale = multiplies every latency, sizeScale every output size
+    # reprojectFactor = how many times longer a clip takes when it reprojects the layer
+    def __init__(self, layers, aoiPolygons, latencies=None, maxareas=None, maxareaTable=None,
+                 aoiSpatialReference="NAD_1983_StatePlane_Vermont_FIPS_4400", timeScale=1.0, sizeScale=1.0,
+                 reprojectFactor=2.0):
+        self.__dict__["layers"] = layers
+        self.__dict__["aoiPolygons"] = aoiPolygons
+        self.__dict__["aoiSpatialReference"] = aoiSpatialReference
+        self.__dict__["latencies"] = dict(default_latencies)
+        self.latencies.update(latencies or {})
+        self.__dict__["maxareas"] = maxareas or {}
+        self.__dict__["maxareaTable"] = maxareaTable
+        self.__dict__["timeScale"] = timeScale
+        self.__dict__["sizeScale"] = sizeScale
+        self.__dict__["reprojectFactor"] = reprojectFactor
+        self.__dict__["environment"] = {"scratchworkspace": None, "outputcoordinatesystem": None}
+        self.__dict__["featureLayers"] = {}
+        self.__dict__["memory"] = {}
+        self.__dict__["aoiSubsets"] = {}
+        self.__dict__["selections"] = {}
+        self.__dict__["layerWheres"] = {}
+        self.__dict__["messages"] = []
+        self.__dict__["lastError"] = ""
+        self.__dict__["calls"] = {}
+        self.__dict__["lock"] = threading.Lock()
+
+    # -- case-insensitive methods and environment, like the real geoprocessor
+    def __getattr__(self, name):
+        lower = name.lower()
+        method = "_gp_" + lower
+        if hasattr(type(self), method):
+            return getattr(self, method)
+        if lower in self.environment:
+            return self.environment[lower]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self.environment[name.lower()] = value
+
+    def _wait(self, call):
+        self.lock.acquire()
+        self.calls[call] = self.calls.get(call, 0) + 1
+        self.lock.release()
+        time.sleep(self.latencies.get(call, 0.0) * self.timeScale)
+
+    # -- messages
+    def _gp_addmessage(self, msg):
+        self.messages.append((0, msg))
+
+    def _gp_addwarning(self, msg):
+        self.messages.append((1, msg))
+
+    def _gp_adderror(self, msg):
+        self.messages.append((2, msg))
+
+    def _gp_addidmessage(self, severity, id, *args):
+        self.messages.append((0, self._gp_getidmessage(id).replace("%1", str(args[0] if args else ""))))
+
+    def _gp_getidmessage(self, id):
+        return id_messages.get(id, "message %s %%1" % id)
+
+    def _gp_getmessages(self, severity=0):
+        if severity == 2:
+            return self.lastError
+        return "\n".join([msg for sev, msg in self.messages if sev >= severity])
+
+    # -- licenses, parameters and install
+    def _gp_checkextension(self, name):
+        return "Available"
+
+    def _gp_checkoutextension(self, name):
+        self._wait("checkoutextension")
+        return "CheckedOut"
+
+    def _gp_getinstallinfo(self):
+        return {"InstallDir": os.path.join(os.sep, "opt", "fakearcgis")}
+
+    def _gp_getsystemenvironment(self, name):
+        return os.environ.get(name, "/tmp")
+
+    def _gp_listspatialreferences(self, wildcard):
+        self._wait("listspatialreferences")
+        return []
+
+    # -- describe, exists, cursors
+    def _gp_describe(self, obj):
+        self._wait("describe")
+        if obj in self.memory:
+            return FakeDescribe(DataType="FeatureClass", shapetype="Polygon", shapefieldname="Shape",
+                                extent=FakeExtent(*self._aoiExtent()),
+                                spatialreference=FakeSpatialReference(self.aoiSpatialReference, 32145))
+        if obj in self.featureLayers or obj in self.aoiSubsets:
+            polygons = self._aoiPolygonsFor(obj)
+            xs = [x for rings in polygons for ring in rings for x, y in ring]
+            ys = [y for rings in polygons for ring in rings for x, y in ring]
+            extent = "%r %r %r %r" % (min(xs), min(ys), max(xs), max(ys))
+            return FakeDescribe(DataType="FeatureLayer", shapefieldname="Shape", OIDFieldName="OBJECTID",
+                                featureClass=FakeDescribe(extent=extent),
+                                spatialreference=FakeSpatialReference(self.aoiSpatialReference))
+        if obj in self.layers:
+            layer = self.layers[obj]
+            if layer.get("broken"):
+                self.__dict__["lastError"] = "ERROR 000732: Input Dataset: Dataset %s does not exist or is not supported" % obj
+                raise RuntimeError(self.lastError)
+            return FakeDescribe(DataType=layer["dataType"], extent=FakeExtent(*layer["extent"]), catalogPath=obj,
+                                OIDFieldName="OBJECTID", shapefieldname="Shape", whereClause="",
+                                spatialreference=FakeSpatialReference(layer.get("sr", self.aoiSpatialReference)),
+                                editorTrackingEnabled="editedAt" in layer, editedAtFieldName="last_edited_date")
+        if obj is not None and os.path.isdir(str(obj)):
+            return FakeDescribe(DataType="Folder", workspacefactoryprogid="")
+        raise IOError("fake geoprocessor can't describe %s" % obj)
+
+    def _gp_exists(self, path):
+        self._wait("exists")
+        return (path in self.layers or path in self.featureLayers or path in self.memory or path in self.aoiSubsets or
+                path == self.maxareaTable or os.path.exists(str(path)))
+
+    def _gp_getcount_management(self, table):
+        self._wait("getcount_management")
+        if table in self.memory:
+            return FakeResult(self.memory[table])
+        if table in self.selections:
+            return FakeResult(self.selections[table])
+        layer = self._layerFor(table)
+        return FakeResult(layer.get("featureCount", layer.get("outputBytes", 1024 * 1024) // 1024))
+
+    def _gp_listfields(self, table):
+        return [FakeField("OBJECTID", "OID"), FakeField("Shape", "Geometry"),
+                FakeField("NAME", "String"), FakeField("VALUE", "Double")]
+
+    def _aoiPolygonsFor(self, features):
+        # the aoi features behind a feature layer or a selection/dissolve of them
+        features = self.featureLayers.get(features, features)
+        return self.aoiSubsets.get(features, self.aoiPolygons)
+
+    def _aoiExtent(self):
+        xs = [x for rings in self.aoiPolygons for ring in rings for x, y in ring]
+        ys = [y for rings in self.aoiPolygons for ring in rings for x, y in ring]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def _memoryRows(self, count):
+        # small clockwise squares on a grid over the aoi extent
+        xmin, ymin, xmax, ymax = self._aoiExtent()
+        columns = int(count ** 0.5) + 1
+        size = (xmax - xmin) / columns
+        for i in range(count):
+            x = xmin + (i % columns) * size
+            y = ymin + (i // columns) * size
+            ring = [(x, y), (x, y + size / 2), (x + size / 2, y + size / 2), (x + size / 2, y), (x, y)]
+            yield FakeRow({"objectid": i + 1, "shape": FakePolygon([ring]), "name": "feature %d" % i, "value": i * 0.5})
+
+    def _gp_searchcursor(self, table, where=None, spatialReference=None, fields=None, sortFields=None):
+        self._wait("searchcursor")
+        if sortFields and table in self.layers and "editedAt" in self.layers[table]:
+            # the latest edit of a layer with editor tracking
+            return iter([FakeRow({"last_edited_date": self.layers[table]["editedAt"]})])
+        if table in self.memory:
+            return self._memoryRows(self.memory[table])
+        if table in self.featureLayers or table in self.aoiSubsets:
+            return iter([FakeRow({"objectid": i + 1, "name": "aoi %d" % (i + 1), "shape": FakePolygon(rings)})
+                         for i, rings in enumerate(self._aoiPolygonsFor(table))])
+        if table in self.layers and "featureCount" in self.layers[table]:
+            return self._featureRows(self.layers[table])
+        if table == self.maxareaTable:
+            rows = [FakeRow({"layername": name, "maxarea": maxarea}) for name, maxarea in self.maxareas.items()]
+            if where:
+                match = re.search(r"=\s*'([^']*)'", where)
+                if match:
+                    rows = [row for row in rows if row.layername == match.group(1)]
+            return iter(rows)
+        raise IOError("fake geoprocessor has no table %s" % table)
+
+    def _featureRows(self, layer):
+        # the layer's features on a grid over its extent, in object id order
+        xmin, ymin, xmax, ymax = layer["extent"]
+        count = layer["featureCount"]
+        columns = max(1, int(math.ceil(math.sqrt(count * (xmax - xmin) / max(ymax - ymin, 1e-9)))))
+        width = (xmax - xmin) / columns
+        height = (ymax - ymin) / max(1, int(math.ceil(count / float(columns))))
+        aspect = layer.get("featureAspect", 1.0)
+        for i in range(count):
+            x = xmin + (i % columns) * width
+            y = ymin + (i // columns) * height
+            yield FakeRow({"objectid": i + 1, "shape": FakeShape(x, y, x + width * 0.9 * aspect, y + height * 0.9)})
+
+    def _whereCount(self, where):
+        # features an object id where clause of the extract tool selects
+        count = 0
+        for low, high in re.findall(r">= (\d+) AND \w+ <= (\d+)", where):
+            count += int(high) - int(low) + 1
+        for ids in re.findall(r"IN \(([\d,]+)\)", where):
+            count += len(ids.split(","))
+        return count
+
+    # -- workspaces
+    def _gp_createuniquename(self, name, workspace):
+        self._wait("createuniquename")
+        base, ext = os.path.splitext(name)
+        candidate = name
+        n = 0
+        while self._taken(workspace, candidate):
+            candidate = "%s%d%s" % (base, n, ext)
+            n += 1
+        return os.path.join(workspace, candidate)
+
+    def _taken(self, workspace, name):
+        if workspace == "in_memory":
+            return os.path.join(workspace, name) in self.memory
+        # in a folder "roads" is taken by roads.shp as well
+        if os.path.exists(os.path.join(workspace, name)):
+            return True
+        if os.path.isdir(workspace):
+            for file in os.listdir(workspace):
+                if file.startswith(name + "."):
+                    return True
+        return False
+
+    def _gp_validatetablename(self, name, workspace=None):
+        return re.sub(r"[^A-Za-z0-9_.]", "_", name)
+
+    def _gp_createfolder_management(self, workspace, name):
+        self._wait("createfolder_management")
+        os.mkdir(os.path.join(workspace, name))
+
+    def _gp_createfilegdb_management(self, folder, name):
+        self._wait("createfilegdb_management")
+        os.mkdir(os.path.join(folder, name + ".gdb"))
+
+    def _gp_createpersonalgdb_management(self, folder, name):
+        self._wait("createpersonalgdb_management")
+        os.mkdir(os.path.join(folder, name + ".mdb"))
+
+    def _gp_makefeaturelayer_management(self, features, name, where=None):
+        self._wait("makefeaturelayer_management")
+        self.featureLayers[name] = features
+        self.layerWheres[name] = where
+
+    def _gp_copyfeatures_management(self, features, output):
+        self._wait("copyfeatures_management")
+        self._writeOutput(output, 1024, True)
+
+    def _gp_select_analysis(self, features, output, where):
+        self._wait("select_analysis")
+        oid = int(re.search(r"=\s*(\d+)", where).group(1))
+        self.aoiSubsets[output] = [self._aoiPolygonsFor(features)[oid - 1]]
+
+    def _gp_selectlayerbylocation_management(self, layer, relationship, features):
+        # as many features as an in_memory clip of the layer gets
+        self._wait("selectlayerbylocation_management")
+        source = self._layerFor(self.featureLayers[layer])
+        count = source.get("featureCount", source.get("outputBytes", 1024 * 1024) // 1024)
+        self.selections[layer] = max(1, int(count * self.sizeScale))
+
+    def _gp_dissolve_management(self, features, output):
+        self._wait("dissolve_management")
+        self.aoiSubsets[output] = [[ring for rings in self._aoiPolygonsFor(features) for ring in rings]]
+
+    def _gp_delete_management(self, dataset):
+        self._wait("delete_management")
+        if dataset in self.memory:
+            del self.memory[dataset]
+        elif dataset in self.featureLayers:
+            del self.featureLayers[dataset]
+            self.selections.pop(dataset, None)
+            self.layerWheres.pop(dataset, None)
+        elif os.path.isdir(dataset):
+            shutil.rmtree(dataset)
+        elif os.path.splitext(dataset)[1].lower() == ".shp":
+            # a shapefile goes with its sidecar files
+            base = os.path.splitext(dataset)[0]
+            for ext in [".shp", ".dbf", ".shx", ".prj", ".shp.xml"]:
+                if os.path.exists(base + ext):
+                    os.remove(base + ext)
+        elif os.path.exists(dataset):
+            os.remove(dataset)
+
+    def _gp_copy_management(self, source, output):
+        self._wait("copy_management")
+        if os.path.isdir(source):
+            shutil.copytree(source, output)
+        else:
+            shutil.copy2(source, output)
+
+    # -- clips and conversions
+    def _layerFor(self, lyr):
+        if lyr not in self.layers:
+            self.__dict__["lastError"] = "ERROR 000732: Input Features: Dataset %s does not exist\nFailed to execute (Clip)." % lyr
+            raise RuntimeError(self.lastError)
+        return self.layers[lyr]
+
+    def _transientFailure(self, layer):
+        # what a dropped sde connection looks like
+        if layer.get("failures", 0) > 0:
+            layer["failures"] -= 1
+            self.__dict__["lastError"] = "ERROR 999999: Error executing function.\nUnderlying DBMS error [Network I/O error]\nFailed to execute (Clip)."
+            raise RuntimeError(self.lastError)
+
+    def _partialFailure(self, layer):
+        # the connection dropped after the output was written
+        if layer.get("partialFailures", 0) > 0:
+            layer["partialFailures"] -= 1
+            self.__dict__["lastError"] = "ERROR 999999: Error executing function.\nUnderlying DBMS error [Network I/O error]\nFailed to execute (Clip)."
+            raise RuntimeError(self.lastError)
+
+    def _hang(self, layer):
+        # a clip that never comes back, after its output is written
+        if layer.get("hangSeconds"):
+            time.sleep(layer["hangSeconds"])
+
+    def _reprojects(self, layer):
+        # True when the output coordinate system isn't the one the layer is in
+        outputCoordinateSystem = self.environment["outputcoordinatesystem"]
+        own = FakeSpatialReference(layer.get("sr", self.aoiSpatialReference)).exportToString()
+        return outputCoordinateSystem not in [None, "", own, layer.get("projectedTo")]
+
+    def _gp_clip_analysis(self, lyr, aoi, output):
+        self._wait("clip_analysis")
+        where = self.layerWheres.get(lyr)
+        layer = self._layerFor(self.featureLayers.get(lyr, lyr))
+        self._transientFailure(layer)
+        if self._reprojects(layer):
+            time.sleep(self.latencies["clip_analysis"] * self.timeScale * (self.reprojectFactor - 1))
+        count = layer.get("featureCount", layer.get("outputBytes", 1024 * 1024) // 1024)
+        if where:
+            count = self._whereCount(where)
+        if "featureCount" in layer:
+            # every feature of the input is clipped
+            time.sleep(self.latencies["clip_analysis_feature"] * self.timeScale * count)
+        if str(output).startswith("in_memory"):
+            self.memory[output] = max(1, int(count * self.sizeScale))
+            return
+        self._writeOutput(output, layer.get("outputBytes", 1024 * 1024), layer.get("compressible", True))
+        self._partialFailure(layer)
+        self._hang(layer)
+        # the clip can be clipped again
+        self.layers[output] = dict(layer, dataType="FeatureLayer", projectedTo=self.environment["outputcoordinatesystem"])
+
+    def _gp_append_management(self, inputs, target, schemaType):
+        self._wait("append_management")
+        where = self.layerWheres.get(inputs)
+        layer = self._layerFor(self.featureLayers.get(inputs, inputs))
+        count = layer.get("featureCount", 0)
+        if where:
+            count = self._whereCount(where)
+        time.sleep(self.latencies["append_feature"] * self.timeScale * count)
+        if target in self.memory:
+            self.memory[target] += max(1, int(count * self.sizeScale))
+
+    def _gp_clip_management(self, lyr, extent, output, *args):
+        layer = self._layerFor(lyr)
+        self._transientFailure(layer)
+        # clip time and size follow the share of the layer the extent covers
+        xmin, ymin, xmax, ymax = [float(v) for v in str(extent).split()[:4]]
+        lxmin, lymin, lxmax, lymax = layer["extent"]
+        share = max(0.0, min(1.0, ((xmax - xmin) * (ymax - ymin)) / max((lxmax - lxmin) * (lymax - lymin), 1e-9)))
+        self.lock.acquire()
+        self.calls["clip_management"] = self.calls.get("clip_management", 0) + 1
+        self.lock.release()
+        seconds = self.latencies["clip_management"] * self.timeScale * max(share * 10, 0.1)
+        if self._reprojects(layer):
+            seconds *= self.reprojectFactor
+        time.sleep(seconds)
+        self._writeOutput(output, int(layer.get("outputBytes", 1024 * 1024) * max(share * 10, 0.1)),
+                          layer.get("compressible", False))
+        self._partialFailure(layer)
+        self._hang(layer)
+        self.layers[output] = dict(layer, dataType="RasterLayer", extent=(xmin, ymin, xmax, ymax),
+                                   projectedTo=self.environment["outputcoordinatesystem"])
+
+    def _gp_project_management(self, source, output, coordinateSystem):
+        self._project("project_management", source, output, coordinateSystem)
+
+    def _gp_projectraster_management(self, source, output, coordinateSystem, *args):
+        self._project("projectraster_management", source, output, coordinateSystem)
+
+    def _project(self, call, source, output, coordinateSystem):
+        # the whole layer, about ten clips worth of output
+        self._wait(call)
+        layer = self._layerFor(source)
+        self._writeOutput(output, layer.get("outputBytes", 1024 * 1024) * 10, layer.get("compressible", True))
+        self.layers[output] = dict(layer, projectedTo=coordinateSystem)
+
+    def _gp_quickexport_interop(self, source, formatString):
+        self._wait("quickexport_interop")
+        output = formatString.split(",", 1)[1]
+        self._writeOutput(output, os.path.getsize(source) if os.path.isfile(source) else 1024, True)
+
+    def _gp_exportcad_conversion(self, source, format, output):
+        self._wait("exportcad_conversion")
+        self._writeOutput(output, os.path.getsize(source) if os.path.isfile(source) else 1024, True)
+
+    def _gp_getrasterproperties_management(self, lyr, property):
+        self._wait("getrasterproperties_management")
+        layer = self._layerFor(lyr)
+        values = {"CELLSIZEX": layer.get("cellSize", 1.0), "CELLSIZEY": layer.get("cellSize", 1.0),
+                  "BANDCOUNT": layer.get("bands", 1), "VALUETYPE": layer.get("valueType", "3")}
+        return FakeResult(values[property.upper()])
+
+    def _gp_mosaictonewraster_management(self, inputs, workspace, name, *args):
+        self._wait("mosaictonewraster_management")
+        size = sum([os.path.getsize(f) for f in inputs.split(";") if os.path.isfile(f)])
+        self._writeOutput(os.path.join(workspace, name), size, False)
+
+    def _writeOutput(self, output, size, compressible):
+        # a synthetic dataset: a shapefile gets its sidecar files, a GRID is a folder
+        size = int(size * self.sizeScale)
+        base, ext = os.path.splitext(output)
+        if ext.lower() == ".shp":
+            files = [(output, size), (base + ".dbf", size // 2), (base + ".shx", size // 10), (base + ".prj", 64)]
+        elif ext == "" and not os.path.splitext(os.path.dirname(output))[1].lower() in [".gdb", ".mdb"]:
+            os.mkdir(output)
+            files = [(os.path.join(output, "hdr.adf"), 64), (os.path.join(output, "w001001.adf"), size)]
+        else:
+            files = [(output, size)]
+        for path, length in files:
+            out = open(path, 'wb')
+            if compressible:
+                line = b"synthetic feature attribute data for benchmarking the extract tool\n"
+                out.write((line * (length // len(line) + 1))[:length])
+            else:
+                out.write(os.urandom(length))
+            out.close()
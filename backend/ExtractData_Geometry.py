@@ -0,0 +1,242 @@
+#**********************************************************************
+# Description:
+#   Geometry helpers for the extract tool: true polygon area and
+#   polygon/extent overlap tests, so the area limits and the "does the AOI
+#   touch this layer" check don't depend on the AOI bounding box.
+#
+#   Polygons are lists of rings, rings are lists of (x, y) tuples, the way
+#   they are read from an ArcGIS geometry by geometryRings.  numpy is used
+#   when it is installed (it ships with ArcGIS), otherwise the same tests run
+#   in plain python.
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#   10/18/2026  - VCGI - Classify feature extents as inside, outside or on the aoi boundary
+#**********************************************************************
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def geometryRings(geometry):
+    # rings of an ArcGIS polygon geometry. interior rings follow their
+    # exterior ring in the same part, separated by a None point
+    rings = []
+    for i in range(geometry.partCount):
+        ring = []
+        for pnt in geometry.getPart(i):
+            if pnt:
+                ring.append((pnt.X, pnt.Y))
+            elif ring:
+                rings.append(ring)
+                ring = []
+        if ring:
+            rings.append(ring)
+    return rings
+
+
+def ringSignedArea(ring):
+    # shoelace formula, positive for counter-clockwise rings
+    if len(ring) < 3:
+        return 0.0
+    if numpy is not None:
+        xy = numpy.asarray(ring, dtype=float)
+        x = xy[:, 0]
+        y = xy[:, 1]
+        return 0.5 * float(numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(y, numpy.roll(x, -1)))
+    area = 0.0
+    for i in range(len(ring)):
+        x1, y1 = ring[i]
+        x2, y2 = ring[(i + 1) % len(ring)]
+        area += x1 * y2 - x2 * y1
+    return 0.5 * area
+
+
+def polygonArea(rings):
+    # exterior rings are clockwise and holes counter-clockwise in ArcGIS,
+    # so the signed areas of the holes cancel out of their exterior ring
+    return abs(sum([ringSignedArea(ring) for ring in rings]))
+
+
+def ringsExtent(rings):
+    # (xmin, ymin, xmax, ymax) of a list of rings
+    xs = [x for ring in rings for x, y in ring]
+    ys = [y for ring in rings for x, y in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def extentsIntersect(a, b):
+    # a and b are (xmin, ymin, xmax, ymax), touching counts as intersecting
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def pointsInPolygon(points, rings):
+    # even-odd test of every point against all the rings of a polygon
+    if numpy is not None:
+        pts = numpy.asarray(points, dtype=float).reshape(-1, 2)
+        px = pts[:, 0][:, numpy.newaxis]
+        py = pts[:, 1][:, numpy.newaxis]
+        inside = numpy.zeros(len(pts), dtype=bool)
+        for ring in rings:
+            xy = numpy.asarray(ring, dtype=float)
+            x1 = xy[:, 0]
+            y1 = xy[:, 1]
+            x2 = numpy.roll(x1, -1)
+            y2 = numpy.roll(y1, -1)
+            straddles = (y1 > py) != (y2 > py)
+            dy = numpy.where(y2 == y1, 1.0, y2 - y1)
+            crossX = x1 + (py - y1) * (x2 - x1) / dy
+            crossings = numpy.logical_and(straddles, px < crossX).sum(axis=1)
+            inside ^= (crossings % 2 == 1)
+        return inside.tolist()
+
+    result = []
+    for px, py in points:
+        inside = False
+        for ring in rings:
+            for i in range(len(ring)):
+                x1, y1 = ring[i]
+                x2, y2 = ring[(i + 1) % len(ring)]
+                if (y1 > py) != (y2 > py) and px < x1 + (py - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+        result.append(inside)
+    return result
+
+
+def _segmentsCross(rings, edges):
+    # True if any ring segment intersects any of edges [((x1, y1), (x2, y2)), ...]
+    if numpy is not None:
+        a = numpy.concatenate([numpy.asarray(ring, dtype=float) for ring in rings])
+        b = numpy.concatenate([numpy.roll(numpy.asarray(ring, dtype=float), -1, axis=0) for ring in rings])
+        for (ex1, ey1), (ex2, ey2) in edges:
+            d1 = (ex2 - ex1) * (a[:, 1] - ey1) - (ey2 - ey1) * (a[:, 0] - ex1)
+            d2 = (ex2 - ex1) * (b[:, 1] - ey1) - (ey2 - ey1) * (b[:, 0] - ex1)
+            d3 = (b[:, 0] - a[:, 0]) * (ey1 - a[:, 1]) - (b[:, 1] - a[:, 1]) * (ex1 - a[:, 0])
+            d4 = (b[:, 0] - a[:, 0]) * (ey2 - a[:, 1]) - (b[:, 1] - a[:, 1]) * (ex2 - a[:, 0])
+            if numpy.any((d1 * d2 <= 0) & (d3 * d4 <= 0)):
+                return True
+        return False
+
+    for ring in rings:
+        for i in range(len(ring)):
+            ax, ay = ring[i]
+            bx, by = ring[(i + 1) % len(ring)]
+            for (ex1, ey1), (ex2, ey2) in edges:
+                d1 = (ex2 - ex1) * (ay - ey1) - (ey2 - ey1) * (ax - ex1)
+                d2 = (ex2 - ex1) * (by - ey1) - (ey2 - ey1) * (bx - ex1)
+                d3 = (bx - ax) * (ey1 - ay) - (by - ay) * (ex1 - ax)
+                d4 = (bx - ax) * (ey2 - ay) - (by - ay) * (ex2 - ax)
+                if d1 * d2 <= 0 and d3 * d4 <= 0:
+                    return True
+    return False
+
+
+def polygonIntersectsExtent(rings, extent):
+    # True if the polygon and the (xmin, ymin, xmax, ymax) rectangle share any area or boundary
+    if not rings or not extentsIntersect(ringsExtent(rings), extent):
+        return False
+    xmin, ymin, xmax, ymax = extent
+
+    # a vertex of the polygon is inside the rectangle
+    for ring in rings:
+        for x, y in ring:
+            if xmin <= x <= xmax and ymin <= y <= ymax:
+                return True
+
+    # the rectangle is inside the polygon
+    corners = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+    if True in pointsInPolygon(corners, rings):
+        return True
+
+    # an edge of the polygon crosses the rectangle
+    edges = [(corners[i], corners[(i + 1) % 4]) for i in range(4)]
+    return _segmentsCross(rings, edges)
+
+
+def polygonsIntersectExtent(polygons, extent):
+    # True if any of the polygons touches the extent
+    for rings in polygons:
+        if polygonIntersectsExtent(rings, extent):
+            return True
+    return False
+
+
+# what classifyExtents says about a feature extent and the aoi
+EXTENT_OUTSIDE = 0
+EXTENT_INSIDE = 1
+EXTENT_BOUNDARY = 2
+
+# extents tested against a ring at once, keeps the numpy arrays of the point in polygon test small
+classify_chunk_points = 1000000
+
+
+def _classifyAgainstPolygon(extents, rings):
+    # EXTENT_* of every (xmin, ymin, xmax, ymax) against one polygon. an extent no ring segment
+    # touches is all inside or all outside the polygon, which one of its corners tells.
+    # an extent a segment touches is boundary
+    segments = [(ring[i], ring[(i + 1) % len(ring)]) for ring in rings for i in range(len(ring))]
+    if numpy is not None:
+        ext = numpy.asarray(extents, dtype=float).reshape(-1, 4)
+        touched = numpy.zeros(len(ext), dtype=bool)
+        for (x1, y1), (x2, y2) in segments:
+            # the segment's extent overlaps the extent and the extent's corners aren't all on one side of it
+            overlaps = ((min(x1, x2) <= ext[:, 2]) & (max(x1, x2) >= ext[:, 0]) &
+                        (min(y1, y2) <= ext[:, 3]) & (max(y1, y2) >= ext[:, 1]))
+            near = numpy.nonzero(overlaps)[0]
+            if not len(near):
+                continue
+            e = ext[near]
+            sides = [(x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1) for cx, cy in
+                     [(e[:, 0], e[:, 1]), (e[:, 2], e[:, 1]), (e[:, 2], e[:, 3]), (e[:, 0], e[:, 3])]]
+            oneSide = ((sides[0] > 0) & (sides[1] > 0) & (sides[2] > 0) & (sides[3] > 0)) | \
+                      ((sides[0] < 0) & (sides[1] < 0) & (sides[2] < 0) & (sides[3] < 0))
+            touched[near[~oneSide]] = True
+        result = numpy.where(touched, EXTENT_BOUNDARY, EXTENT_OUTSIDE)
+        untouched = numpy.nonzero(~touched)[0]
+        size = max(1, classify_chunk_points // max(len(segments), 1))
+        for i in range(0, len(untouched), size):
+            chunk = untouched[i:i + size]
+            inside = numpy.asarray(pointsInPolygon(ext[chunk][:, 0:2], rings), dtype=bool)
+            result[chunk[inside]] = EXTENT_INSIDE
+        return result.tolist()
+
+    result = []
+    for xmin, ymin, xmax, ymax in extents:
+        corners = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+        touched = False
+        for (x1, y1), (x2, y2) in segments:
+            if min(x1, x2) > xmax or max(x1, x2) < xmin or min(y1, y2) > ymax or max(y1, y2) < ymin:
+                continue
+            sides = [(x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1) for cx, cy in corners]
+            if not (min(sides) > 0 or max(sides) < 0):
+                touched = True
+                break
+        if touched:
+            result.append(EXTENT_BOUNDARY)
+        elif pointsInPolygon(corners[:1], rings)[0]:
+            result.append(EXTENT_INSIDE)
+        else:
+            result.append(EXTENT_OUTSIDE)
+    return result
+
+
+def classifyExtents(extents, polygons):
+    # EXTENT_* of every feature extent (xmin, ymin, xmax, ymax) against the aoi polygons. a feature
+    # whose extent is inside is inside the aoi and one whose extent is outside is outside it, only
+    # the boundary ones have to be clipped
+    result = [EXTENT_OUTSIDE] * len(extents)
+    for rings in polygons:
+        if not rings:
+            continue
+        bounds = ringsExtent(rings)
+        # only the extents near the polygon are tested against its rings
+        near = [i for i in range(len(extents)) if result[i] != EXTENT_INSIDE and extentsIntersect(extents[i], bounds)]
+        if not near:
+            continue
+        for i, state in zip(near, _classifyAgainstPolygon([extents[i] for i in near], rings)):
+            # inside one of the polygons wins, a boundary of any of them needs the clip
+            if state == EXTENT_INSIDE or (state == EXTENT_BOUNDARY and result[i] == EXTENT_OUTSIDE):
+                result[i] = state
+    return result
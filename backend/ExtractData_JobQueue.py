@@ -0,0 +1,597 @@
+#**********************************************************************
+# Description:
+#   Local job queue in front of the extract tool.  Jobs are posted as JSON,
+#   given a cost estimate (aoi area, number of layers, raster vs feature),
+#   worked out here from the aoi features and the layer registry rather than
+#   taken from the client, and admitted by priority while the cost of the
+#   running jobs stays within
+#   a budget.  Small vector extracts have their own lane so they don't wait
+#   behind large raster extracts.  Each admitted job runs ExtractData_v1.py
+#   in its own process with the same parameters the GP service passes.
+#
+# Usage:
+##        python ExtractData_JobQueue.py [--port 8085] [--budget 100] [--slots 4]
+##               [--workers-address 127.0.0.1:8086] [--layer-registry path]
+#
+#   POST /jobs          {"layers": [...], "areaOfInterest": path to the aoi features,
+#                        "featureFormat": "...", "rasterFormat": "...",
+#                        "coordinateSystem": "...", "customCoordSystemFolder": "...",
+#                        "outputZipFile": path, "batchField": "",
+#                        "sinceManifest": previous zip, "priority": 0}
+#                       -> {"jobId": ...}
+#   GET  /jobs/<jobId>  -> the job, its status, wait and run time and, once it has
+#                          run, the status of every layer ("partial" when some failed)
+#   GET  /metrics       -> queue depth, running cost and wait time percentiles
+#   GET  /jobs/<jobId>/events
+#                       -> server-sent events (text/event-stream), one "progress" event
+#                          per layer queued, clipping, converting, zipped or done, the
+#                          last one with no layer and the status of the job
+#   GET  /jobs/<jobId>/layers/<name>.zip
+#                       -> a layer the job has finished, zipped on its own
+#
+#   With --workers-address the jobs run on the warm workers of
+#   ExtractData_Worker.py instead of a new ExtractData_v1.py process each.
+#   With --jobs-folder (the arcgisjobs folder of the GP service) the events
+#   and layers of jobs submitted to the GP service are served too, by their
+#   GP job id.
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#   10/18/2026  - VCGI - Report the status of every layer from the manifest in the zip
+#   10/18/2026  - VCGI - Run the jobs on the warm workers of ExtractData_Worker.py (--workers-address)
+#   10/18/2026  - VCGI - Push the per layer progress of jobs as server-sent events, serve finished layers
+#   10/18/2026  - VCGI - Estimate the cost from the aoi features and the layer registry, not the client's numbers
+#**********************************************************************
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+import ExtractData_Geometry
+from ExtractData_MetricsReport import percentile
+from ExtractData_Worker import runOnWorkers
+
+try:
+    import arcgisscripting
+except ImportError:
+    # off an ArcGIS install the geoprocessor has to be set with setGeoprocessor
+    arcgisscripting = None
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+# cost units per square kilometer of aoi for one layer
+raster_cost_per_sq_km = 1.0
+vector_cost_per_sq_km = 0.05
+# fixed cost of every layer (describe, lookups, zip)
+layer_cost = 0.5
+# total cost of the jobs allowed to run at once
+cost_budget = 100.0
+# the layer registry ExtractData_v1.py keeps, the data type of every layer it described
+layer_registry_file = os.path.join(tempfile.gettempdir(), "ExtractData_LayerRegistry.json")
+# jobs up to this cost that have no raster layers use the small job lane
+small_job_cost = 5.0
+# jobs that can run at once in the small job lane, outside the budget
+small_job_slots = 2
+# jobs that can run at once in the main lane
+job_slots = 4
+# every minute a job waits takes this much off its cost when it is ranked, so large jobs aren't starved
+aging_per_minute = 1.0
+# finished jobs are forgotten after this many seconds
+job_retention_seconds = 3600
+# (host, port) of ExtractData_Worker.py, None = start ExtractData_v1.py for every job
+workers_address = None
+# the manifest ExtractData_v1.py writes into every zip
+manifest_file_name = "_ExtractData_Manifest.json"
+# the progress events and the zips of the finished layers ExtractData_v1.py writes next to the output
+# zip, named after it (output.zip -> output_ExtractData_Progress.ndjson and output_ExtractData_Layers)
+progress_file_name = "_ExtractData_Progress.ndjson"
+layer_zips_folder_name = "_ExtractData_Layers"
+# arcgisjobs folder of the GP service, the events of its jobs are found under <jobs_folder>/<jobId>
+jobs_folder = None
+# seconds between reads of the progress file of a job being streamed
+event_poll_seconds = 0.5
+# seconds between keep alive comments on an event stream, so proxies don't close it
+event_keepalive_seconds = 15
+# seconds an event stream waits for a GP service job to start writing events
+event_wait_seconds = 600
+# bytes of a layer zip sent at a time
+download_chunk = 1024 * 1024
+
+extract_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ExtractData_v1.py")
+
+# created for the first job, reads the aoi of every job (see aoiArea)
+gp = None
+gpLock = threading.Lock()
+# the data types of layer_registry_file, read again when the file changes
+layerTypes = {"mtime": None, "types": {}}
+
+
+def setGeoprocessor(geoprocessor):
+    # ie. ExtractData_FakeGP.FakeGeoprocessor, to run the queue without ArcGIS
+    global gp
+    gp = geoprocessor
+    return gp
+
+
+def aoiArea(areaOfInterest):
+    # area of the aoi polygons in sq meters, read the way ExtractData_v1.py reads them.
+    # None when there is no geoprocessor or the aoi can't be read
+    global gp
+    gpLock.acquire()
+    try:
+        if gp is None:
+            if arcgisscripting is None:
+                return None
+            gp = arcgisscripting.create(10.1)
+        shapeField = gp.describe(areaOfInterest).shapefieldname
+        area = 0.0
+        cur = gp.searchcursor(areaOfInterest)
+        for row in cur:
+            area += ExtractData_Geometry.polygonArea(ExtractData_Geometry.geometryRings(row.getValue(shapeField)))
+        del cur
+        return area
+    except Exception:
+        return None
+    finally:
+        gpLock.release()
+
+
+def readLayerTypes():
+    # {layer: data type} of the layers ExtractData_v1.py has described
+    try:
+        mtime = os.path.getmtime(layer_registry_file)
+    except OSError:
+        return {}
+    if mtime != layerTypes["mtime"]:
+        try:
+            registryFile = open(layer_registry_file, 'r')
+            try:
+                stored = json.load(registryFile)
+            finally:
+                registryFile.close()
+        except (IOError, ValueError):
+            return layerTypes["types"]
+        layerTypes["types"] = dict([(layer, entry.get("dataType", "").lower()) for layer, entry in stored.get("layers", {}).items()])
+        layerTypes["mtime"] = mtime
+    return layerTypes["types"]
+
+
+def estimateJobCost(job):
+    # (cost, raster layers) of a job from its aoi area, number of layers and raster vs feature layers.
+    # a layer the registry doesn't know yet is counted as a raster, and a job whose aoi can't be
+    # read costs the whole budget
+    types = readLayerTypes()
+    rasterLayers = [layer for layer in job["layers"] if types.get(layer) not in ["featurelayer"]]
+    area = aoiArea(job["areaOfInterest"])
+    if area is None:
+        return max(cost_budget, layer_cost * len(job["layers"])), rasterLayers
+    areaSqKm = area / 1000000.0
+    cost = 0.0
+    for layer in job["layers"]:
+        cost += layer_cost
+        if layer in rasterLayers:
+            cost += areaSqKm * raster_cost_per_sq_km
+        else:
+            cost += areaSqKm * vector_cost_per_sq_km
+    return cost, rasterLayers
+
+
+def extractCommand(job):
+    # run the extract tool standalone, the geoprocessor reads the parameters from the command line
+    return [sys.executable, extract_script,
+            ";".join(job["layers"]),
+            job["areaOfInterest"],
+            job.get("featureFormat", ""),
+            job.get("rasterFormat", ""),
+            job.get("coordinateSystem", ""),
+            job.get("customCoordSystemFolder", ""),
+            job["outputZipFile"],
+            job.get("batchField", ""),
+            job.get("sinceManifest", "")]
+
+
+def readLayerStatus(outputZipFile):
+    # the per layer status table of a finished job, from the manifest in its zip
+    if not os.path.exists(outputZipFile) or not zipfile.is_zipfile(outputZipFile):
+        return None
+    zip = zipfile.ZipFile(outputZipFile, 'r')
+    try:
+        for name in zip.namelist():
+            if name.split("/")[-1] == manifest_file_name:
+                return json.loads(zip.read(name).decode("utf-8")).get("layerStatus")
+    finally:
+        zip.close()
+    return None
+
+
+def readEvents(progressFile, position):
+    # the complete lines added to progressFile since position, and the position after them
+    if not os.path.exists(progressFile):
+        return [], position
+    events = open(progressFile, 'rb')
+    try:
+        events.seek(position)
+        data = events.read()
+    finally:
+        events.close()
+    end = data.rfind(b"\n") + 1
+    lines = [line.decode("utf-8") for line in data[:end].split(b"\n") if line.strip()]
+    return lines, position + end
+
+
+def progressFilePath(outZipFile):
+    # the progress file of the job writing outZipFile, the same as progressPaths of ExtractData_v1.py
+    folder, zipName = os.path.split(os.path.abspath(outZipFile))
+    return os.path.join(folder, os.path.splitext(zipName)[0] + progress_file_name)
+
+
+def layerZipsFolder(progressFile):
+    # the folder of the finished layers' zips, named after the zip like progressFile
+    return progressFile[:-len(progress_file_name)] + layer_zips_folder_name
+
+
+def findJobProgressFile(jobId):
+    # the progress file of a GP service job, None until it has started
+    if jobs_folder is None or not re.match(r"^[\w-]+$", jobId):
+        return None
+    for dirpath, dirnames, filenames in os.walk(os.path.join(jobs_folder, jobId)):
+        for filename in filenames:
+            if filename.endswith(progress_file_name):
+                return os.path.join(dirpath, filename)
+    return None
+
+
+class JobQueue(object):
+    # Priority queue with cost based admission control.  Jobs are ranked by
+    # (priority, cost less aging, submit order); the main lane admits the best
+    # ranked job while running cost + job cost <= cost_budget (a job larger than
+    # the whole budget still runs once nothing else is running), and the small
+    # job lane runs cheap vector jobs next to whatever the main lane is doing.
+    def __init__(self, runJob=None):
+        self.lock = threading.Condition()
+        self.jobs = {}
+        self.waiting = []
+        self.running = {"main": [], "small": []}
+        self.runningCost = 0.0
+        self.waits = []
+        self.runJob = runJob or self._runExtract
+        self.stopped = False
+        self.dispatcher = threading.Thread(target=self._dispatch)
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def submit(self, job):
+        job = dict(job)
+        job["jobId"] = uuid.uuid4().hex
+        # what the client says about its aoi and layers isn't trusted
+        job.pop("aoiArea", None)
+        job["cost"], job["rasterLayers"] = estimateJobCost(job)
+        job["small"] = job["cost"] <= small_job_cost and not job["rasterLayers"]
+        job["status"] = "queued"
+        job["submitted"] = time.time()
+        self.lock.acquire()
+        try:
+            self.jobs[job["jobId"]] = job
+            self.waiting.append(job)
+            self.lock.notify_all()
+        finally:
+            self.lock.release()
+        return job["jobId"]
+
+    def status(self, jobId):
+        self.lock.acquire()
+        try:
+            job = self.jobs.get(jobId)
+            if job is None:
+                return None
+            result = dict(job)
+            result["position"] = None
+            if job["status"] == "queued":
+                ranked = sorted(self.waiting, key=self._rank)
+                result["position"] = ranked.index(job) + 1
+            return result
+        finally:
+            self.lock.release()
+
+    def jobProgressFile(self, jobId):
+        # where the job writes its progress, None for a job the queue doesn't know
+        self.lock.acquire()
+        try:
+            job = self.jobs.get(jobId)
+            if job is None:
+                return None
+            return progressFilePath(job["outputZipFile"])
+        finally:
+            self.lock.release()
+
+    def metrics(self):
+        self.lock.acquire()
+        try:
+            now = time.time()
+            return {"depth": len(self.waiting),
+                    "smallJobsWaiting": len([j for j in self.waiting if j["small"]]),
+                    "running": len(self.running["main"]) + len(self.running["small"]),
+                    "runningSmall": len(self.running["small"]),
+                    "runningCost": self.runningCost,
+                    "costBudget": cost_budget,
+                    "oldestWaitSeconds": max([now - j["submitted"] for j in self.waiting] or [0]),
+                    "waitSecondsP50": percentile(self.waits, 50),
+                    "waitSecondsP95": percentile(self.waits, 95),
+                    "admitted": len(self.waits)}
+        finally:
+            self.lock.release()
+
+    def stop(self):
+        self.lock.acquire()
+        self.stopped = True
+        self.lock.notify_all()
+        self.lock.release()
+
+    def _rank(self, job):
+        waitedMinutes = (time.time() - job["submitted"]) / 60.0
+        return (-job.get("priority", 0), job["cost"] - waitedMinutes * aging_per_minute, job["submitted"])
+
+    def _admit(self):
+        # pick the next job to start and its lane, or None. called with the lock held
+        ranked = sorted(self.waiting, key=self._rank)
+        for job in ranked:
+            if job["small"] and len(self.running["small"]) < small_job_slots:
+                return job, "small"
+            if len(self.running["main"]) >= job_slots:
+                continue
+            if self.runningCost + job["cost"] <= cost_budget or not (self.running["main"] or self.running["small"]):
+                return job, "main"
+            # the best ranked job doesn't fit yet, don't let cheaper main lane jobs overtake it forever
+            if not job["small"]:
+                break
+        return None
+
+    def _dispatch(self):
+        self.lock.acquire()
+        try:
+            while not self.stopped:
+                admitted = self._admit()
+                if admitted is None:
+                    self.lock.wait(5)
+                    self._forgetOldJobs()
+                    continue
+                job, lane = admitted
+                self.waiting.remove(job)
+                self.running[lane].append(job)
+                if lane == "main":
+                    self.runningCost += job["cost"]
+                job["status"] = "running"
+                job["lane"] = lane
+                job["started"] = time.time()
+                job["waitSeconds"] = job["started"] - job["submitted"]
+                self.waits.append(job["waitSeconds"])
+                self.waits = self.waits[-1000:]
+                worker = threading.Thread(target=self._run, args=(job, lane))
+                worker.daemon = True
+                worker.start()
+        finally:
+            self.lock.release()
+
+    def _run(self, job, lane):
+        try:
+            returncode = self.runJob(job)
+            status = returncode == 0 and "succeeded" or "failed"
+        except Exception as e:
+            job["error"] = str(e)
+            status = "failed"
+        try:
+            layerStatus = readLayerStatus(job["outputZipFile"])
+        except Exception:
+            layerStatus = None
+        if layerStatus is not None:
+            job["layerStatus"] = layerStatus
+            job["failedLayers"] = [row["layer"] for row in layerStatus if row["status"] in ["failed", "timed out"]]
+            # the layers that worked are in the zip, only the failed ones need to be asked for again
+            if status == "succeeded" and job["failedLayers"]:
+                status = "partial"
+        self.lock.acquire()
+        try:
+            job["status"] = status
+            job["finished"] = time.time()
+            job["runSeconds"] = job["finished"] - job["started"]
+            self.running[lane].remove(job)
+            if lane == "main":
+                self.runningCost -= job["cost"]
+            self.lock.notify_all()
+        finally:
+            self.lock.release()
+
+    def _forgetOldJobs(self):
+        now = time.time()
+        for jobId, job in list(self.jobs.items()):
+            if job.get("finished") and now - job["finished"] > job_retention_seconds:
+                del self.jobs[jobId]
+
+    def _runExtract(self, job):
+        if workers_address is None:
+            return subprocess.call(extractCommand(job))
+        result = runOnWorkers(job, workers_address)
+        job["worker"] = result.get("worker")
+        if result["status"] != "succeeded":
+            job["error"] = result.get("error")
+            return 1
+        return 0
+
+
+class QueueRequestHandler(BaseHTTPRequestHandler):
+    queue = None
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._reply(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length).decode("utf-8"))
+            for key in ["layers", "areaOfInterest", "outputZipFile"]:
+                if key not in job:
+                    return self._reply(400, {"error": "missing " + key})
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+        self._reply(202, {"jobId": self.queue.submit(job)})
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics":
+            return self._reply(200, self.queue.metrics())
+        if self.path.startswith("/jobs/"):
+            parts = self.path[len("/jobs/"):].split("?")[0].split("/")
+            if len(parts) == 2 and parts[1] == "events":
+                return self._streamEvents(parts[0])
+            if len(parts) == 3 and parts[1] == "layers":
+                return self._sendLayer(parts[0], parts[2])
+            job = self.queue.status(parts[0])
+            if job is not None:
+                return self._reply(200, job)
+        self._reply(404, {"error": "not found"})
+
+    def _event(self, body, eventId=None):
+        if eventId is not None:
+            self.wfile.write(("id: %d\n" % eventId).encode("utf-8"))
+        self.wfile.write(("event: progress\ndata: " + body + "\n\n").encode("utf-8"))
+
+    def _streamEvents(self, jobId):
+        # push the job's progress as it is written rather than having the browser poll for it
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        # don't let a proxy buffer the events
+        self.send_header("X-Accel-Buffering", "no")
+        self.end_headers()
+        # a reconnecting EventSource sends the id of the last event it got, the events are numbered by line
+        try:
+            skip = int(self.headers.get("Last-Event-ID") or 0)
+        except ValueError:
+            skip = 0
+        count = 0
+        position = 0
+        progressFile = None
+        queued = None
+        opened = lastWrite = time.time()
+        try:
+            while True:
+                job = self.queue.status(jobId)
+                if progressFile is None:
+                    progressFile = self.queue.jobProgressFile(jobId) or findJobProgressFile(jobId)
+                if job is None and progressFile is None:
+                    if jobs_folder is None or time.time() - opened > event_wait_seconds:
+                        self._event(json.dumps({"layer": None, "state": "unknown"}))
+                        return
+                if job is not None and job["status"] == "queued" and job["position"] != queued:
+                    # waiting in the queue, the extract hasn't written anything yet
+                    queued = job["position"]
+                    self._event(json.dumps({"layer": None, "state": "queued", "position": queued}))
+                    lastWrite = time.time()
+                lines = []
+                # a queued job's progress file may still hold the events of an earlier job of the same zip
+                if progressFile is not None and (job is None or job["status"] != "queued"):
+                    lines, position = readEvents(progressFile, position)
+                for line in lines:
+                    count += 1
+                    if count > skip:
+                        self._event(line, count)
+                        lastWrite = time.time()
+                    event = json.loads(line)
+                    if event.get("layer") is None and event.get("state") in ["succeeded", "failed"]:
+                        self.wfile.flush()
+                        return
+                if job is not None and job.get("finished") and not lines:
+                    # the extract ended without a last event (it crashed), the queue knows how it went
+                    self._event(json.dumps({"layer": None, "state": job["status"], "error": job.get("error")}))
+                    return
+                if time.time() - lastWrite > event_keepalive_seconds:
+                    self.wfile.write(b": keep alive\n\n")
+                    lastWrite = time.time()
+                self.wfile.flush()
+                time.sleep(event_poll_seconds)
+        except (IOError, OSError):
+            # the browser went away
+            pass
+
+    def _sendLayer(self, jobId, name):
+        progressFile = self.queue.jobProgressFile(jobId) or findJobProgressFile(jobId)
+        if progressFile is None:
+            return self._reply(404, {"error": "not found"})
+        layerFolder = layerZipsFolder(progressFile)
+        # only the finished zips of the job's own layer folder
+        if not name.endswith(".zip") or not os.path.isdir(layerFolder) or name not in os.listdir(layerFolder):
+            return self._reply(404, {"error": "not found"})
+        path = os.path.join(layerFolder, name)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", "attachment; filename=\"" + name + "\"")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        layerZip = open(path, 'rb')
+        try:
+            while True:
+                data = layerZip.read(download_chunk)
+                if not data:
+                    break
+                self.wfile.write(data)
+        except (IOError, OSError):
+            pass
+        finally:
+            layerZip.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Priority job queue with admission control for the extract tool")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--budget", type=float, default=cost_budget, help="cost of the jobs allowed to run at once")
+    parser.add_argument("--slots", type=int, default=job_slots, help="jobs running at once in the main lane")
+    parser.add_argument("--small-slots", type=int, default=small_job_slots, help="jobs running at once in the small job lane")
+    parser.add_argument("--workers-address", help="host:port of ExtractData_Worker.py to run the jobs on")
+    parser.add_argument("--jobs-folder", help="arcgisjobs folder of the GP service, to stream the progress of its jobs")
+    parser.add_argument("--layer-registry", default=layer_registry_file, help="layer registry file of ExtractData_v1.py")
+    args = parser.parse_args()
+
+    cost_budget = args.budget
+    job_slots = args.slots
+    small_job_slots = args.small_slots
+    if args.workers_address:
+        host, port = args.workers_address.rsplit(":", 1)
+        workers_address = (host, int(port))
+    jobs_folder = args.jobs_folder
+    layer_registry_file = args.layer_registry
+    QueueRequestHandler.queue = JobQueue()
+    server = ThreadingHTTPServer((args.host, args.port), QueueRequestHandler)
+    print("extract job queue listening on http://%s:%d" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        QueueRequestHandler.queue.stop()
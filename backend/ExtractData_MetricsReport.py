@@ -0,0 +1,129 @@
+#**********************************************************************
+# Description:
+#   Summarizes the job metrics written by ExtractData_v1.py: count, p50,
+#   p95 and total seconds per stage and per layer/stage, plus output bytes.
+#
+# Usage:
+##        python ExtractData_MetricsReport.py [--json] [--status succeeded] path [path ...]
+##        path = the ExtractData_Metrics.ndjson file, a _ExtractData_Metrics.json
+##               file or a folder that is searched for _ExtractData_Metrics.json files
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#**********************************************************************
+
+import argparse
+import json
+import os
+import sys
+
+
+def readRecords(paths):
+    # every job record in the given files/folders, one json object per line
+    records = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = []
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                for file in filenames:
+                    if file == "_ExtractData_Metrics.json":
+                        files.append(os.path.join(dirpath, file))
+        else:
+            files = [path]
+        for file in files:
+            metricsFile = open(file, 'r')
+            for line in metricsFile:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        sys.stderr.write("skipping bad record in %s\n" % file)
+            metricsFile.close()
+    return records
+
+
+def percentile(values, pct):
+    # linear interpolation between the closest ranks
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(records):
+    # {"stages": {stage: stats}, "layers": {(layer, stage): stats}, "jobs": stats}
+    byStage = {}
+    byLayer = {}
+    jobSeconds = []
+    for record in records:
+        jobSeconds.append(record["seconds"])
+        for timing in record.get("timings", []):
+            byStage.setdefault(timing["stage"], []).append(timing)
+            if timing.get("layer"):
+                byLayer.setdefault((timing["layer"], timing["stage"]), []).append(timing)
+
+    def stats(timings):
+        seconds = [t["seconds"] for t in timings]
+        sizes = [t["bytes"] for t in timings if "bytes" in t]
+        result = {"count": len(seconds),
+                  "p50": percentile(seconds, 50),
+                  "p95": percentile(seconds, 95),
+                  "total": sum(seconds)}
+        if sizes:
+            result["p50_bytes"] = percentile(sizes, 50)
+            result["total_bytes"] = sum(sizes)
+        return result
+
+    return {"jobs": {"count": len(jobSeconds),
+                     "p50": percentile(jobSeconds, 50),
+                     "p95": percentile(jobSeconds, 95),
+                     "total": sum(jobSeconds)},
+            "stages": dict([(stage, stats(t)) for stage, t in byStage.items()]),
+            "layers": dict([(key, stats(t)) for key, t in byLayer.items()])}
+
+
+def formatRow(name, stats):
+    row = "%-60s %7d %10.3f %10.3f %12.3f" % (name[:60], stats["count"], stats["p50"], stats["p95"], stats["total"])
+    if "total_bytes" in stats:
+        row += " %14d" % stats["total_bytes"]
+    return row
+
+
+def printReport(summary):
+    header = "%-60s %7s %10s %10s %12s %14s" % ("", "count", "p50 s", "p95 s", "total s", "bytes")
+    print("Jobs")
+    print(header)
+    if summary["jobs"]["count"]:
+        print(formatRow("all jobs", summary["jobs"]))
+    print("")
+    print("By stage")
+    print(header)
+    for stage in sorted(summary["stages"], key=lambda s: -summary["stages"][s]["total"]):
+        print(formatRow(stage, summary["stages"][stage]))
+    print("")
+    print("By layer and stage")
+    print(header)
+    for layer, stage in sorted(summary["layers"], key=lambda k: (k[0], -summary["layers"][k]["total"])):
+        print(formatRow(layer.split("\\")[-1] + " / " + stage, summary["layers"][(layer, stage)]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report p50/p95 timings of extract jobs per stage and per layer")
+    parser.add_argument("paths", nargs="+", help="metrics ndjson/json files or folders of job output")
+    parser.add_argument("--status", help="only include jobs with this status, ie. succeeded")
+    parser.add_argument("--json", action="store_true", help="print the summary as json")
+    args = parser.parse_args()
+
+    records = readRecords(args.paths)
+    if args.status:
+        records = [r for r in records if r.get("status") == args.status]
+    summary = summarize(records)
+    if args.json:
+        summary["layers"] = dict([(layer + " / " + stage, stats) for (layer, stage), stats in summary["layers"].items()])
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        printReport(summary)
@@ -0,0 +1,247 @@
+#**********************************************************************
+# Description:
+#   Builds and trims the store of pre-projected layer copies that
+#   ExtractData_v1.py clips from instead of reprojecting on the fly.
+#
+#   Every clip to another coordinate system is recorded in
+#   projection_stats_file.  The layer/coordinate system pairs requested at
+#   least --min-requests times in the last --window days are projected
+#   once, whole, into projected_store_folder, best estimated saving first.
+#   The saving of a pair is the clip time it costs over the window less
+#   what its clips take from a copy.  The store is then trimmed to
+#   projected_store_maxbytes by dropping the copies that save the least,
+#   and copies whose source changed are dropped (and projected again when
+#   they are still among the most requested).
+#
+#   Copies are projected from the layer's source dataset, so they are
+#   only clipped for layers that show the whole dataset (no definition
+#   query).  Copies of sde sources are checked against the row count and
+#   extent of the source.
+#   Run it off hours, ie. as a scheduled task on the GP server.
+#
+# Usage:
+##        python ExtractData_ProjectedStore.py [--min-requests 20] [--window 7]
+##               [--max-gb 50] [--dry-run]
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#   10/18/2026  - VCGI - Record the row count and extent of the source of a copy
+#**********************************************************************
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import ExtractData_v1
+
+# pairs requested fewer times than this within the window aren't projected
+min_requests = 20
+# days of requests that count
+window_days = 7
+# data types that are projected, mosaics are too large to copy
+projected_data_types = ["featurelayer", "rasterlayer"]
+
+
+def readProjectionStats(statsFile, since):
+    # {(source, coordinate system): {"layer", "dataType", "requests", "reprojected": [seconds], "projected": [seconds]}}
+    pairs = {}
+    if not os.path.exists(statsFile):
+        return pairs
+    stats = open(statsFile, 'r')
+    for line in stats:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            continue
+        if request["time"] < since:
+            continue
+        key = (request["source"], request["coordinateSystem"])
+        pair = pairs.setdefault(key, {"layer": request["layer"], "dataType": request["dataType"],
+                                      "requests": 0, "reprojected": [], "projected": []})
+        pair["requests"] += 1
+        if request["projected"]:
+            pair["projected"].append(request["seconds"])
+        else:
+            pair["reprojected"].append(request["seconds"])
+    stats.close()
+    return pairs
+
+
+def compactProjectionStats(statsFile, since):
+    # drop the requests older than the window, the jobs keep appending to the file
+    if not os.path.exists(statsFile):
+        return
+    stats = open(statsFile, 'r')
+    kept = []
+    for line in stats:
+        try:
+            if json.loads(line)["time"] >= since:
+                kept.append(line)
+        except ValueError:
+            pass
+    stats.close()
+    tmpFile = statsFile + "." + str(os.getpid())
+    compacted = open(tmpFile, 'w')
+    compacted.writelines(kept)
+    compacted.close()
+    if os.path.exists(statsFile):
+        os.remove(statsFile)
+    os.rename(tmpFile, statsFile)
+
+
+def meanSeconds(seconds):
+    if not seconds:
+        return None
+    return sum(seconds) / len(seconds)
+
+
+def estimatedSaving(pair, reprojectedSeconds=None):
+    # seconds the pair would have saved over the window when it is clipped from a copy.
+    # once every clip is from the copy the reprojected clip time recorded when the copy
+    # was made is used, without clips from a copy yet the whole clip time is the (upper bound) estimate
+    reprojected = meanSeconds(pair["reprojected"]) or reprojectedSeconds
+    if reprojected is None:
+        return 0.0
+    projected = meanSeconds(pair["projected"]) or 0.0
+    return max(reprojected - projected, 0.0) * pair["requests"]
+
+
+def listStoreEntries(storeFolder):
+    # [{"dir", "meta", "lastUsed"}, ...] of the complete entries of the store
+    entries = []
+    if not os.path.exists(storeFolder):
+        return entries
+    for key in os.listdir(storeFolder):
+        entryDir = os.path.join(storeFolder, key)
+        meta = ExtractData_v1.readCacheEntry(entryDir)
+        if meta is None:
+            continue
+        entries.append({"dir": entryDir,
+                        "meta": meta,
+                        "lastUsed": os.path.getmtime(os.path.join(entryDir, "meta.json"))})
+    return entries
+
+
+def projectLayer(storeFolder, source, coordinateSystem, pair):
+    # project the whole source into a gdb of its own entry, meta.json is written last
+    gp = ExtractData_v1.gp
+    entryDir = os.path.join(storeFolder, ExtractData_v1.getProjectedStoreKey(source, coordinateSystem))
+    if os.path.exists(entryDir):
+        shutil.rmtree(entryDir, True)
+    os.makedirs(entryDir)
+    try:
+        modified = ExtractData_v1.sourceModified(source)
+        fingerprint = ExtractData_v1.getDatasetFingerprint(source)
+        gp.CreateFileGDB_management(entryDir, "store")
+        workspace = os.path.join(entryDir, "store.gdb")
+        # named like the layer so the clips are named the same as when the layer is clipped
+        name = gp.validatetablename(os.path.basename(pair["layer"].replace("\\", os.sep)), workspace)
+        output = os.path.join(workspace, name)
+        if pair["dataType"].lower() == "rasterlayer":
+            gp.ProjectRaster_management(source, output, coordinateSystem)
+        else:
+            gp.Project_management(source, output, coordinateSystem)
+        meta = {"created": time.time(),
+                "source": source,
+                "sourceModified": modified,
+                "sourceFingerprint": fingerprint,
+                "coordinateSystem": coordinateSystem,
+                "layer": pair["layer"],
+                "reprojectedSeconds": meanSeconds(pair["reprojected"]),
+                "dataset": output[len(entryDir) + len(os.sep):],
+                "bytes": ExtractData_v1.folderSize(entryDir)}
+        metaFile = open(os.path.join(entryDir, "meta.json"), 'w')
+        json.dump(meta, metaFile)
+        metaFile.close()
+        return meta
+    except:
+        shutil.rmtree(entryDir, True)
+        raise
+
+
+def refreshStore(minRequests=None, windowDays=None, maxBytes=None, dryRun=False):
+    # project the hot pairs that aren't in the store yet and trim the store, returns what was done
+    if minRequests is None:
+        minRequests = min_requests
+    if windowDays is None:
+        windowDays = window_days
+    if maxBytes is None:
+        maxBytes = ExtractData_v1.projected_store_maxbytes
+    storeFolder = ExtractData_v1.projected_store_folder
+    statsFile = ExtractData_v1.projection_stats_file
+    since = time.time() - windowDays * 86400
+    pairs = readProjectionStats(statsFile, since)
+    done = {"projected": [], "stale": [], "evicted": [], "failed": []}
+
+    # what every copy in the store saves, stale copies are projected again if they are still worth it
+    entries = []
+    for entry in listStoreEntries(storeFolder):
+        meta = entry["meta"]
+        pair = pairs.get((meta["source"], meta["coordinateSystem"]))
+        entry["saving"] = pair and estimatedSaving(pair, meta.get("reprojectedSeconds")) or 0.0
+        if not ExtractData_v1.projectedCopyCurrent(meta):
+            if not dryRun:
+                shutil.rmtree(entry["dir"], True)
+            done["stale"].append((meta["layer"], meta["coordinateSystem"]))
+            continue
+        entries.append(entry)
+    stored = set([(e["meta"]["source"], e["meta"]["coordinateSystem"]) for e in entries])
+    total = sum([e["meta"]["bytes"] for e in entries])
+
+    candidates = [(estimatedSaving(pair), key) for key, pair in pairs.items()
+                  if key not in stored and pair["requests"] >= minRequests and
+                  pair["dataType"].lower() in projected_data_types]
+    candidates.sort(reverse=True)
+    for saving, (source, coordinateSystem) in candidates:
+        if saving <= 0:
+            break
+        # a full store only takes copies that save more than the ones it would drop
+        if total >= maxBytes and entries and saving <= min([e["saving"] for e in entries]):
+            break
+        pair = pairs[(source, coordinateSystem)]
+        if dryRun:
+            done["projected"].append((pair["layer"], coordinateSystem))
+            continue
+        try:
+            meta = projectLayer(storeFolder, source, coordinateSystem, pair)
+        except:
+            done["failed"].append((pair["layer"], coordinateSystem))
+            ExtractData_v1.gp.AddWarning("Unable to project " + source + " to " + coordinateSystem + ": " + str(sys.exc_info()[1]))
+            continue
+        entries.append({"dir": os.path.join(storeFolder, ExtractData_v1.getProjectedStoreKey(source, coordinateSystem)),
+                        "meta": meta, "lastUsed": time.time(), "saving": saving})
+        total += meta["bytes"]
+        done["projected"].append((pair["layer"], coordinateSystem))
+
+    # trim to maxBytes, least saving first and of those the least recently used
+    entries.sort(key=lambda e: (e["saving"], e["lastUsed"]))
+    for entry in entries:
+        if total <= maxBytes:
+            break
+        if not dryRun:
+            shutil.rmtree(entry["dir"], True)
+        total -= entry["meta"]["bytes"]
+        done["evicted"].append((entry["meta"]["layer"], entry["meta"]["coordinateSystem"]))
+
+    if not dryRun:
+        compactProjectionStats(statsFile, since)
+    return done
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-project the most requested layer/coordinate system pairs")
+    parser.add_argument("--min-requests", type=int, default=min_requests, help="requests within the window a pair needs")
+    parser.add_argument("--window", type=float, default=window_days, help="days of requests that count")
+    parser.add_argument("--max-gb", type=float, default=ExtractData_v1.projected_store_maxbytes / 1024.0 ** 3, help="size of the store")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be projected and evicted")
+    args = parser.parse_args()
+
+    if ExtractData_v1.gp is None or ExtractData_v1.projected_store_folder == "":
+        sys.exit("the projected store needs ArcGIS and projected_store_folder set in ExtractData_v1.py")
+    done = refreshStore(args.min_requests, args.window, int(args.max_gb * 1024 ** 3), args.dry_run)
+    for action in ["stale", "projected", "evicted", "failed"]:
+        for layer, coordinateSystem in done[action]:
+            print("%-9s %s -> %s" % (action, layer, coordinateSystem))
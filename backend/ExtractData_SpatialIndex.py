@@ -0,0 +1,190 @@
+#**********************************************************************
+# Description:
+#   Builds the grid indexes of feature extents that ExtractData_v1.py uses
+#   to copy the features inside an AOI and clip only the ones crossing its
+#   boundary, instead of clipping the whole layer.
+#
+#   The extent and object id of every feature of a layer's source are read
+#   once and written to spatial_index_folder, ordered by the grid cell of
+#   the feature's center.  Indexes are built for the layers named on the
+#   command line or for the --most-clipped feature layers of the job metrics,
+#   and built again once their source has changed (for sde sources, whose
+#   modification time can't be read, once their row count or extent has).
+#   Run it off hours, ie. as a scheduled task on the GP server.
+#
+# Usage:
+##        python ExtractData_SpatialIndex.py [layer ...] [--most-clipped 10]
+##               [--features-per-cell 16] [--rebuild]
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#   10/18/2026  - VCGI - Record the row count and extent of the source of an index
+#**********************************************************************
+
+import argparse
+import array
+import json
+import math
+import os
+import shutil
+import sys
+import time
+
+import ExtractData_v1
+
+# layers indexed by --most-clipped unless a number is given
+most_clipped = 10
+# features per grid cell on average, fewer cells keep the index small, more make a query read less
+features_per_cell = 16
+
+
+def mostClippedLayers(count, metricsFile=None):
+    # the feature layers clipped most often, from the job metrics
+    if metricsFile is None:
+        metricsFile = ExtractData_v1.metrics_ndjson_file
+    clips = {}
+    if not metricsFile or not os.path.exists(metricsFile):
+        return []
+    metrics = open(metricsFile, 'r')
+    for line in metrics:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        for timing in record.get("timings", []):
+            if timing["stage"] == "clip_analysis" and timing.get("layer"):
+                clips[timing["layer"]] = clips.get(timing["layer"], 0) + 1
+    metrics.close()
+    ranked = sorted(clips.items(), key=lambda item: -item[1])
+    return [layer for layer, clipCount in ranked[:count]]
+
+
+def buildIndex(source, featuresPerCell=None):
+    # read the extent of every feature of source and write its index, returns the index meta
+    if featuresPerCell is None:
+        featuresPerCell = features_per_cell
+    gp = ExtractData_v1.gp
+    modified = ExtractData_v1.sourceModified(source)
+    fingerprint = ExtractData_v1.getDatasetFingerprint(source)
+    started = time.time()
+    d = gp.describe(source)
+    oidField = d.OIDFieldName
+    shapeField = d.shapefieldname
+    features = []
+    cur = gp.searchcursor(source)
+    for row in cur:
+        shape = row.getValue(shapeField)
+        if shape is None:
+            continue
+        ext = shape.extent
+        features.append((int(row.getValue(oidField)), ext.XMin, ext.YMin, ext.XMax, ext.YMax))
+    del cur
+
+    # a square grid with about featuresPerCell features per cell over the extent of the features
+    if features:
+        xmin = min([f[1] for f in features])
+        ymin = min([f[2] for f in features])
+        width = max([f[3] for f in features]) - xmin
+        height = max([f[4] for f in features]) - ymin
+    else:
+        xmin = ymin = width = height = 0.0
+    cellCount = max(1, len(features) // featuresPerCell)
+    cellSize = max(math.sqrt(max(width * height, 1e-12) / cellCount), width / cellCount, height / cellCount, 1e-6)
+    columns = int(width // cellSize) + 1
+    rows = int(height // cellSize) + 1
+
+    def cellOf(feature):
+        column = min(columns - 1, int(((feature[1] + feature[3]) / 2.0 - xmin) // cellSize))
+        row = min(rows - 1, int(((feature[2] + feature[4]) / 2.0 - ymin) // cellSize))
+        return row * columns + column
+
+    features.sort(key=cellOf)
+    boxes = array.array('d')
+    cells = array.array('i', [0] * (columns * rows + 1))
+    for feature in features:
+        boxes.extend(feature)
+        cells[cellOf(feature) + 1] += 1
+    for i in range(1, len(cells)):
+        cells[i] += cells[i - 1]
+
+    # written aside and moved in place, meta.json last
+    entryDir = os.path.join(ExtractData_v1.spatial_index_folder, ExtractData_v1.getSpatialIndexKey(source))
+    buildDir = entryDir + ".building"
+    if os.path.exists(buildDir):
+        shutil.rmtree(buildDir, True)
+    os.makedirs(buildDir)
+    try:
+        indexFile = open(os.path.join(buildDir, "boxes.bin"), 'wb')
+        boxes.tofile(indexFile)
+        indexFile.close()
+        indexFile = open(os.path.join(buildDir, "cells.bin"), 'wb')
+        cells.tofile(indexFile)
+        indexFile.close()
+        meta = {"created": time.time(),
+                "source": source,
+                "sourceModified": modified,
+                "sourceFingerprint": fingerprint,
+                "srName": d.spatialreference.name,
+                "oidField": oidField,
+                "count": len(features),
+                "xmin": xmin,
+                "ymin": ymin,
+                "cellSize": cellSize,
+                "columns": columns,
+                "rows": rows,
+                "maxWidth": max([f[3] - f[1] for f in features] or [0.0]),
+                "maxHeight": max([f[4] - f[2] for f in features] or [0.0]),
+                "seconds": round(time.time() - started, 3)}
+        metaFile = open(os.path.join(buildDir, "meta.json"), 'w')
+        json.dump(meta, metaFile)
+        metaFile.close()
+        if os.path.exists(entryDir):
+            shutil.rmtree(entryDir, True)
+        os.rename(buildDir, entryDir)
+    except:
+        shutil.rmtree(buildDir, True)
+        raise
+    return meta
+
+
+def refreshIndexes(layers, rebuild=False, featuresPerCell=None):
+    # index the sources of layers that have no current index yet, returns what was done
+    done = {"indexed": [], "current": [], "skipped": [], "failed": []}
+    for lyr in layers:
+        try:
+            describe = ExtractData_v1.describeLayer(lyr)
+            source = describe.catalogPath
+            if describe.DataType.lower() != "featurelayer" or not source:
+                done["skipped"].append((lyr, None))
+                continue
+            if not rebuild and ExtractData_v1.loadSpatialIndex(source) is not None:
+                done["current"].append((lyr, None))
+                continue
+            meta = buildIndex(source, featuresPerCell)
+            done["indexed"].append((lyr, meta))
+        except:
+            done["failed"].append((lyr, None))
+            ExtractData_v1.gp.AddWarning("Unable to index " + lyr + ": " + str(sys.exc_info()[1]))
+    return done
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the spatial indexes the extract tool prefilters vector clips with")
+    parser.add_argument("layers", nargs="*", help="layers to index")
+    parser.add_argument("--most-clipped", type=int, default=None, help="also index the feature layers clipped most often")
+    parser.add_argument("--features-per-cell", type=int, default=features_per_cell)
+    parser.add_argument("--rebuild", action="store_true", help="build the indexes again even when they are current")
+    args = parser.parse_args()
+
+    if ExtractData_v1.gp is None or ExtractData_v1.spatial_index_folder == "":
+        sys.exit("the spatial index needs ArcGIS and spatial_index_folder set in ExtractData_v1.py")
+    layers = list(args.layers)
+    if args.most_clipped or not layers:
+        layers += [lyr for lyr in mostClippedLayers(args.most_clipped or most_clipped) if lyr not in layers]
+    done = refreshIndexes(layers, args.rebuild, args.features_per_cell)
+    for action in ["indexed", "current", "skipped", "failed"]:
+        for lyr, meta in done[action]:
+            if meta is not None:
+                print("%-8s %s  %d features in %.1f s" % (action, lyr, meta["count"], meta["seconds"]))
+            else:
+                print("%-8s %s" % (action, lyr))
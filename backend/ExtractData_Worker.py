@@ -0,0 +1,326 @@
+#**********************************************************************
+# Description:
+#   Warm workers for the extract tool.  Each worker process imports
+#   ExtractData_v1.py (creating the geoprocessor), checks out Data Interop
+#   and sets up the scratch workspace and its pool of clip workers once,
+#   then runs job after job with
+#   ExtractData_v1.runExtract.  The caches of the module (maxarea lookup,
+#   layer registry, prj index, output coordinate system) stay warm from one
+#   job to the next.  A worker retires after --max-jobs jobs or once it uses
+#   more than --max-memory-mb, and a fresh one takes its place.
+#
+#   Jobs come in over a local socket, one JSON line per connection with the
+#   keys ExtractData_JobQueue.py takes, and the reply is one JSON line once
+#   the job has run.  ExtractData_JobQueue.py --workers-address sends its
+#   jobs here instead of starting ExtractData_v1.py for every job.
+#
+# Usage:
+##        python ExtractData_Worker.py [--port 8086] [--workers 4] [--max-jobs 50]
+##               [--max-memory-mb 2048]
+#
+#   {"layers": [...], "areaOfInterest": ..., "outputZipFile": ..., ...}
+#       -> {"status": "succeeded" or "failed", "error", "seconds", "worker", "workerJobs"}
+#   {"command": "status"}
+#       -> {"workers": [{"pid", "jobs", "busy", "memory"}], "queued"}
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#**********************************************************************
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+try:
+    from SocketServer import StreamRequestHandler, TCPServer, ThreadingMixIn
+except ImportError:
+    from socketserver import StreamRequestHandler, TCPServer, ThreadingMixIn
+
+# worker processes running jobs at once
+worker_count = 4
+# a worker retires after this many jobs (0 = never)
+max_jobs_per_worker = 50
+# a worker retires after a job that left it using more than this many bytes (0 = no limit)
+max_worker_memory = 2048 * 1024 * 1024
+# seconds a worker that died is given to report the job it finished before the job is failed
+worker_death_grace = 5
+
+
+def processMemory():
+    # resident bytes of this process, None when they can't be told
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            if not ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                            ctypes.byref(counters), counters.cb):
+                return None
+            return counters.WorkingSetSize
+        statm = open("/proc/self/statm")
+        try:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        finally:
+            statm.close()
+    except Exception:
+        return None
+
+
+def workerMain(tasks, results, maxJobs, maxMemory):
+    # the geoprocessor and licenses are set up here, once, and not again for every job
+    import ExtractData_v1
+    pid = os.getpid()
+    if ExtractData_v1.gp is None:
+        results.put(("unusable", pid, "ArcGIS (arcgisscripting) is not available"))
+        return
+    try:
+        ExtractData_v1.checkOutDataInterop()
+        ExtractData_v1.setUpScratchWorkspace()
+        # the clip workers are started once too and clip the layers of all this worker's jobs
+        ExtractData_v1.startClipPool()
+    except Exception as e:
+        results.put(("unusable", pid, str(e)))
+        return
+    results.put(("ready", pid))
+
+    jobs = 0
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        jobId, job = task
+        results.put(("started", pid, jobId))
+        started = time.time()
+        result = {"worker": pid}
+        try:
+            ExtractData_v1.runExtract(job["layers"], job["areaOfInterest"], job.get("featureFormat", ""),
+                                      job.get("rasterFormat", ""), job.get("coordinateSystem", ""),
+                                      job.get("customCoordSystemFolder", ""), job["outputZipFile"].replace("\\", os.sep),
+                                      job.get("batchField", ""), job.get("sinceManifest", ""))
+            result["status"] = "succeeded"
+        except:
+            result["status"] = "failed"
+            result["error"] = ExtractData_v1.reportJobError()
+            # the next job of this worker must not write into this job's log
+            ExtractData_v1.CloseLog(ExtractData_v1.TargetLogFile)
+        ExtractData_v1.releaseScratchWorkspace()
+        jobs += 1
+        result["seconds"] = round(time.time() - started, 3)
+        result["workerJobs"] = jobs
+        result["memory"] = processMemory()
+        results.put(("finished", pid, jobId, result))
+        if maxJobs and jobs >= maxJobs:
+            break
+        if maxMemory and result["memory"] and result["memory"] > maxMemory:
+            break
+    ExtractData_v1.stopClipPool()
+    ExtractData_v1.waitForScratchPool()
+
+
+class WorkerPool(object):
+    # Starts the workers, hands them jobs through a queue and replaces the ones that retire
+    # or die.  A job whose worker died is failed rather than run again, it may be what killed it
+    def __init__(self, workers=None, maxJobs=None, maxMemory=None):
+        self.workerCount = workers or worker_count
+        self.maxJobs = max_jobs_per_worker
+        if maxJobs is not None:
+            self.maxJobs = maxJobs
+        self.maxMemory = max_worker_memory
+        if maxMemory is not None:
+            self.maxMemory = maxMemory
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.lock = threading.Condition()
+        # pid -> {"process", "jobs", "busy", "memory", "ready", "died"}
+        self.workers = {}
+        # jobId -> result, None while the job runs
+        self.pending = {}
+        self.queued = 0
+        self.unusable = None
+        self.stopped = False
+        for i in range(self.workerCount):
+            self._startWorker()
+        for target in [self._collect, self._supervise]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def run(self, job):
+        # run a job on the next free worker and wait for how it went
+        jobId = uuid.uuid4().hex
+        self.lock.acquire()
+        try:
+            if self.unusable is not None:
+                return {"status": "failed", "error": "the extract workers can't start: " + self.unusable}
+            self.pending[jobId] = None
+            self.queued += 1
+        finally:
+            self.lock.release()
+        self.tasks.put((jobId, job))
+        self.lock.acquire()
+        try:
+            while self.pending[jobId] is None:
+                self.lock.wait(1)
+            return self.pending.pop(jobId)
+        finally:
+            self.lock.release()
+
+    def status(self):
+        self.lock.acquire()
+        try:
+            return {"workers": [{"pid": pid, "jobs": w["jobs"], "busy": w["busy"] is not None, "memory": w["memory"]}
+                                for pid, w in self.workers.items()],
+                    "queued": self.queued}
+        finally:
+            self.lock.release()
+
+    def stop(self):
+        self.lock.acquire()
+        self.stopped = True
+        workers = list(self.workers.values())
+        self.lock.release()
+        for worker in workers:
+            self.tasks.put(None)
+        for worker in workers:
+            worker["process"].join(30)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+
+    def _startWorker(self):
+        # not a daemon, a worker clips with a pool of processes of its own
+        process = multiprocessing.Process(target=workerMain, args=(self.tasks, self.results, self.maxJobs, self.maxMemory))
+        process.start()
+        self.workers[process.pid] = {"process": process, "jobs": 0, "busy": None, "memory": None,
+                                     "ready": False, "died": None}
+
+    def _finish(self, jobId, result):
+        # called with the lock held
+        if jobId in self.pending:
+            self.pending[jobId] = result
+            self.lock.notify_all()
+
+    def _collect(self):
+        while True:
+            message = self.results.get()
+            self.lock.acquire()
+            try:
+                kind, pid = message[0], message[1]
+                worker = self.workers.get(pid)
+                if kind == "unusable":
+                    self.unusable = message[2]
+                    # nothing will run the jobs already waiting, fail them
+                    for jobId in self.pending:
+                        if self.pending[jobId] is None:
+                            self._finish(jobId, {"status": "failed", "error": "the extract workers can't start: " + self.unusable})
+                elif worker is None:
+                    continue
+                elif kind == "ready":
+                    worker["ready"] = True
+                elif kind == "started":
+                    worker["busy"] = message[2]
+                    self.queued -= 1
+                elif kind == "finished":
+                    result = message[3]
+                    worker["busy"] = None
+                    worker["jobs"] = result["workerJobs"]
+                    worker["memory"] = result["memory"]
+                    self._finish(message[2], result)
+            finally:
+                self.lock.release()
+
+    def _supervise(self):
+        while True:
+            time.sleep(1)
+            self.lock.acquire()
+            try:
+                if self.stopped:
+                    return
+                now = time.time()
+                for pid, worker in list(self.workers.items()):
+                    if worker["process"].is_alive():
+                        continue
+                    if worker["died"] is None:
+                        worker["died"] = now
+                        worker["process"].join()
+                    # the job it finished may still be on its way through the results queue
+                    if now - worker["died"] < worker_death_grace:
+                        continue
+                    if worker["busy"] is not None:
+                        self._finish(worker["busy"], {"status": "failed", "worker": pid,
+                                                      "error": "the worker died (exit code %s)" % worker["process"].exitcode})
+                    del self.workers[pid]
+                    if self.unusable is None:
+                        self._startWorker()
+            finally:
+                self.lock.release()
+
+
+def runOnWorkers(job, address):
+    # send a job to the warm workers at (host, port) and wait for how it went
+    sock = socket.create_connection(address)
+    try:
+        sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        reader = sock.makefile("rb")
+        line = reader.readline()
+        reader.close()
+    finally:
+        sock.close()
+    if not line:
+        raise IOError("the extract workers closed the connection")
+    return json.loads(line.decode("utf-8"))
+
+
+class WorkerRequestHandler(StreamRequestHandler):
+    pool = None
+
+    def _reply(self, body):
+        self.wfile.write((json.dumps(body) + "\n").encode("utf-8"))
+
+    def handle(self):
+        try:
+            job = json.loads(self.rfile.readline().decode("utf-8"))
+        except ValueError as e:
+            return self._reply({"status": "failed", "error": str(e)})
+        if job.get("command") == "status":
+            return self._reply(self.pool.status())
+        for key in ["layers", "areaOfInterest", "outputZipFile"]:
+            if key not in job:
+                return self._reply({"status": "failed", "error": "missing " + key})
+        self._reply(self.pool.run(job))
+
+
+class ThreadingTCPServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Warm worker processes for the extract tool")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8086)
+    parser.add_argument("--workers", type=int, default=worker_count, help="worker processes running jobs at once")
+    parser.add_argument("--max-jobs", type=int, default=max_jobs_per_worker, help="jobs a worker runs before it retires (0 = never)")
+    parser.add_argument("--max-memory-mb", type=int, default=max_worker_memory // (1024 * 1024),
+                        help="memory a worker may use before it retires (0 = no limit)")
+    args = parser.parse_args()
+
+    WorkerRequestHandler.pool = WorkerPool(args.workers, args.max_jobs, args.max_memory_mb * 1024 * 1024)
+    server = ThreadingTCPServer((args.host, args.port), WorkerRequestHandler)
+    print("extract workers listening on %s:%d" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        WorkerRequestHandler.pool.stop()
@@ -0,0 +1,345 @@
+#**********************************************************************
+# Description:
+#   Pure python feature writers for the extract tool.  The features of a
+#   clip are read once with a search cursor and written straight to the
+#   requested format, so these formats don't need the Data Interoperability
+#   extension or a copy in the scratch gdb.
+#
+#   Writers are registered by the short format name the tool is given
+#   ("long name - short name - extension"):
+#        GEOJSON  GeoJSON FeatureCollection
+#        CSV      comma separated values, geometry as WKT in the last column
+#        GPKG     OGC GeoPackage
+#
+#   A writer is created with (path, fields, shapeType, spatialReference),
+#   fields = [(name, field type), ...] and spatialReference =
+#   {"wkid": factory code or None, "wkt": well known text or ""}, gets
+#   write(values, shape) for every feature with shape from readShape(), and
+#   close() at the end.
+#
+# HISTORY:
+#   10/18/2026  - VCGI - Created
+#   10/18/2026  - VCGI - Label Esri factory codes (above 32767) as ESRI rather than EPSG
+#**********************************************************************
+
+import csv
+import json
+import os
+import sqlite3
+import struct
+import sys
+import time
+
+import ExtractData_Geometry
+
+# field types that are not written, the geometry is written separately
+skipped_field_types = ["Geometry", "Raster", "Blob"]
+
+# short format name -> writer class
+writers = {}
+
+# factory codes above this are Esri's own (ie. 102100 Web Mercator), EPSG codes stop here
+max_epsg_code = 32767
+
+
+def registerWriter(formatName, writerClass):
+    writers[formatName.lower()] = writerClass
+
+
+def getWriter(formatName):
+    # the writer class for a short format name, or None when the format needs the geoprocessor
+    return writers.get(str(formatName).lower())
+
+
+def crsAuthority(wkid):
+    # "EPSG" or "ESRI", the organization a factory code belongs to
+    if wkid > max_epsg_code:
+        return "ESRI"
+    return "EPSG"
+
+
+def readPoints(part):
+    # the (x, y) paths of an ArcGIS geometry part, a None point starts a new path
+    paths = []
+    path = []
+    for pnt in part:
+        if pnt:
+            path.append((pnt.X, pnt.Y))
+        elif path:
+            paths.append(path)
+            path = []
+    if path:
+        paths.append(path)
+    return paths
+
+
+def readShape(geometry, shapeType):
+    # an ArcGIS geometry as plain coordinates:
+    #   Point      (x, y)
+    #   Multipoint [(x, y), ...]
+    #   Polyline   [path, ...]
+    #   Polygon    [[exterior ring, hole, ...], ...] with the rings counter-clockwise/clockwise
+    #              the way GeoJSON, WKT and WKB expect them
+    if geometry is None:
+        return None
+    shapeType = shapeType.lower()
+    if shapeType == "point":
+        pnt = geometry.getPart(0) if geometry.partCount else None
+        if pnt is None:
+            return None
+        return (pnt.X, pnt.Y)
+    if shapeType == "multipoint":
+        points = []
+        for i in range(geometry.partCount):
+            part = geometry.getPart(i)
+            if hasattr(part, "X"):
+                points.append((part.X, part.Y))
+            else:
+                for path in readPoints(part):
+                    points.extend(path)
+        return points
+    if shapeType == "polyline":
+        paths = []
+        for i in range(geometry.partCount):
+            paths.extend(readPoints(geometry.getPart(i)))
+        return paths
+    if shapeType == "polygon":
+        # ArcGIS exterior rings are clockwise and holes counter-clockwise, the
+        # simple features order is the reverse
+        polygons = []
+        for ring in ExtractData_Geometry.geometryRings(geometry):
+            if ExtractData_Geometry.ringSignedArea(ring) <= 0 or not polygons:
+                polygons.append([])
+            polygons[-1].append(list(reversed(ring)))
+        return polygons
+    raise Exception("Unable to write " + shapeType + " features")
+
+
+def shapeExtent(shape, shapeType):
+    # (xmin, ymin, xmax, ymax) of readShape() output
+    shapeType = shapeType.lower()
+    if shapeType == "point":
+        points = [shape]
+    elif shapeType == "multipoint":
+        points = shape
+    elif shapeType == "polyline":
+        points = [pnt for path in shape for pnt in path]
+    else:
+        points = [pnt for polygon in shape for ring in polygon for pnt in ring]
+    if not points:
+        return None
+    xs = [x for x, y in points]
+    ys = [y for x, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def writableValue(value):
+    # cursor values that json/csv/sqlite can't take as they are (dates, guids) are written as text
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if sys.version_info[0] < 3 and isinstance(value, (long, unicode)):
+        return value
+    return str(value)
+
+
+def toWKT(shape, shapeType):
+    def coords(points):
+        return "(" + ", ".join(["%r %r" % pnt for pnt in points]) + ")"
+
+    shapeType = shapeType.lower()
+    if shape is None:
+        return ""
+    if shapeType == "point":
+        return "POINT (%r %r)" % shape
+    if not shape:
+        return {"multipoint": "MULTIPOINT EMPTY", "polyline": "MULTILINESTRING EMPTY"}.get(shapeType, "MULTIPOLYGON EMPTY")
+    if shapeType == "multipoint":
+        return "MULTIPOINT " + coords(shape)
+    if shapeType == "polyline":
+        return "MULTILINESTRING (" + ", ".join([coords(path) for path in shape]) + ")"
+    return "MULTIPOLYGON (" + ", ".join(["(" + ", ".join([coords(ring) for ring in polygon]) + ")" for polygon in shape]) + ")"
+
+
+def toWKB(shape, shapeType):
+    # little endian WKB, lines and polygons are always written as multi geometries
+    def points(pts):
+        return struct.pack("<I", len(pts)) + b"".join([struct.pack("<dd", x, y) for x, y in pts])
+
+    shapeType = shapeType.lower()
+    if shapeType == "point":
+        return struct.pack("<BIdd", 1, 1, shape[0], shape[1])
+    if shapeType == "multipoint":
+        return struct.pack("<BII", 1, 4, len(shape)) + b"".join([struct.pack("<BIdd", 1, 1, x, y) for x, y in shape])
+    if shapeType == "polyline":
+        return struct.pack("<BII", 1, 5, len(shape)) + b"".join([struct.pack("<BI", 1, 2) + points(path) for path in shape])
+    return struct.pack("<BII", 1, 6, len(shape)) + b"".join(
+        [struct.pack("<BII", 1, 3, len(polygon)) + b"".join([points(ring) for ring in polygon]) for polygon in shape])
+
+
+class GeoJSONWriter(object):
+    # features are written as they come, the collection is never held in memory
+    def __init__(self, path, fields, shapeType, spatialReference):
+        self.fields = [name for name, fieldType in fields]
+        self.shapeType = shapeType.lower()
+        self.out = open(path, 'w')
+        self.count = 0
+        self.out.write('{"type": "FeatureCollection",\n')
+        if spatialReference.get("wkid"):
+            crs = {"type": "name", "properties": {"name": "urn:ogc:def:crs:%s::%d" % (crsAuthority(spatialReference["wkid"]),
+                                                                                   spatialReference["wkid"])}}
+            self.out.write('"crs": ' + json.dumps(crs) + ',\n')
+        self.out.write('"features": [\n')
+
+    def geometry(self, shape):
+        if shape is None:
+            return None
+        if self.shapeType == "point":
+            return {"type": "Point", "coordinates": shape}
+        if self.shapeType == "multipoint":
+            return {"type": "MultiPoint", "coordinates": shape}
+        if self.shapeType == "polyline":
+            if len(shape) == 1:
+                return {"type": "LineString", "coordinates": shape[0]}
+            return {"type": "MultiLineString", "coordinates": shape}
+        if len(shape) == 1:
+            return {"type": "Polygon", "coordinates": shape[0]}
+        return {"type": "MultiPolygon", "coordinates": shape}
+
+    def write(self, values, shape):
+        feature = {"type": "Feature",
+                   "geometry": self.geometry(shape),
+                   "properties": dict(zip(self.fields, [writableValue(v) for v in values]))}
+        if self.count:
+            self.out.write(',\n')
+        self.out.write(json.dumps(feature))
+        self.count += 1
+
+    def close(self):
+        self.out.write('\n]}\n')
+        self.out.close()
+
+
+class CSVWriter(object):
+    # one row per feature, the geometry as WKT in the last column and the
+    # coordinate system in a .prj beside the csv
+    def __init__(self, path, fields, shapeType, spatialReference):
+        self.shapeType = shapeType
+        if sys.version_info[0] < 3:
+            self.out = open(path, 'wb')
+        else:
+            self.out = open(path, 'w', newline='')
+        self.csv = csv.writer(self.out)
+        self.writeRow([name for name, fieldType in fields] + ["WKT"])
+        if spatialReference.get("wkt"):
+            prj = open(os.path.splitext(path)[0] + ".prj", 'w')
+            prj.write(spatialReference["wkt"])
+            prj.close()
+
+    def writeRow(self, values):
+        if sys.version_info[0] < 3:
+            values = [isinstance(v, unicode) and v.encode("utf-8") or v for v in values]
+        self.csv.writerow(values)
+
+    def write(self, values, shape):
+        self.writeRow([writableValue(v) for v in values] + [toWKT(shape, self.shapeType)])
+
+    def close(self):
+        self.out.close()
+
+
+class GeoPackageWriter(object):
+    # a GeoPackage with one feature table named after the file
+    geometry_type_names = {"point": "POINT", "multipoint": "MULTIPOINT",
+                           "polyline": "MULTILINESTRING", "polygon": "MULTIPOLYGON"}
+    column_types = {"String": "TEXT", "Integer": "INTEGER", "SmallInteger": "INTEGER", "OID": "INTEGER",
+                    "Double": "REAL", "Single": "REAL", "Date": "DATETIME", "GUID": "TEXT", "GlobalID": "TEXT"}
+    # srs_id of a coordinate system without a factory code
+    custom_srs_id = 100000
+    # the WGS 84 row every geopackage has (GeoPackage 1.2, table 21)
+    wgs84_definition = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+                        'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+                        'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+                        'AUTHORITY["EPSG","4326"]]')
+
+    def __init__(self, path, fields, shapeType, spatialReference):
+        self.shapeType = shapeType.lower()
+        self.table = os.path.splitext(os.path.basename(path))[0]
+        self.extent = None
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA application_id = 1196444487")
+        self.db.execute("PRAGMA user_version = 10200")
+        self.db.execute("CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, "
+                        "organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, "
+                        "definition TEXT NOT NULL, description TEXT)")
+        self.db.execute("CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, "
+                        "identifier TEXT UNIQUE, description TEXT DEFAULT '', last_change DATETIME NOT NULL, "
+                        "min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)")
+        self.db.execute("CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL, "
+                        "geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, "
+                        "m TINYINT NOT NULL, CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name))")
+        self.db.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)",
+                            [("Undefined cartesian SRS", -1, "NONE", -1, "undefined", None),
+                             ("Undefined geographic SRS", 0, "NONE", 0, "undefined", None),
+                             ("WGS 84 geodetic", 4326, "EPSG", 4326, self.wgs84_definition,
+                              "longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid")])
+
+        self.srsId = -1
+        if spatialReference.get("wkid") == 4326:
+            self.srsId = 4326
+        elif spatialReference.get("wkid"):
+            self.srsId = spatialReference["wkid"]
+            authority = crsAuthority(self.srsId)
+            self.db.execute("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)",
+                            ("%s:%d" % (authority, self.srsId), self.srsId, authority, self.srsId,
+                             spatialReference.get("wkt") or "undefined", None))
+        elif spatialReference.get("wkt"):
+            self.srsId = self.custom_srs_id
+            self.db.execute("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)",
+                            ("Custom", self.srsId, "NONE", self.srsId, spatialReference["wkt"], None))
+
+        # the geopackage fid replaces the object id
+        self.fields = [(name, fieldType) for name, fieldType in fields if fieldType != "OID"]
+        columns = ['"fid" INTEGER PRIMARY KEY AUTOINCREMENT', '"geom" %s' % self.geometry_type_names[self.shapeType]]
+        for name, fieldType in self.fields:
+            columns.append('"%s" %s' % (name.replace('"', '""'), self.column_types.get(fieldType, "TEXT")))
+        self.db.execute('CREATE TABLE "%s" (%s)' % (self.table, ", ".join(columns)))
+        self.db.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, 0, 0)",
+                        (self.table, self.geometry_type_names[self.shapeType], self.srsId))
+        self.insert = 'INSERT INTO "%s" (%s) VALUES (%s)' % (
+            self.table, ", ".join(['"geom"'] + ['"%s"' % name.replace('"', '""') for name, fieldType in self.fields]),
+            ", ".join(["?"] * (len(self.fields) + 1)))
+        self.fieldIndexes = [i for i, (name, fieldType) in enumerate(fields) if fieldType != "OID"]
+
+    def geometry(self, shape):
+        # geopackage binary header (little endian, xy envelope) followed by WKB
+        if shape is None:
+            return None
+        extent = shapeExtent(shape, self.shapeType)
+        if extent is None:
+            return struct.pack("<2sBBi", b"GP", 0, 0x11, self.srsId) + toWKB(shape, self.shapeType)
+        if self.extent is None:
+            self.extent = extent
+        else:
+            self.extent = (min(self.extent[0], extent[0]), min(self.extent[1], extent[1]),
+                           max(self.extent[2], extent[2]), max(self.extent[3], extent[3]))
+        header = struct.pack("<2sBBidddd", b"GP", 0, 0x03, self.srsId, extent[0], extent[2], extent[1], extent[3])
+        return header + toWKB(shape, self.shapeType)
+
+    def write(self, values, shape):
+        blob = self.geometry(shape)
+        if blob is not None:
+            blob = sqlite3.Binary(blob)
+        self.db.execute(self.insert, [blob] + [writableValue(values[i]) for i in self.fieldIndexes])
+
+    def close(self):
+        extent = self.extent or (None, None, None, None)
+        self.db.execute("INSERT INTO gpkg_contents VALUES (?, 'features', ?, '', ?, ?, ?, ?, ?, ?)",
+                        (self.table, self.table, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                         extent[0], extent[1], extent[2], extent[3], self.srsId))
+        self.db.commit()
+        self.db.close()
+
+
+registerWriter("GEOJSON", GeoJSONWriter)
+registerWriter("CSV", CSVWriter)
+registerWriter("GPKG", GeoPackageWriter)
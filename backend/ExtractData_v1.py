@@ -1,11 +1,36 @@
-import arcgisscripting
+import array
+import atexit
+import hashlib
+import json
+import math
+import multiprocessing
+import multiprocessing.pool
 import os
+import Queue
 import sys
+import tempfile
+import threading
+import time
 import traceback
+import uuid
 import zipfile
+import zlib
 import re
+import shutil
 
-gp = arcgisscripting.create(10.1)
+import ExtractData_Geometry
+import ExtractData_Writers
+
+try:
+    import arcgisscripting
+except ImportError:
+    # off an ArcGIS install the geoprocessor has to be set with setGeoprocessor
+    arcgisscripting = None
+
+if arcgisscripting is not None:
+    gp = arcgisscripting.create(10.1)
+else:
+    gp = None
 
 #**********************************************************************
 # Description:
@@ -19,58 +44,783 @@ gp = arcgisscripting.create(10.1)
 ##        coordinateSystem = Output coordinate system being requested
 ##        customCoordSystemFolder = Coordinate system config folder
 ##        outputZipFile = output zipfile o create
+##        batchField = optional, aoi field naming one output folder per aoi feature
+##        sinceManifest = optional, zip or manifest of a previous extract of the same aoi,
+##                        only the layers that changed since are extracted again
 # Constants
 ##        maxarea_lookuptable = Lookup table containing list of layers/raster
 ##                              with Maximum Area "to be clipped" settings.
 ##        default_maxarea = Default max clip area for those not listed in lookup
+##        maxarea_cache_ttl = Seconds the lookup table is cached in the process
+##        max_clip_workers = Number of worker processes used to clip layers
+##        layer_retries = Times a layer with a transient error is tried again
+##        layer_timeout = Seconds a clip worker may spend on one layer
+##        preflight_max_bytes, preflight_max_seconds = Budget of the estimated output of a job (off by default)
+##        layer_registry_ttl = Seconds what describe says about a layer is cached
+##        projected_store_folder = Pre-projected copies of the most requested layers
+##        scratch_pool_folder = Ready made job workspaces, purged by age and scratch_pool_maxbytes
+##        spatial_index_folder = Grid indexes of the feature extents of the most clipped layers
+##        progress_file_name, layer_zips_folder_name = Per layer progress events and zips of the
+##                                                     finished layers, named after the output zip
 #
 # HISTORY:
 #	4/15/2014	- Steve Sharp, VCGI	- Modified original ESRI code to handled Mosiac datasets
 #                                   and handle maxarea limits, and other goodies
 #   4/22/2014   - Steve Sharp, VCGI - Added geoprocessing log generation
+#   10/18/2026  - VCGI - Clip layers in parallel worker processes (max_clip_workers)
+#   10/18/2026  - VCGI - Zip layer outputs while the remaining layers are clipped
+#   10/18/2026  - VCGI - Buffer the processing log behind a single open file handle
+#   10/18/2026  - VCGI - Read the maxarea lookup table once and cache it in the process
+#   10/18/2026  - VCGI - Resolve coordinate systems from a persistent prj index
+#   10/18/2026  - VCGI - Reuse cached clips of the same layer, aoi, format and coordinate system
+#   10/18/2026  - VCGI - Clip large rasters as a grid of tiles
+#   10/18/2026  - VCGI - Use the true AOI polygon area and skip layers the AOI doesn't touch
+#   10/18/2026  - VCGI - Time the stages of each job and write them as JSON metrics
+#   10/18/2026  - VCGI - Allow a different geoprocessor to be set (setGeoprocessor)
+#   10/18/2026  - VCGI - Write GeoJSON, CSV and GeoPackage straight from an in memory clip
+#   10/18/2026  - VCGI - Batch mode, one folder per aoi feature with each layer read once
+#   10/18/2026  - VCGI - Write a manifest into every zip and extract only changed layers since a manifest
+#   10/18/2026  - VCGI - Store already compressed outputs in the zip instead of deflating them, zip64
+#   10/18/2026  - VCGI - Keep layer descriptions and output names in a process wide layer registry
+#   10/18/2026  - VCGI - Clip from pre-projected copies of popular layer/coordinate system pairs,
+#                        record reprojected clips, only set the output coordinate system when it changes
+#   10/18/2026  - VCGI - A failing layer no longer fails the job: transient errors are retried, layers
+#                        time out in the workers, and a status table goes into the log, metrics and manifest
+#   10/18/2026  - VCGI - Estimate the output size and run time of every layer before clipping,
+#                        downgrade or reject jobs over the pre-flight budget
+#   10/18/2026  - VCGI - Claim ready made job folders from a scratch pool, purged by age and size
+#   10/18/2026  - VCGI - Split the tool's startup from the job (runExtract) for the warm workers of ExtractData_Worker.py
+#   10/18/2026  - VCGI - Copy the features inside the AOI and clip only the ones on its boundary, from a spatial index
+#   10/18/2026  - VCGI - Write per layer progress events and zip every finished layer on its own for early download
+#   10/18/2026  - VCGI - Keep one clip pool for all the jobs of a warm worker (startClipPool)
 #**********************************************************************
 
+# Version number of this program
+version = "1a"
+TargetLogFile = "none"
+
+# Max Area lookup table
+maxarea_lookuptable = r"\\ags\AGS_services\VCGI_services\ClipAndShip\ToolData\SDE.VCGI.ORG-GDB_VCGI_Web-as-VCGI_AGS_user.sde\GDB_VCGI_Web.VCGI_ADMIN.DWARE_Datasets_MaxSize"
+# Default max area to extract (state of VT and beyond)
+default_maxarea = 400000000000
+# Seconds the maxarea lookup table is cached before it is read again
+maxarea_cache_ttl = 3600
+# Seconds before SDE is tried again after the lookup table could not be read
+maxarea_retry_seconds = 60
+# Last good copy of the maxarea lookup table
+maxarea_snapshot_file = os.path.join(tempfile.gettempdir(), "ExtractData_maxarea_snapshot.json")
+
+# Index of the .prj files in customCoordSystemFolder (and of ListSpatialReferences results)
+prj_index_file = os.path.join(tempfile.gettempdir(), "ExtractData_prj_index.json")
+# Seconds before the folders of the prj index are checked for changes again
+prj_index_check_seconds = 60
+# Seconds a name ListSpatialReferences didn't find is remembered, in the process only so a
+# coordinate system installed later is found
+prj_miss_seconds = 300
+# Optional file of "alias = coordinate system name" lines in customCoordSystemFolder
+prj_alias_file = "aliases.txt"
+SYSTEM_PRJ_KEY = "*ListSpatialReferences*"
+
+# Cache of clipped outputs keyed on layer source, definition query, aoi, output format and coordinate system ("" = off)
+result_cache_folder = os.path.join(tempfile.gettempdir(), "ExtractData_ResultCache")
+# Total size the result cache is trimmed to, least recently used entries go first
+result_cache_maxbytes = 10 * 1024 * 1024 * 1024
+# Seconds a cached clip is used before the layer is clipped again
+result_cache_max_age = 86400
+# An sde layer without editor tracking has nothing that changes with an attribute edit, its row
+# count and extent only change when features are added, deleted or moved. False = such layers are
+# always clipped again (no result cache, never "unchanged" since a manifest), True = trust them
+untracked_source_fingerprints = False
+# Decimal places the aoi coordinates are rounded to before they are hashed
+aoi_hash_precision = 3
+
+# Pre-projected copies of the most requested layer/coordinate system pairs, built by
+# ExtractData_ProjectedStore.py ("" = off). Clips to a coordinate system read the copy when there is one
+projected_store_folder = os.path.join(tempfile.gettempdir(), "ExtractData_ProjectedStore")
+# Total size the store is trimmed to, the copies saving the least clip time go first
+projected_store_maxbytes = 50 * 1024 * 1024 * 1024
+# Seconds a copy is used when the modification time of its source can't be read (sde)
+projected_store_max_age = 86400
+# Every clip to another coordinate system is appended to this file ("" = don't record)
+projection_stats_file = os.path.join(tempfile.gettempdir(), "ExtractData_ProjectionStats.ndjson")
+
+# Grid indexes of the feature extents of the most clipped layers, built by ExtractData_SpatialIndex.py
+# ("" = off). Features inside the aoi are copied and only the ones crossing its boundary are clipped
+spatial_index_folder = os.path.join(tempfile.gettempdir(), "ExtractData_SpatialIndex")
+# Seconds an index is used when the modification time of its source can't be read (sde). the
+# row count and extent of the source are checked too, but an edit that keeps both (a feature
+# moved within the layer) is only noticed once the index is this old
+spatial_index_max_age = 3600
+# Layers with fewer features than this are clipped whole, the index wouldn't save anything
+prefilter_min_features = 5000
+# Layers are clipped whole when more than this share of the features near the aoi cross its boundary
+prefilter_max_boundary_share = 0.5
+# Object ids per IN list of the where clauses that select the features (oracle takes 1000)
+prefilter_oid_chunk = 1000
+
+# Rasters more than this many pixels wide or high are clipped as tiles of this size (0 = never tile)
+raster_tile_pixels = 4096
+# "MOSAIC" puts the tiles back together, "TILESET" ships the tiles with a .csv index
+raster_tile_output = "MOSAIC"
+# Rasters whose aoi is up to this multiple of their maxarea are clipped in tiles rather than skipped.
+# 1 = the maxarea limits hold as they are, raise it to serve larger aois of the rasters in tiles
+tiled_maxarea_factor = 1
+# Workers used to clip the tiles of one raster: processes when the layers are clipped serially
+# (max_clip_workers = 1), threads with a geoprocessor each inside a clip worker, which is a
+# daemon process that can't start processes of its own
+raster_tile_workers = 4
+# GetRasterProperties VALUETYPE -> MosaicToNewRaster pixel type
+raster_pixel_types = {"0": "1_BIT", "1": "2_BIT", "2": "4_BIT", "3": "8_BIT_UNSIGNED", "4": "8_BIT_SIGNED",
+                      "5": "16_BIT_UNSIGNED", "6": "16_BIT_SIGNED", "7": "32_BIT_UNSIGNED", "8": "32_BIT_SIGNED",
+                      "9": "32_BIT_FLOAT", "10": "64_BIT"}
+
+# Every job appends its timings to this file, "" = only write _ExtractData_Metrics.json next to the log
+metrics_ndjson_file = os.path.join(tempfile.gettempdir(), "ExtractData_Metrics.ndjson")
+# outputs that are already compressed are stored in the zip rather than deflated again
+zip_stored_extensions = [".jp2", ".j2k", ".sid", ".ecw", ".jpg", ".jpeg", ".png", ".gif", ".zip", ".gz", ".kmz"]
+# outputs that always deflate well
+zip_deflated_extensions = [".shp", ".shx", ".dbf", ".prj", ".xml", ".csv", ".geojson", ".json", ".html", ".txt", ".dxf"]
+# anything else larger than zip_probe_min_bytes is stored when zip_probe_samples blocks of
+# zip_probe_bytes spread over the file don't deflate below zip_probe_ratio of their size
+zip_probe_min_bytes = 1024 * 1024
+zip_probe_samples = 4
+zip_probe_bytes = 65536
+zip_probe_ratio = 0.9
+# bytes read and written at a time when a file is added to the zip
+zip_copy_chunk = 8 * 1024 * 1024
+# what describe says about each layer is kept this many seconds, and shared between processes in
+# layer_registry_file which is checked for changes every layer_registry_check_seconds
+layer_registry_ttl = 3600
+layer_registry_file = os.path.join(tempfile.gettempdir(), "ExtractData_LayerRegistry.json")
+layer_registry_check_seconds = 30
+# keep the feature count of feature layers in the registry
+layer_registry_counts = True
+# raster properties (GetRasterProperties) kept in the registry, for the estimate and the tiles
+raster_registry_properties = ["CELLSIZEX", "CELLSIZEY", "BANDCOUNT", "VALUETYPE"]
+
+# Pre-flight budget of a job, checked against the estimated output before any clip runs (0 = no limit).
+# Off unless set, ie. 5 * 1024 * 1024 * 1024 bytes and 3600 seconds
+preflight_max_bytes = 0
+preflight_max_seconds = 0
+# Over budget: "downgrade" leaves out the most expensive layers until the job fits, "reject" fails the job
+preflight_over_budget = "downgrade"
+# Count the features of a layer in the aoi with a spatial selection, rather than from the
+# feature count and extent of the whole layer. Only with a budget, without one the estimates
+# are only used for the progress of the job and the registry's count will do
+preflight_count_features = True
+# Until the extracts of a layer show otherwise: output bytes per feature and seconds per output MB
+default_bytes_per_feature = 512
+default_seconds_per_mb = 0.5
+# Seconds every layer takes whatever its size (describe, lookups, zip)
+layer_overhead_seconds = 2
+# Output bytes of a raster format per uncompressed pixel byte
+raster_format_ratios = {"jp2": 0.1, "jpg": 0.15, "png": 0.5, "gdb": 0.8}
+# Weight of the latest extract when the learned bytes per feature and seconds per MB are updated
+estimate_learning_rate = 0.3
+# manifest of what each extract shipped, written into the zip and read back for "since manifest" extracts
+manifest_file_name = "_ExtractData_Manifest.json"
+# per layer progress of the job, one JSON event per line next to the output zip, that
+# ExtractData_JobQueue.py pushes to the browser ("" = don't write events). the file is named
+# after the zip (output.zip -> output_ExtractData_Progress.ndjson), see progressPaths
+progress_file_name = "_ExtractData_Progress.ndjson"
+# every finished layer is also zipped on its own into this folder next to the output zip, so it
+# can be downloaded before the job is done. costs a second compression of the layer ("" = don't).
+# named after the zip like the progress file
+layer_zips_folder_name = "_ExtractData_Layers"
+
+# Number of worker processes used to clip layers in parallel (1 = clip serially)
+max_clip_workers = 4
+
+# A layer whose error looks transient (sde, network, locks) is tried again this many times
+layer_retries = 2
+# Seconds before the first retry of a layer, doubled for every retry after it
+layer_retry_backoff = 5
+# Seconds a clip worker may spend on one layer before the job gives up on it (0 = no limit).
+# with a limit even a single layer, or max_clip_workers = 1, is clipped in a worker process
+layer_timeout = 3600
+# Error text of the geoprocessor and sde errors that are worth retrying
+transient_errors = ["error 999999", "dbms error", "sde error", "network i/o error", "connection was lost",
+                    "connection is closed", "failed to connect", "schema lock", "error 000464", "server is busy"]
+
+# Pool of ready made job workspaces (zip folder, scratch folder with its gdb) that jobs claim
+# instead of creating them, refilled and purged on a background thread ("" = create them in
+# the scratch workspace like before, and never delete them)
+scratch_pool_folder = os.path.join(tempfile.gettempdir(), "ExtractData_ScratchPool")
+# Ready workspaces kept in the pool
+scratch_pool_size = 4
+# Seconds the workspace of a finished job is kept (to look at its log and outputs) before it is purged
+scratch_pool_keep_seconds = 3600
+# Seconds before the workspace of a job that never finished (the process died) is purged
+scratch_pool_max_age = 86400
+# Workspaces of finished jobs are purged, oldest first, while the pool is larger than this
+scratch_pool_maxbytes = 20 * 1024 * 1024 * 1024
+# Purged workspaces deleted per pass of the maintenance, the rest wait for the next job's pass
+scratch_pool_purge_batch = 8
+
+# Processing log buffering, the log is written when either threshold is reached
+log_flush_bytes = 16384
+log_flush_seconds = 5
+
+# Set in the clip worker processes (see initClipWorker)
+workspaceLock = None
+workerEvents = None
+workerSettings = None
+workerTaskIndex = None
+# The clip pool a warm worker keeps for all its jobs (see startClipPool), None = a pool per job
+clipPool = None
+clipPoolEvents = None
+clipPoolWorkers = 0
+# The layer runLayerTask is working on, for its progress events
+currentLayer = None
+# Outputs the running attempt at currentLayer has named, deleted when the attempt fails
+attemptOutputs = []
+# What gp.OutputCoordinateSystem was last set to (see setOutputCoordinateSystem)
+currentOutputCoordinateSystem = None
+# The pool workspace of the running job and the thread refilling/purging the pool
+scratchPoolEntry = None
+scratchPoolThread = None
+
 class LicenseError(Exception):
     pass
 
+def setGeoprocessor(geoprocessor):
+    # every function in this module works against the module level gp. swapping it
+    # (ie. for ExtractData_FakeGP.FakeGeoprocessor) lets the scheduling, logging, lookups
+    # and zipping run without ArcGIS
+    global gp, currentOutputCoordinateSystem
+    gp = geoprocessor
+    currentOutputCoordinateSystem = None
+    return gp
+
+def setOutputCoordinateSystem(coordinateSystem):
+    # the geoprocessor parses the coordinate system every time the environment is set,
+    # so it is only set when it changes
+    global currentOutputCoordinateSystem
+    if coordinateSystem is not None and coordinateSystem == currentOutputCoordinateSystem:
+        return
+    gp.OutputCoordinateSystem = coordinateSystem
+    currentOutputCoordinateSystem = coordinateSystem
+
+class ProcessingLog(object):
+    # Processing log writer that keeps one handle open and buffers messages in memory.
+    # The buffer is written when it grows past log_flush_bytes, when log_flush_seconds
+    # have passed since the last write to disk, and when the log is flushed or closed.
+    # Every entry is also kept as an event so the same HTML can be rendered again.
+    def __init__(self, outputlog, mode='a'):
+        self.outputlog = outputlog
+        self.events = []
+        self.buffer = []
+        self.bufferSize = 0
+        self.lastFlush = time.time()
+        self.logfile = open(outputlog, mode)
+
+    def header(self, header):
+        self._add("header", header)
+
+    def message(self, message):
+        self._add("message", message)
+
+    def content(self, content):
+        # content that is already formatted, ie. the log of a clip worker
+        self._add("content", content)
+
+    def _add(self, kind, text):
+        self.events.append((kind, text))
+        html = renderLogEvent(kind, text)
+        self.buffer.append(html)
+        self.bufferSize += len(html)
+        if self.bufferSize >= log_flush_bytes or time.time() - self.lastFlush >= log_flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.logfile.write("".join(self.buffer))
+            self.buffer = []
+            self.bufferSize = 0
+        self.logfile.flush()
+        self.lastFlush = time.time()
+
+    def close(self):
+        self.flush()
+        self.logfile.close()
+
+    def render(self):
+        return renderLog(self.events)
+
+def renderLogEvent(kind, text):
+    # html for one log event, the same as InitLog/Append2Log always wrote
+    if kind == "message":
+        return "<br>" + text + "<br>"
+    return text
+
+def renderLog(events):
+    # html for a list of (kind, text) log events
+    return "".join([renderLogEvent(kind, text) for kind, text in events])
+
+# Open processing logs by path
+openLogs = {}
+
+def getLog(outputlog):
+    log = openLogs.get(outputlog)
+    if log is None:
+        log = ProcessingLog(outputlog, 'a')
+        openLogs[outputlog] = log
+    return log
+
 # Initialize processing log
 def InitLog(header,outputlog):
     try:
-        logfile = open(outputlog, 'w')
-        writestatus = logfile.write(header)
-        logfile.close()
+        CloseLog(outputlog)
+        log = ProcessingLog(outputlog, 'w')
+        openLogs[outputlog] = log
+        log.header(header)
+        log.flush()
 
     except: gp.AddMessage("ERROR: A problem was encountered while initializing the geoprocessing log!")
     
 # Append to processing log
 def Append2Log(message,outputlog):
     try:
-        message = "<br>" + message + "<br>"
-        logfile = open(outputlog, 'a')
-        writestatus = logfile.write(message)
-        logfile.close()
+        getLog(outputlog).message(message)
 
     except:
         gp.AddMessage(outputlog)
         gp.AddMessage("ERROR: A problem was encountered while writing " + message + " to the geoprocessing log!")
 
 
+# Append content that is already formatted (ie. a worker's log) to processing log
+def AppendLogContent(content,outputlog):
+    try:
+        getLog(outputlog).content(content)
+
+    except:
+        gp.AddMessage("ERROR: A problem was encountered while merging worker output into the geoprocessing log!")
+
+# Write buffered log lines to disk, for one log or all open logs
+def FlushLog(outputlog=None):
+    for path, log in openLogs.items():
+        if outputlog is None or path == outputlog:
+            try:
+                log.flush()
+            except:
+                gp.AddMessage("ERROR: A problem was encountered while flushing the geoprocessing log " + path + "!")
+
+# Flush and close a processing log
+def CloseLog(outputlog):
+    log = openLogs.pop(outputlog, None)
+    if log is not None:
+        try:
+            log.close()
+        except:
+            gp.AddMessage("ERROR: A problem was encountered while closing the geoprocessing log " + outputlog + "!")
+
+# never lose the last lines of a log, even when the job dies
+atexit.register(FlushLog)
+
+
+class JobMetrics(object):
+    # Timings and output sizes of the stages of one job (describe, clip, export, zip, ...).
+    # Written as a JSON record next to the processing log and appended to metrics_ndjson_file
+    # for ExtractData_MetricsReport.py
+    def __init__(self):
+        self.reset()
+
+    def reset(self, **job):
+        self.job = job
+        self.started = time.time()
+        self.timings = []
+
+    def record(self, stage, layer, seconds, bytes=None):
+        timing = {"stage": stage, "layer": layer, "seconds": round(seconds, 4)}
+        if bytes is not None:
+            timing["bytes"] = bytes
+        self.timings.append(timing)
+
+    def toRecord(self, status):
+        record = dict(self.job)
+        record["status"] = status
+        record["started"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started))
+        record["seconds"] = round(time.time() - self.started, 4)
+        record["timings"] = self.timings
+        return record
+
+jobMetrics = JobMetrics()
+
+def timedCall(stage, layer, func, *args):
+    # run func(*args) and record how long it took as stage of layer
+    started = time.time()
+    try:
+        return func(*args)
+    finally:
+        jobMetrics.record(stage, layer, time.time() - started)
+
+def outputSize(outputpath):
+    # bytes written for a layer, None when it is a dataset inside a gdb/mdb
+    files = listOutputFiles(outputpath)
+    if files:
+        return sum([os.path.getsize(f) for f in files])
+    if os.path.isdir(outputpath):
+        return folderSize(outputpath)
+    return None
+
+def writeJobMetrics(status):
+    # write the metrics of the job next to the processing log and append them to metrics_ndjson_file
+    record = jobMetrics.toRecord(status)
+    record["layerStatus"] = layerStatus.rows.values()
+    line = json.dumps(record, separators=(',', ':'))
+    try:
+        if TargetLogFile != "none":
+            metricsFile = open(os.path.join(os.path.dirname(TargetLogFile), "_ExtractData_Metrics.json"), 'w')
+            metricsFile.write(line)
+            metricsFile.close()
+        if metrics_ndjson_file != "":
+            # one short append per job, small enough not to interleave with other jobs
+            metricsFile = open(metrics_ndjson_file, 'a')
+            metricsFile.write(line + "\n")
+            metricsFile.close()
+    except:
+        gp.AddMessage("WARNING: Unable to write the job metrics")
+
+class LayerStatusTable(object):
+    # How every layer of a job ended - extracted, unchanged, not extracted (skipped, the log says
+    # why), failed or timed out - with the attempts and seconds it took and the error of a failure.
+    # Goes into the processing log, the job metrics and the manifest
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rows = {}
+
+    def record(self, lyr, status, attempts, seconds, error=None):
+        row = {"layer": lyr, "status": status, "attempts": attempts, "seconds": round(seconds, 3)}
+        if error is not None:
+            row["error"] = error
+        self.rows[lyr] = row
+
+    def failed(self):
+        return [row for row in self.rows.values() if row["status"] in ["failed", "timed out"]]
+
+    def toRows(self, lyrs):
+        # the rows in the order the layers were requested
+        return [self.rows[lyr] for lyr in lyrs if lyr in self.rows]
+
+    def toHTML(self, lyrs):
+        html = "<table border='1' cellpadding='2' cellspacing='0'><tr><th>Layer</th><th>Status</th><th>Attempts</th><th>Seconds</th><th>Error</th></tr>"
+        for row in self.toRows(lyrs):
+            status = row["status"]
+            if row in self.failed():
+                status = "<font color='red'>" + status + "</font>"
+            html += "<tr><td>%s</td><td>%s</td><td>%d</td><td>%.1f</td><td>%s</td></tr>" % (
+                row["layer"], status, row["attempts"], row["seconds"], row.get("error", "").replace("\n", "<br>"))
+        return html + "</table>"
+
+layerStatus = LayerStatusTable()
+
+class JobManifest(object):
+    # What one extract shipped: per layer the source fingerprint and the hashes of the
+    # output files, written into the zip as manifest_file_name. Given the manifest of a
+    # previous extract of the same aoi, formats and coordinate system, layers whose
+    # source hasn't changed since are listed as unchanged rather than clipped again
+    def __init__(self):
+        self.reset()
+
+    def reset(self, previous=None, **job):
+        self.job = job
+        self.layers = {}
+        self.previous = {}
+        if previous is not None:
+            if [key for key in job if previous.get(key) != job[key]]:
+                msg = "==> WARNING: The previous manifest is for a different AOI, format or coordinate system, extracting every layer"
+                gp.AddWarning(msg)
+                Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+            else:
+                self.previous = previous.get("layers", {})
+
+    def unchanged(self, lyr, source):
+        # True if lyr was shipped by the previous extract (or one before it) from the same source
+        entry = self.previous.get(lyr)
+        if source is None or entry is None or entry["source"] != source or not entry["files"]:
+            return False
+        self.layers[lyr] = {"source": source, "status": "unchanged", "files": entry["files"]}
+        return True
+
+    def setSource(self, lyr, source):
+        self.layers[lyr] = {"source": source, "status": "extracted", "files": {}}
+
+    def setFailed(self, lyr, status, error):
+        # a layer that failed has nothing in the zip, the next extract since this one extracts it again
+        self.layers[lyr] = {"source": None, "status": status, "files": {}, "error": error}
+
+    def addOutput(self, lyr, outputpath, zipFolderPath):
+        if lyr in self.layers and outputpath is not None:
+            self.layers[lyr]["files"].update(hashOutputFiles(outputpath, zipFolderPath))
+
+    def write(self, zipFolderPath, layerStatus=None):
+        manifest = dict(self.job)
+        manifest["version"] = version
+        manifest["created"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
+        manifest["layers"] = self.layers
+        if layerStatus is not None:
+            manifest["layerStatus"] = layerStatus
+        manifestFile = open(os.path.join(zipFolderPath, manifest_file_name), 'w')
+        json.dump(manifest, manifestFile, indent=1, sort_keys=True)
+        manifestFile.close()
+
+jobManifest = JobManifest()
+
+def progressPaths(outZipFile):
+    # the progress file and layer zips folder of the job writing outZipFile. they are named after
+    # the zip, so jobs writing their zips into the same folder don't wipe each other's
+    folder, zipName = os.path.split(os.path.abspath(outZipFile))
+    baseName = os.path.splitext(zipName)[0]
+    return os.path.join(folder, baseName + progress_file_name), os.path.join(folder, baseName + layer_zips_folder_name)
+
+class JobProgress(object):
+    # Per layer progress of the running job, appended as JSON lines to the progress file next
+    # to the output zip (see progressPaths) for ExtractData_JobQueue.py to push to the browser. A layer goes queued,
+    # clipping, converting (formats exported after the clip) and zipped, or ends as its status in
+    # the layer status table. Every event has the layers done of the total and the estimated
+    # seconds left, zipped ones the bytes and name of the layer's own zip in layer_zips_folder_name.
+    # The last event of a job has no layer and the job's status
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, outZipFile=None):
+        self.path = None
+        self.layerFolder = None
+        self.lyrs = []
+        self.estimates = {}
+        self.workers = 1
+        self.done = {}
+        self.started = time.time()
+        if outZipFile is None or progress_file_name == "":
+            return
+        self.path, layerFolder = progressPaths(outZipFile)
+        try:
+            open(self.path, 'w').close()
+            if layer_zips_folder_name != "":
+                self.layerFolder = layerFolder
+                if os.path.exists(self.layerFolder):
+                    shutil.rmtree(self.layerFolder, True)
+                os.mkdir(self.layerFolder)
+        except:
+            self.path = None
+            self.layerFolder = None
+            gp.AddMessage("WARNING: Unable to write the progress of the job next to " + outZipFile)
+
+    def queued(self, requestedLyrs, lyrs, estimates, workers):
+        # the layers that will be clipped are queued, the ones left out by the pre-flight check are done
+        self.lyrs = list(requestedLyrs)
+        self.estimates = dict([(lyr, estimates[lyr]["seconds"]) for lyr in requestedLyrs if lyr in estimates])
+        self.workers = max(1, workers)
+        for lyr in requestedLyrs:
+            if lyr in lyrs:
+                self.layer(lyr, "queued")
+            else:
+                self.layer(lyr, layerStatus.rows.get(lyr, {}).get("status", "not extracted"))
+
+    def layer(self, lyr, state, **details):
+        if state not in ["queued", "clipping", "converting"]:
+            self.done[lyr] = layerStatus.rows.get(lyr, {}).get("seconds")
+        details["layer"] = lyr
+        details["state"] = state
+        self._write(details)
+
+    def finish(self, status, **details):
+        details["layer"] = None
+        details["state"] = status
+        self._write(details)
+        # nothing more is written for this job, a warm worker's next job starts over
+        self.path = None
+        self.layerFolder = None
+
+    def eta(self):
+        # estimated seconds of the layers left, corrected by how the finished layers compared to their estimates
+        done = [lyr for lyr in self.done if self.done[lyr] and self.estimates.get(lyr)]
+        factor = 1.0
+        if done:
+            factor = sum([self.done[lyr] for lyr in done]) / max(sum([self.estimates[lyr] for lyr in done]), 0.001)
+        left = sum([self.estimates.get(lyr, 0) for lyr in self.lyrs if lyr not in self.done])
+        return int(math.ceil(left * factor / self.workers))
+
+    def _write(self, event):
+        # called from the zip thread too, gp can't be used here
+        if self.path is None:
+            return
+        self.lock.acquire()
+        try:
+            event["time"] = round(time.time() - self.started, 3)
+            event["done"] = len(self.done)
+            event["total"] = len(self.lyrs)
+            event["eta"] = self.eta()
+            # one short append per event, a reader never sees half a line
+            progressFile = open(self.path, 'a')
+            progressFile.write(json.dumps(event, separators=(',', ':')) + "\n")
+            progressFile.close()
+        except:
+            self.path = None
+        finally:
+            self.lock.release()
+
+jobProgress = JobProgress()
+
+def layerProgress(state):
+    # progress of the layer being worked on, from a clip worker through the job's event queue
+    if workerEvents is not None:
+        workerEvents.put((workerSettings["jobId"], workerTaskIndex, time.time(), state, None))
+    elif currentLayer is not None:
+        jobProgress.layer(currentLayer, state)
+
+def noteAttemptOutput(outputpath):
+    # an output the running attempt has named. a clip worker also sends it to the job,
+    # which deletes the outputs of a layer it timed out once the worker is stopped
+    attemptOutputs.append(outputpath)
+    if workerEvents is not None:
+        workerEvents.put((workerSettings["jobId"], workerTaskIndex, time.time(), "output", outputpath))
+
+def finishLayer(lyr, outputs, zipStream):
+    # hand a finished layer to the zip stage, or report how it ended when it has nothing of its own to zip
+    outputs = [outputpath for outputpath in outputs if outputpath is not None]
+    if zipStream is None or not zipStream.addLayer(lyr, outputs):
+        jobProgress.layer(lyr, layerStatus.rows.get(lyr, {}).get("status", "not extracted"))
+
+def loadManifest(path):
+    # the manifest of a previous extract, from its zip or the manifest file itself
+    if zipfile.is_zipfile(path):
+        zip = zipfile.ZipFile(path, 'r')
+        try:
+            for name in zip.namelist():
+                if name.split("/")[-1] == manifest_file_name:
+                    return json.loads(zip.read(name))
+        finally:
+            zip.close()
+        raise IOError(path + " has no " + manifest_file_name)
+    manifestFile = open(path, 'r')
+    try:
+        return json.load(manifestFile)
+    finally:
+        manifestFile.close()
+
+def sourceModified(path):
+    # last modification time of a file based data source, None for sde and services.
+    # a gdb only tells when any of its tables changed
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    if not path or path.lower().endswith(".sde"):
+        return None
+    if os.path.isdir(path):
+        if os.path.dirname(path) == path:
+            return None
+        times = [os.path.getmtime(os.path.join(dirpath, file)) for (dirpath, dirnames, filenames) in os.walk(path) for file in filenames]
+        return max(times or [os.path.getmtime(path)])
+    return os.path.getmtime(path)
+
+def sourceEditedAt(path, d):
+    # when an sde source was last edited, from its editor tracking (None when it isn't tracked).
+    # d is what gp.describe says about path now
+    if not getattr(d, "editorTrackingEnabled", False) or not getattr(d, "editedAtFieldName", ""):
+        return None
+    field = d.editedAtFieldName
+    editedAt = ""
+    cur = gp.searchcursor(path, "", "", field, field + " D")
+    for row in cur:
+        editedAt = str(row.getValue(field))
+        break
+    del cur
+    return editedAt
+
+def getSourceFingerprint(lyr, describe):
+    # what decides whether a layer changed since a previous extract: the modification time
+    # of a file based source, otherwise its row count, extent and last edit. None when an sde
+    # source has no editor tracking (see untracked_source_fingerprints)
+    parts = []
+    try:
+        path = describe.catalogPath
+    except:
+        path = ""
+    modified = None
+    if path:
+        modified = sourceModified(str(path))
+    if modified is not None:
+        parts.append("modified=%r" % modified)
+    else:
+        # describe is the registry's, which may be up to layer_registry_ttl old
+        extent = describe.extent
+        editedAt = None
+        if path:
+            d = gp.describe(str(path))
+            extent = d.extent
+            editedAt = sourceEditedAt(str(path), d)
+        if editedAt is None and not untracked_source_fingerprints:
+            return None
+        if describe.DataType.lower() == "featurelayer":
+            parts.append("count=" + str(gp.GetCount_management(lyr).getOutput(0)))
+        parts.append("extent=" + str(extent))
+        if editedAt is not None:
+            parts.append("edited=" + editedAt)
+    return hashlib.sha1(";".join(parts)).hexdigest()
+
+def getDatasetFingerprint(path):
+    # what decides whether a source dataset changed since a copy or index was made of it: its
+    # modification time when it is file based, otherwise (sde) its row count and extent, and
+    # its last edit when it has editor tracking
+    modified = sourceModified(path)
+    if modified is not None:
+        return "modified=%r" % modified
+    d = gp.describe(path)
+    parts = []
+    dataType = d.DataType.lower()
+    if dataType.find("raster") == -1 and dataType.find("mosaic") == -1:
+        parts.append("count=" + str(gp.GetCount_management(path).getOutput(0)))
+    parts.append("extent=" + str(d.extent))
+    editedAt = sourceEditedAt(path, d)
+    if editedAt is not None:
+        parts.append("edited=" + editedAt)
+    return hashlib.sha1(";".join(parts)).hexdigest()
+
+def hashFile(filepath):
+    sha1 = hashlib.sha1()
+    hashedFile = open(filepath, 'rb')
+    chunk = hashedFile.read(1024 * 1024)
+    while chunk:
+        sha1.update(chunk)
+        chunk = hashedFile.read(1024 * 1024)
+    hashedFile.close()
+    return sha1.hexdigest()
+
+def hashOutputFiles(outputpath, zipFolderPath):
+    # {path in the zip folder: sha1} of the files of an output. a dataset inside a gdb/mdb
+    # can't be told apart from the rest of the gdb, it is listed without a hash
+    files = listOutputFiles(outputpath)
+    if not files and os.path.isdir(outputpath):
+        files = [os.path.join(dirpath, file) for (dirpath, dirnames, filenames) in os.walk(outputpath) for file in filenames]
+    prefix = len(os.path.normpath(zipFolderPath)) + len(os.sep)
+    if not files:
+        return {os.path.normpath(outputpath)[prefix:].replace(os.sep, "/"): None}
+    return dict([(os.path.normpath(f)[prefix:].replace(os.sep, "/"), hashFile(f)) for f in files if not f.endswith(".lock")])
+
 def setUpCoordSystemEnvironment(coordinateSystem, customCoordSystemFolder):
     # get the correct spatial reference and set it into the environment
     # so that the data will get projected when clip runs
     # if it is a number, assume we have a WKID and set it directly in
     # else, find the file in the Coordinate System directory
     if coordinateSystem.lower() == "same as input" or coordinateSystem == "":
+        # a warm worker may have projected the job before this one
+        setOutputCoordinateSystem(None)
         return "same as input"
 
     if coordinateSystem.strip().isalnum() and customCoordSystemFolder == "":
         try:
-            gp.OutputCoordinateSystem = coordinateSystem.strip()
+            setOutputCoordinateSystem(coordinateSystem.strip())
         except:
             #Message "Coordinate System WKID %s is not valid.  Output Coordinate System will be the same as the input layer's Coordinate System"
             gp.AddWarning(get_ID_message(86131) % (coordinateSystem))
             coordinateSystem = "same as input"
-            gp.OutputCoordinateSystem = None
+            setOutputCoordinateSystem(None)
             pass
         return coordinateSystem
 
@@ -81,13 +831,13 @@ def setUpCoordSystemEnvironment(coordinateSystem, customCoordSystemFolder):
 
     # Search to see if we can find the spatial reference
     if not found:
-        srList = gp.ListSpatialReferences("*/%s" % coordinateSystem)
-        if srList:
-            coordinateSystemPath = os.path.join(os.path.join(gp.getinstallinfo()["InstallDir"], "Coordinate Systems"), srList[0]) + ".prj"
+        srName = findSystemCoordSystem(coordinateSystem)
+        if srName:
+            coordinateSystemPath = os.path.join(os.path.join(gp.getinstallinfo()["InstallDir"], "Coordinate Systems"), srName) + ".prj"
             found = True
 
     if found:
-        gp.OutputCoordinateSystem = coordinateSystemPath
+        setOutputCoordinateSystem(coordinateSystemPath)
         return coordinateSystemPath
     else:
         #Message "Couldn't find the specified projection file %s.  Output Coordinate System will be the same as the input layer's Coordinate System."
@@ -95,36 +845,224 @@ def setUpCoordSystemEnvironment(coordinateSystem, customCoordSystemFolder):
         return "same as input"
 
 def getPRJFile(inputCoordSysString, prjDir):
-    inputCoordSysString += ".prj"
-    # walk through the dirs to find the prj file
-    if os.path.exists(prjDir):
-        for x in os.walk(prjDir):
-            if inputCoordSysString in x[2]:
-                return True, os.path.join(x[0], inputCoordSysString)
-    else:
+    # look the prj file up by name, alias or WKID in the index of prjDir
+    if not os.path.exists(prjDir):
         return False, ""
+    index = getPRJIndex(prjDir)
+    key = inputCoordSysString.strip().lower()
+    if key.endswith(".prj"):
+        key = key[:-4]
+    key = index["aliases"].get(key, key)
+    path = index["names"].get(key) or index["wkids"].get(key)
+    if path:
+        return True, path
 
     # if we got to here then it didn't find the prj file
     return False, ""
 
+# prj index by folder, kept in memory for the life of the process
+prjIndexes = {}
+# {name: time} of the system lookups that found nothing (see prj_miss_seconds)
+prjMisses = {}
+
+def getPRJIndex(prjDir):
+    # returns {"names": {}, "wkids": {}, "aliases": {}} for prjDir.
+    # the folders are only re-listed when their modified time changes,
+    # and the listing is saved to prj_index_file so a restart doesn't crawl the folder again
+    prjDir = os.path.normpath(prjDir)
+    index = prjIndexes.get(prjDir)
+    if index is not None and time.time() - index["checked"] < prj_index_check_seconds:
+        return index
+
+    if index is None:
+        index = {"dirs": {}, "aliasFile": None, "checked": 0}
+        stored = loadPRJIndexFile().get(prjDir)
+        if stored is not None:
+            index["dirs"] = stored["dirs"]
+            index["aliasFile"] = stored.get("aliasFile")
+
+    changed = refreshPRJDirs(prjDir, index["dirs"])
+    aliasPath = os.path.join(prjDir, prj_alias_file)
+    aliasMTime = None
+    if os.path.exists(aliasPath):
+        aliasMTime = os.path.getmtime(aliasPath)
+    if index["aliasFile"] is None or index["aliasFile"]["mtime"] != aliasMTime or changed:
+        index["aliasFile"] = {"mtime": aliasMTime, "aliases": readPRJAliases(aliasPath)}
+        changed = True
+
+    if changed or "names" not in index:
+        buildPRJLookups(index)
+    if changed:
+        savePRJIndexFile(prjDir, index)
+    index["checked"] = time.time()
+    prjIndexes[prjDir] = index
+    return index
+
+def refreshPRJDirs(prjDir, dirs):
+    # re-list every folder whose modified time changed, returns True if anything changed
+    changed = False
+    pending = [prjDir]
+    seen = set()
+    while pending:
+        dirpath = pending.pop()
+        seen.add(dirpath)
+        try:
+            mtime = os.path.getmtime(dirpath)
+        except OSError:
+            continue
+        entry = dirs.get(dirpath)
+        if entry is None or entry["mtime"] != mtime:
+            entry = scanPRJDir(dirpath, entry)
+            entry["mtime"] = mtime
+            dirs[dirpath] = entry
+            changed = True
+        for subdir in entry["subdirs"]:
+            pending.append(os.path.join(dirpath, subdir))
+
+    # forget the folders that are gone
+    for dirpath in dirs.keys():
+        if dirpath not in seen:
+            del dirs[dirpath]
+            changed = True
+    return changed
+
+def scanPRJDir(dirpath, previous):
+    # list one folder; the WKID of a prj file is only read when the file is new
+    oldFiles = {}
+    if previous is not None:
+        oldFiles = previous["files"]
+    files = {}
+    subdirs = []
+    for name in os.listdir(dirpath):
+        path = os.path.join(dirpath, name)
+        if os.path.isdir(path):
+            subdirs.append(name)
+        elif name.lower().endswith(".prj"):
+            if name in oldFiles:
+                files[name] = oldFiles[name]
+            else:
+                files[name] = readPRJWKID(path)
+    return {"mtime": None, "files": files, "subdirs": subdirs}
+
+def readPRJWKID(path):
+    # the WKID is the last AUTHORITY in the WKT, or the file name when it is a number
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.isdigit():
+        return name
+    try:
+        prj = open(path, 'r')
+        wkt = prj.read()
+        prj.close()
+    except IOError:
+        return None
+    codes = re.findall(r'AUTHORITY\[\s*"[^"]*"\s*,\s*"?(\d+)"?\s*\]', wkt)
+    if codes:
+        return codes[-1]
+    return None
+
+def readPRJAliases(aliasPath):
+    # alias file lines look like "VT State Plane = NAD 1983 StatePlane Vermont FIPS 4400 (Meters)"
+    aliases = {}
+    if not os.path.exists(aliasPath):
+        return aliases
+    aliasFile = open(aliasPath, 'r')
+    for line in aliasFile:
+        line = line.strip()
+        if line == "" or line.startswith("#") or line.find("=") == -1:
+            continue
+        alias, name = line.split("=", 1)
+        aliases[alias.strip().lower()] = name.strip().lower()
+    aliasFile.close()
+    return aliases
+
+def buildPRJLookups(index):
+    # name/WKID -> path. when a name is in more than one folder the shallowest one wins,
+    # which is what walking the folders top down used to find
+    names = {}
+    wkids = {}
+    dirpaths = index["dirs"].keys()
+    dirpaths.sort(key=lambda d: (d.count(os.sep), d), reverse=True)
+    for dirpath in dirpaths:
+        for name, wkid in index["dirs"][dirpath]["files"].items():
+            path = os.path.join(dirpath, name)
+            names[name[:-4].lower()] = path
+            if wkid:
+                wkids[wkid] = path
+    index["names"] = names
+    index["wkids"] = wkids
+    index["aliases"] = index["aliasFile"]["aliases"]
+
+def loadPRJIndexFile():
+    if not os.path.exists(prj_index_file):
+        return {}
+    try:
+        indexFile = open(prj_index_file, 'r')
+        stored = json.load(indexFile)
+        indexFile.close()
+        return stored
+    except:
+        return {}
+
+def savePRJIndexFile(prjDir, index):
+    # the on disk index holds the folder listings (and system lookups) of every prjDir used
+    storePRJIndexEntry(prjDir, {"dirs": index["dirs"], "aliasFile": index["aliasFile"]})
+
+def storePRJIndexEntry(key, entry):
+    try:
+        stored = loadPRJIndexFile()
+        stored[key] = entry
+        tmpFile = prj_index_file + "." + str(os.getpid())
+        indexFile = open(tmpFile, 'w')
+        json.dump(stored, indexFile, separators=(',', ':'))
+        indexFile.close()
+        if os.path.exists(prj_index_file):
+            os.remove(prj_index_file)
+        os.rename(tmpFile, prj_index_file)
+    except:
+        gp.AddMessage("WARNING: Unable to save the coordinate system index to " + prj_index_file)
+
+def findSystemCoordSystem(coordinateSystem):
+    # ListSpatialReferences scans the whole install, so remember what it found for each name
+    systemIndex = prjIndexes.get(SYSTEM_PRJ_KEY)
+    if systemIndex is None:
+        # earlier versions saved the misses too, they are looked up again
+        stored = loadPRJIndexFile().get(SYSTEM_PRJ_KEY, {})
+        systemIndex = dict([(key, path) for key, path in stored.items() if path is not None])
+        prjIndexes[SYSTEM_PRJ_KEY] = systemIndex
+    key = coordinateSystem.strip().lower()
+    if key in systemIndex:
+        return systemIndex[key]
+    missed = prjMisses.get(key)
+    if missed is not None and time.time() - missed < prj_miss_seconds:
+        return None
+    srList = gp.ListSpatialReferences("*/%s" % coordinateSystem)
+    if not srList:
+        prjMisses[key] = time.time()
+        return None
+    prjMisses.pop(key, None)
+    systemIndex[key] = srList[0]
+    storePRJIndexEntry(SYSTEM_PRJ_KEY, systemIndex)
+    return systemIndex[key]
+
 def zipUpFolder(folder, outZipFile):
     # zip the data
+    started = time.time()
     try:
-        zip = zipfile.ZipFile(outZipFile, 'w', zipfile.ZIP_DEFLATED)
+        zip = zipfile.ZipFile(outZipFile, 'w', zipfile.ZIP_DEFLATED, True)
         zipws(str(folder), zip, "CONTENTS_ONLY")
         zip.close()
     except RuntimeError:
         # Delete zip file if exists
         if os.path.exists(outZipFile):
             os.unlink(outZipFile)
-        zip = zipfile.ZipFile(outZipFile, 'w', zipfile.ZIP_STORED)
+        zip = zipfile.ZipFile(outZipFile, 'w', zipfile.ZIP_STORED, True)
         zipws(str(folder), zip, "CONTENTS_ONLY")
         zip.close()
         #Message"  Unable to compress zip file contents."
         msg = get_ID_message(86133)
         gp.AddWarning(msg)
         Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
-        
+    jobMetrics.record("zipws", None, time.time() - started, os.path.getsize(outZipFile))
         
 
 def zipws(path, zip, keep):
@@ -139,12 +1077,7 @@ def zipws(path, zip, keep):
             if not file.endswith('.lock'):
                 #gp.AddMessage("Adding %s..." % os.path.join(path, dirpath, file))
                 try:
-                    if keep:
-                        zip.write(os.path.join(dirpath, file),
-                        os.path.join(os.path.basename(path), os.path.join(dirpath, file)[len(path)+len(os.sep):]))
-                    else:
-                        zip.write(os.path.join(dirpath, file),
-                        os.path.join(dirpath[len(path):], file))
+                    writeZipMember(zip, os.path.join(dirpath, file), zipArcName(path, dirpath, file, keep))
 
                 except Exception as e:
                     #Message "    Error adding %s: %s"
@@ -153,27 +1086,471 @@ def zipws(path, zip, keep):
                     Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
     return None
 
+def zipArcName(path, dirpath, file, keep):
+    # name of a file inside the zip, relative to the folder being zipped
+    if keep:
+        return os.path.join(os.path.basename(path), os.path.join(dirpath, file)[len(path)+len(os.sep):])
+    else:
+        return os.path.join(dirpath[len(path):], file)
+
+def chooseZipCompression(filepath, size):
+    # ZIP_STORED for files that won't get noticeably smaller (jpeg/lzw tiffs, jp2, sid, ...)
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext in zip_stored_extensions:
+        return zipfile.ZIP_STORED
+    if ext in zip_deflated_extensions or size < zip_probe_min_bytes:
+        return zipfile.ZIP_DEFLATED
+    sampled = 0
+    deflated = 0
+    probeFile = open(filepath, 'rb')
+    try:
+        for i in range(zip_probe_samples):
+            probeFile.seek(size * i // zip_probe_samples)
+            block = probeFile.read(zip_probe_bytes)
+            sampled += len(block)
+            deflated += len(zlib.compress(block, 1))
+    finally:
+        probeFile.close()
+    if deflated > sampled * zip_probe_ratio:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def writeZipMember(zip, filepath, arcname):
+    # ZipFile.write with the compression chosen per file and zip_copy_chunk buffers rather
+    # than 8k ones, so storing a large raster is a straight copy
+    st = os.stat(filepath)
+    compress_type = zipfile.ZIP_STORED
+    if zip.compression == zipfile.ZIP_DEFLATED:
+        compress_type = chooseZipCompression(filepath, st.st_size)
+
+    arcname = os.path.normpath(os.path.splitdrive(arcname)[1]).lstrip(os.sep)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.compress_type = compress_type
+    zinfo.file_size = st.st_size
+    zinfo.flag_bits = 0x00
+    zinfo.header_offset = zip.fp.tell()
+    zip._writecheck(zinfo)
+    zip._didModify = True
+
+    # sizes and crc are written again once they are known
+    zinfo.CRC = 0
+    zinfo.compress_size = 0
+    zip64 = zip._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    zip.fp.write(zinfo.FileHeader(zip64))
+    compressor = None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    crc = 0
+    file_size = 0
+    compress_size = 0
+    memberFile = open(filepath, 'rb')
+    try:
+        while True:
+            buf = memberFile.read(zip_copy_chunk)
+            if not buf:
+                break
+            file_size += len(buf)
+            crc = zlib.crc32(buf, crc) & 0xffffffff
+            if compressor is not None:
+                buf = compressor.compress(buf)
+            compress_size += len(buf)
+            zip.fp.write(buf)
+    finally:
+        memberFile.close()
+    if compressor is not None:
+        buf = compressor.flush()
+        compress_size += len(buf)
+        zip.fp.write(buf)
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    zinfo.compress_size = compress_size
+    if not zip64 and (file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT):
+        raise RuntimeError(filepath + " grew past the zip64 limit while it was zipped")
+
+    position = zip.fp.tell()
+    zip.fp.seek(zinfo.header_offset, 0)
+    zip.fp.write(zinfo.FileHeader(zip64))
+    zip.fp.seek(position, 0)
+    zip.filelist.append(zinfo)
+    zip.NameToInfo[zinfo.filename] = zinfo
+
+def listOutputFiles(outputpath):
+    # files that make up a clipped output that can be zipped on its own (shp, tif, dxf, ...).
+    # outputs inside a gdb/mdb and GRIDs (which share the info folder) are left for the final sweep.
+    # a folder output (ie. a raster tile set) is zipped as a whole
+    outwkspc, outName = os.path.split(outputpath)
+    if os.path.splitext(outwkspc)[1].lower() in [".gdb", ".mdb"]:
+        return []
+    if os.path.isdir(outputpath):
+        if os.path.exists(os.path.join(outputpath, "hdr.adf")):
+            return []
+        return [os.path.join(dirpath, file) for (dirpath, dirnames, filenames) in os.walk(outputpath) for file in filenames]
+    baseName = os.path.splitext(outName)[0]
+    files = []
+    if os.path.isdir(outwkspc):
+        for file in os.listdir(outwkspc):
+            if file == baseName or file.startswith(baseName + "."):
+                if os.path.isfile(os.path.join(outwkspc, file)):
+                    files.append(os.path.join(outwkspc, file))
+    return files
+
+class ZipStream(object):
+    # Zips layer outputs on a background thread while the remaining layers are being clipped.
+    # Uses the same .lock filtering and arcname layout as zipUpFolder/zipws.
+    def __init__(self, folder, outZipFile):
+        self.path = os.path.normpath(str(folder))
+        self.outZipFile = outZipFile
+        self.added = set()
+        self.warnings = []
+        self.compressed = True
+        self.compressSeconds = 0.0
+        self.layerZipSeconds = 0.0
+        try:
+            self.zip = zipfile.ZipFile(outZipFile, 'w', zipfile.ZIP_DEFLATED, True)
+        except RuntimeError:
+            # Delete zip file if exists
+            if os.path.exists(outZipFile):
+                os.unlink(outZipFile)
+            self.zip = zipfile.ZipFile(outZipFile, 'w', zipfile.ZIP_STORED, True)
+            self.compressed = False
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def addOutput(self, outputpath):
+        # queue the files of a finished layer, they are compressed while the next layers clip
+        return self.addLayer(None, [outputpath])
+
+    def addLayer(self, lyr, outputs):
+        # queue the files of all the outputs of a finished layer, False when it has no files of
+        # its own (datasets in a gdb/mdb are zipped with their gdb when the zip is closed)
+        files = []
+        for outputpath in outputs:
+            files.extend(listOutputFiles(outputpath))
+        if not files:
+            return False
+        self.queue.put((lyr, files))
+        return True
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            lyr, files = item
+            started = time.time()
+            for filepath in files:
+                self._write(filepath)
+            self.compressSeconds += time.time() - started
+            if lyr is not None:
+                self._layerZip(lyr, files)
+
+    def _layerZip(self, lyr, files):
+        # the layer's files in a zip of their own, published once it is complete
+        started = time.time()
+        details = {"bytes": sum([os.path.getsize(filepath) for filepath in files if os.path.exists(filepath)])}
+        if jobProgress.layerFolder is not None:
+            baseName = re.sub(r"[^\w.-]", "_", os.path.basename(lyr.replace("\\", os.sep)))
+            name = baseName + ".zip"
+            # layers of the same name from different services
+            taken = 1
+            while os.path.exists(os.path.join(jobProgress.layerFolder, name)):
+                taken += 1
+                name = baseName + "_" + str(taken) + ".zip"
+            layerZipFile = os.path.join(jobProgress.layerFolder, name)
+            try:
+                zip = zipfile.ZipFile(layerZipFile + ".part", 'w', self.zip.compression, True)
+                for filepath in files:
+                    dirpath, file = os.path.split(os.path.normpath(filepath))
+                    if not file.endswith('.lock'):
+                        writeZipMember(zip, filepath, zipArcName(self.path, dirpath, file, "CONTENTS_ONLY"))
+                zip.close()
+                os.rename(layerZipFile + ".part", layerZipFile)
+                details["bytes"] = os.path.getsize(layerZipFile)
+                details["zip"] = name
+            except Exception as e:
+                self.warnings.append((name, e))
+                if os.path.exists(layerZipFile + ".part"):
+                    os.remove(layerZipFile + ".part")
+            self.layerZipSeconds += time.time() - started
+        jobProgress.layer(lyr, "zipped", **details)
+
+    def _write(self, filepath):
+        filepath = os.path.normpath(filepath)
+        dirpath, file = os.path.split(filepath)
+        # Ignore .lock files and files that are already in the zip
+        key = os.path.normcase(filepath)
+        if file.endswith('.lock') or key in self.added:
+            return
+        self.added.add(key)
+        try:
+            writeZipMember(self.zip, filepath, zipArcName(self.path, dirpath, file, "CONTENTS_ONLY"))
+        except Exception as e:
+            # gp isn't safe to use from this thread, warnings are reported on close
+            self.warnings.append((file, e))
+
+    def close(self):
+        # wait for the queued layers, then sweep up everything else in the folder
+        started = time.time()
+        self.queue.put(None)
+        self.thread.join()
+        for (dirpath, dirnames, filenames) in os.walk(self.path):
+            for file in filenames:
+                self._write(os.path.join(dirpath, file))
+        self.zip.close()
+        # zip_stream is the time spent compressing next to the clips, zipws the time the job waited on the zip
+        jobMetrics.record("zip_stream", None, self.compressSeconds)
+        if self.layerZipSeconds:
+            jobMetrics.record("layer_zips", None, self.layerZipSeconds)
+        jobMetrics.record("zipws", None, time.time() - started, os.path.getsize(self.outZipFile))
+
+        for file, e in self.warnings:
+            #Message "    Error adding %s: %s"
+            msg = get_ID_message(86134) % (file, e[0])
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+        if not self.compressed:
+            #Message"  Unable to compress zip file contents."
+            msg = get_ID_message(86133)
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+
+    def abort(self):
+        # stop the zip thread and release the zip file after a failure
+        self.queue.put(None)
+        self.thread.join()
+        self.zip.close()
+
 def createFolderInScratch(folderName):
     # create the folders necessary for the job
-    folderPath = gp.CreateUniqueName(folderName, gp.scratchworkspace)
-    gp.CreateFolder_management(gp.scratchworkspace, os.path.basename(folderPath))
+    if workspaceLock is not None:
+        workspaceLock.acquire()
+    try:
+        folderPath = gp.CreateUniqueName(folderName, gp.scratchworkspace)
+        gp.CreateFolder_management(gp.scratchworkspace, os.path.basename(folderPath))
+    finally:
+        if workspaceLock is not None:
+            workspaceLock.release()
     return folderPath
 
 def getTempLocationPath(folderPath, format):
+    # parallel clip workers share the zip folder, only one of them may create the gdb/mdb
+    if workspaceLock is not None:
+        workspaceLock.acquire()
+    try:
+        return _getTempLocationPath(folderPath, format)
+    finally:
+        if workspaceLock is not None:
+            workspaceLock.release()
+
+def _getTempLocationPath(folderPath, format):
     # make sure there is a location to write to for gdb and mdb
     if format == "mdb":
         MDBPath = os.path.join(folderPath, "data.mdb")
-        if not gp.exists(MDBPath):
+        if not gp.exists(MDBPath) and not copyScratchTemplate(folderPath, "mdb"):
             gp.CreatePersonalGDB_management(folderPath, "data")
         return MDBPath
     elif format == "gdb":
         GDBPath = os.path.join(folderPath, "data.gdb")
-        if not gp.exists(GDBPath):
+        if not gp.exists(GDBPath) and not copyScratchTemplate(folderPath, "gdb"):
             gp.CreateFileGDB_management(folderPath, "data")
         return GDBPath
     else:
         return folderPath
 
+def scratchPoolPath(*parts):
+    # ready/ workspaces waiting for a job, used/ claimed by a job, building/ being made,
+    # trash/ being deleted, template/ the empty gdb and mdb that are copied
+    return os.path.join(scratch_pool_folder, *parts)
+
+def scratchTemplate(format):
+    # the pool's empty data.gdb/data.mdb, made once with the geoprocessor and copied from then on
+    template = scratchPoolPath("template", "data." + format)
+    if os.path.exists(template):
+        return template
+    # made aside first, another process may be making it too
+    buildDir = tempfile.mkdtemp(prefix="template_", dir=scratchPoolPath("building"))
+    try:
+        if format == "mdb":
+            gp.CreatePersonalGDB_management(buildDir, "data")
+        else:
+            gp.CreateFileGDB_management(buildDir, "data")
+        try:
+            os.rename(os.path.join(buildDir, "data." + format), template)
+        except OSError:
+            if not os.path.exists(template):
+                raise
+    finally:
+        shutil.rmtree(buildDir, True)
+    return template
+
+def copyScratchTemplate(folderPath, format):
+    # copy the pool's empty gdb/mdb into folderPath, False when there is no pool or it didn't work
+    if scratch_pool_folder == "":
+        return False
+    target = os.path.join(folderPath, "data." + format)
+    try:
+        template = scratchTemplate(format)
+        if os.path.isdir(template):
+            shutil.copytree(template, target, ignore=shutil.ignore_patterns("*.lock"))
+        else:
+            shutil.copyfile(template, target)
+        return True
+    except:
+        if os.path.isdir(target):
+            shutil.rmtree(target, True)
+        elif os.path.exists(target):
+            os.remove(target)
+        return False
+
+def buildScratchWorkspace():
+    # an empty zip folder and a scratch folder with its gdb, moved into ready/ once complete.
+    # only copies files, so it can run on a thread next to the geoprocessor
+    buildDir = tempfile.mkdtemp(dir=scratchPoolPath("building"))
+    try:
+        os.mkdir(os.path.join(buildDir, "zipfolder"))
+        os.mkdir(os.path.join(buildDir, "scratchfolder"))
+        shutil.copytree(scratchPoolPath("template", "data.gdb"), os.path.join(buildDir, "scratchfolder", "data.gdb"),
+                        ignore=shutil.ignore_patterns("*.lock"))
+        entryId = os.path.basename(buildDir)
+        os.rename(buildDir, scratchPoolPath("ready", entryId))
+        return entryId
+    except:
+        shutil.rmtree(buildDir, True)
+        raise
+
+def claimScratchWorkspace():
+    # (zipFolderPath, scratchFolderPath) of a ready workspace of the pool, None when the pool is
+    # off or can't be used. Moving the workspace into used/ is what claims it, other jobs skip it
+    global scratchPoolEntry
+    if scratch_pool_folder == "":
+        return None
+    try:
+        for folder in ["ready", "used", "building", "trash", "template"]:
+            if not os.path.isdir(scratchPoolPath(folder)):
+                try:
+                    os.makedirs(scratchPoolPath(folder))
+                except OSError:
+                    pass
+        # the template is made here, on the job's thread, the refill only copies it
+        scratchTemplate("gdb")
+        entry = None
+        while entry is None:
+            ready = os.listdir(scratchPoolPath("ready"))
+            if not ready:
+                # the pool ran dry, this job waits for one workspace to be built
+                ready = [buildScratchWorkspace()]
+            for entryId in ready:
+                try:
+                    os.rename(scratchPoolPath("ready", entryId), scratchPoolPath("used", entryId))
+                except OSError:
+                    continue
+                entry = scratchPoolPath("used", entryId)
+                break
+        # the age of a workspace counts from when it was claimed
+        open(os.path.join(entry, "_claimed"), 'w').close()
+        scratchPoolEntry = entry
+    except:
+        gp.AddMessage("WARNING: Unable to use the scratch pool, creating the job folders in the scratch workspace: " + str(sys.exc_info()[1]))
+        return None
+    startScratchPoolMaintenance()
+    return os.path.join(entry, "zipfolder"), os.path.join(entry, "scratchfolder")
+
+def releaseScratchWorkspace(maintain=True):
+    # the job is done with its workspace, it is kept scratch_pool_keep_seconds and then purged.
+    # maintain=False leaves the purge and refill to the next job that claims a workspace
+    global scratchPoolEntry
+    if scratchPoolEntry is None:
+        return
+    try:
+        open(os.path.join(scratchPoolEntry, "_released"), 'w').close()
+    except IOError:
+        pass
+    scratchPoolEntry = None
+    if maintain:
+        startScratchPoolMaintenance()
+
+def startScratchPoolMaintenance():
+    global scratchPoolThread
+    if scratchPoolThread is not None and scratchPoolThread.isAlive():
+        return
+    scratchPoolThread = threading.Thread(target=maintainScratchPool)
+    scratchPoolThread.daemon = True
+    scratchPoolThread.start()
+
+def waitForScratchPool():
+    # let the refill and purge finish before a long running process exits. everything the
+    # maintenance does can be cut short, so the tool leaves without waiting for it
+    if scratchPoolThread is not None:
+        scratchPoolThread.join()
+
+def maintainScratchPool():
+    # purge what the jobs are done with, then refill the ready workspaces. runs on a thread,
+    # so it never calls the geoprocessor; what fails is tried again the next time
+    try:
+        purgeScratchPool()
+        for i in range(scratch_pool_size - len(os.listdir(scratchPoolPath("ready")))):
+            buildScratchWorkspace()
+    except:
+        pass
+
+def trashScratchWorkspace(entry):
+    # moved out of the way first so a half deleted workspace is never mistaken for a live one.
+    # a workspace with files still open can't be moved (windows), it is tried again the next time
+    try:
+        os.rename(entry, scratchPoolPath("trash", os.path.basename(entry)))
+        return True
+    except OSError:
+        return False
+
+def scratchWorkspaceSize(entry):
+    try:
+        return folderSize(entry)
+    except OSError:
+        # a running job removed a file while it was counted
+        return 0
+
+def purgeScratchPool():
+    now = time.time()
+    for entryId in os.listdir(scratchPoolPath("building")):
+        # left behind by a process that died while it was building
+        entry = scratchPoolPath("building", entryId)
+        if now - os.path.getmtime(entry) > scratch_pool_max_age:
+            shutil.rmtree(entry, True)
+
+    # workspaces of finished jobs go after scratch_pool_keep_seconds, of jobs that never
+    # finished after scratch_pool_max_age. running jobs count toward the quota but stay
+    finished = []
+    total = 0
+    for entryId in os.listdir(scratchPoolPath("used")):
+        entry = scratchPoolPath("used", entryId)
+        released = os.path.join(entry, "_released")
+        claimed = os.path.join(entry, "_claimed")
+        if os.path.exists(released):
+            releasedTime = os.path.getmtime(released)
+            if now - releasedTime > scratch_pool_keep_seconds and trashScratchWorkspace(entry):
+                continue
+            size = scratchWorkspaceSize(entry)
+            finished.append((releasedTime, entry, size))
+        else:
+            claimedTime = os.path.exists(claimed) and os.path.getmtime(claimed) or os.path.getmtime(entry)
+            if now - claimedTime > scratch_pool_max_age and trashScratchWorkspace(entry):
+                continue
+            size = scratchWorkspaceSize(entry)
+        total += size
+    finished.sort()
+    for releasedTime, entry, size in finished:
+        if total <= scratch_pool_maxbytes:
+            break
+        if trashScratchWorkspace(entry):
+            total -= size
+
+    # a pass deletes at most scratch_pool_purge_batch workspaces so it never keeps a job waiting
+    for entryId in os.listdir(scratchPoolPath("trash"))[:scratch_pool_purge_batch]:
+        shutil.rmtree(scratchPoolPath("trash", entryId), True)
+
 def makeOutputPath(raster, inLayerName, convert, formatList, zipFolderPath, scratchFolderPath):
     outFormat = formatList[1].lower()
 
@@ -184,31 +1561,225 @@ def makeOutputPath(raster, inLayerName, convert, formatList, zipFolderPath, scra
     else:
         outwkspc = getTempLocationPath(scratchFolderPath, "gdb")
 
-    if inLayerName.find("\\"):
-        inLayerName = inLayerName.split("\\")[-1]
-
-    # make sure there are no spaces in the out raster name and make sure its less than 13 chars
-    if outFormat == "grid":
-        if len(inLayerName) > 12:
-            inLayerName = inLayerName[:12]
-        if inLayerName.find(" ") > -1:
-            inLayerName = inLayerName.replace(" ", "_")
-
-    # make the output path
-    tmpName = os.path.basename(gp.createuniquename(inLayerName, outwkspc))
-    tmpName = gp.validatetablename(tmpName, outwkspc)
+    # map layers come as group\\layer, batch intermediates as paths in the scratch gdb
+    inLayerName = os.path.basename(inLayerName.replace("\\", os.sep))
+    inLayerName = sanitizedOutputName(inLayerName, outFormat, outwkspc)
 
     # do some extension housekeeping.
     # Raster formats and shp always need to put the extension at the end
+    ext = ""
     if raster or outFormat == "shp":
         if outFormat != "gdb" and outFormat != "mdb" and outFormat != "grid":
-            tmpName = tmpName + formatList[2].lower()
+            ext = formatList[2].lower()
+
+    # make the output path. parallel clip workers share the zip folder, the name is reserved
+    # so two layers of the same name don't get the same output
+    if convert and workspaceLock is not None:
+        workspaceLock.acquire()
+        try:
+            tmpName = reserveOutputName(inLayerName, outwkspc, ext)
+        finally:
+            workspaceLock.release()
+    else:
+        tmpName = os.path.basename(gp.createuniquename(inLayerName, outwkspc))
+    tmpName = tmpName + ext
 
     outputpath = os.path.join(outwkspc, tmpName)
+    noteAttemptOutput(outputpath)
 
     return tmpName, outputpath
 
-def clipRaster(lyr, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataType, aoi_area, aoi_ext):
+def reserveOutputName(name, outwkspc, ext=""):
+    # a name for an output in outwkspc that no dataset there has and no other clip worker has
+    # taken, held by a .lock file (never zipped) until the output is written. a lock without
+    # ext holds every file of that base name (restored cache files). called with workspaceLock held
+    folder = outwkspc
+    if os.path.splitext(outwkspc)[1].lower() in [".gdb", ".mdb"]:
+        folder = os.path.dirname(outwkspc)
+    prefix = "." + os.path.basename(outwkspc) + "."
+    candidate = os.path.basename(gp.createuniquename(name, outwkspc))
+    n = 0
+    while os.path.exists(os.path.join(folder, prefix + candidate + ext + ".lock")) or \
+          os.path.exists(os.path.join(folder, prefix + candidate + ".lock")):
+        candidate = os.path.basename(gp.createuniquename(name + str(n), outwkspc))
+        n += 1
+    open(os.path.join(folder, prefix + candidate + ext + ".lock"), 'w').close()
+    return candidate
+
+def makeZipOutputPath(layerName, ext, zipFolderPath):
+    # the file a conversion writes into the zip folder. in a clip worker the layer name comes
+    # from the worker's own scratch gdb, another worker may be converting a layer of the same name
+    if workspaceLock is None:
+        outputpath = os.path.join(zipFolderPath, layerName + ext)
+    else:
+        workspaceLock.acquire()
+        try:
+            outputpath = os.path.join(zipFolderPath, reserveOutputName(layerName, zipFolderPath, ext) + ext)
+        finally:
+            workspaceLock.release()
+    noteAttemptOutput(outputpath)
+    return outputpath
+
+def planRasterTiles(aoi_ext, cellX, cellY, originX, originY, tilePixels):
+    # split aoi_ext into tiles of tilePixels x tilePixels cells whose edges fall on the cell
+    # boundaries of the source raster. returns [(row, col, "xmin ymin xmax ymax"), ...]
+    xmin, ymin, xmax, ymax = [float(v) for v in str(aoi_ext).split()[:4]]
+    xmin = originX + math.floor((xmin - originX) / cellX) * cellX
+    ymin = originY + math.floor((ymin - originY) / cellY) * cellY
+    xmax = originX + math.ceil((xmax - originX) / cellX) * cellX
+    ymax = originY + math.ceil((ymax - originY) / cellY) * cellY
+    tileWidth = tilePixels * cellX
+    tileHeight = tilePixels * cellY
+    cols = int(math.ceil(round((xmax - xmin) / tileWidth, 6)))
+    rows = int(math.ceil(round((ymax - ymin) / tileHeight, 6)))
+    tiles = []
+    for row in range(rows):
+        # row 0 is the top of the aoi
+        tymax = ymax - row * tileHeight
+        tymin = max(tymax - tileHeight, ymin)
+        for col in range(cols):
+            txmin = xmin + col * tileWidth
+            txmax = min(txmin + tileWidth, xmax)
+            tiles.append((row, col, "%r %r %r %r" % (txmin, tymin, txmax, tymax)))
+    return tiles
+
+def readRasterProperty(lyr, property):
+    return str(gp.GetRasterProperties_management(lyr, property).getOutput(0)).replace(",", ".")
+
+def getRasterProperty(lyr, property):
+    # the properties of raster_registry_properties come from the layer registry with the rest of describe
+    if not os.path.isabs(lyr):
+        properties = describeLayer(lyr).rasterProperties
+        if properties is not None and property in properties:
+            return properties[property]
+    return readRasterProperty(lyr, property)
+
+def planRasterTilesForLayer(lyr, aoi_ext, tiled):
+    # returns the tiles to clip lyr with, or None when it should be clipped in one go
+    if raster_tile_pixels <= 0:
+        return None
+    cellX = float(getRasterProperty(lyr, "CELLSIZEX"))
+    cellY = float(getRasterProperty(lyr, "CELLSIZEY"))
+    xmin, ymin, xmax, ymax = [float(v) for v in str(aoi_ext).split()[:4]]
+    if not tiled and max((xmax - xmin) / cellX, (ymax - ymin) / cellY) <= raster_tile_pixels:
+        return None
+    extent = describeLayer(lyr).extent
+    return planRasterTiles(aoi_ext, cellX, cellY, extent.XMin, extent.YMin, raster_tile_pixels)
+
+def initTileWorker(settings):
+    # runs once in every worker process of the tile pool
+    global workerSettings
+    workerSettings = settings
+    gp.pyramid = "NONE"
+    gp.rasterStatistics = "NONE"
+    if settings["outputCoordinateSystem"] is not None:
+        setOutputCoordinateSystem(settings["outputCoordinateSystem"])
+
+# The geoprocessor of a tile thread (see initTileThread)
+tileThreads = threading.local()
+
+def initTileThread(settings):
+    # runs once in every tile thread of a clip worker. a geoprocessor isn't shared between
+    # threads, each gets its own (the fake geoprocessor of the benchmark is shared)
+    if arcgisscripting is None:
+        return
+    tileGp = arcgisscripting.create(10.1)
+    tileGp.pyramid = "NONE"
+    tileGp.rasterStatistics = "NONE"
+    if settings["outputCoordinateSystem"] is not None:
+        tileGp.OutputCoordinateSystem = settings["outputCoordinateSystem"]
+    tileThreads.gp = tileGp
+
+def clipRasterTile(task):
+    # clip one tile, returns an error message or None
+    lyr, tileExtent, tilePath = task
+    tileGp = getattr(tileThreads, "gp", gp)
+    try:
+        tileGp.clip_management(lyr, tileExtent, tilePath)
+        return None
+    except:
+        return "failed to clip tile " + tileExtent + ": " + tileGp.GetMessages(2)
+
+def clipRasterTiled(lyr, tiles, rasterFormat, outputpath, scratchFolderPath):
+    # clip lyr tile by tile so no single clip holds the whole aoi in memory.
+    # returns the mosaicked raster or, with raster_tile_output = "TILESET", the folder of tiles
+    outputName = os.path.splitext(os.path.basename(outputpath))[0]
+    if raster_tile_output == "TILESET":
+        tileFolder = os.path.join(os.path.dirname(outputpath), outputName + "_tiles")
+        if os.path.splitext(os.path.dirname(outputpath))[1].lower() in [".gdb", ".mdb"]:
+            tileFolder = os.path.join(os.path.dirname(os.path.dirname(outputpath)), outputName + "_tiles")
+        os.mkdir(tileFolder)
+        tilewkspc = _getTempLocationPath(tileFolder, rasterFormat[1].lower())
+        tileExt = ""
+        if rasterFormat[1].lower() not in ["gdb", "mdb", "grid"]:
+            tileExt = rasterFormat[2].lower()
+    else:
+        # the tiles are only intermediate, keep them as tif in the scratch folder
+        tileFolder = os.path.join(scratchFolderPath, outputName + "_tiles")
+        os.mkdir(tileFolder)
+        tilewkspc = tileFolder
+        tileExt = ".tif"
+
+    tasks = []
+    for row, col, tileExtent in tiles:
+        tasks.append((lyr, tileExtent, os.path.join(tilewkspc, "tile_%03d_%03d%s" % (row, col, tileExt))))
+
+    # clip the tiles in a pool of processes, or of threads in a clip worker (they can't have children)
+    started = time.time()
+    workerCount = min(raster_tile_workers, len(tasks))
+    if workerCount > 1:
+        outputCoordinateSystem = gp.OutputCoordinateSystem
+        if outputCoordinateSystem is not None and hasattr(outputCoordinateSystem, "exportToString"):
+            outputCoordinateSystem = outputCoordinateSystem.exportToString()
+        settings = {"outputCoordinateSystem": outputCoordinateSystem}
+        if multiprocessing.current_process().daemon:
+            pool = multiprocessing.pool.ThreadPool(workerCount, initTileThread, (settings,))
+        else:
+            if sys.platform == "win32":
+                multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+            pool = multiprocessing.Pool(workerCount, initTileWorker, (settings,))
+        try:
+            errors = pool.map(clipRasterTile, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        errors = [clipRasterTile(task) for task in tasks]
+    jobMetrics.record("clip_tiles", lyr, time.time() - started)
+
+    errors = [error for error in errors if error is not None]
+    if errors:
+        for error in errors:
+            Append2Log("<strong><font color='red'>" + error + "</font></strong>",TargetLogFile)
+        # the layer may be tried again
+        shutil.rmtree(tileFolder, True)
+        raise RuntimeError(errors[0])
+
+    if raster_tile_output == "TILESET":
+        # index of the tiles and their extents
+        indexFile = open(os.path.join(tileFolder, outputName + "_tiles.csv"), 'w')
+        indexFile.write("tile,row,col,xmin,ymin,xmax,ymax\n")
+        for (row, col, tileExtent), task in zip(tiles, tasks):
+            indexFile.write(",".join([os.path.basename(task[2]), str(row), str(col)] + tileExtent.split()) + "\n")
+        indexFile.close()
+        msg = "-> wrote " + str(len(tasks)) + " tiles and index to " + tileFolder
+        gp.AddMessage(msg)
+        Append2Log(msg,TargetLogFile)
+        return tileFolder
+
+    # mosaic the tiles back into the requested output, keeping the pixel type and bands of the source
+    pixelType = raster_pixel_types.get(getRasterProperty(lyr, "VALUETYPE"), "#")
+    bandCount = getRasterProperty(lyr, "BANDCOUNT")
+    msg = "-> mosaicking " + str(len(tasks)) + " tiles into " + outputpath
+    gp.AddMessage(msg)
+    Append2Log(msg,TargetLogFile)
+    timedCall("mosaic", lyr, gp.MosaicToNewRaster_management, ";".join([task[2] for task in tasks]), os.path.dirname(outputpath),
+              os.path.basename(outputpath), "#", pixelType, "#", bandCount, "FIRST")
+    shutil.rmtree(tileFolder, True)
+    return outputpath
+
+def clipRaster(lyr, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataType, aoi_area, aoi_ext, tiled=False):
+    # tiled=True clips the raster as tiles even if the aoi is smaller than raster_tile_pixels
     # get the path and a validated name for the output
     layerName, outputpath = makeOutputPath(True, lyr, True, rasterFormat, zipFolderPath, scratchFolderPath)
     outputFormat = rasterFormat[1].upper()
@@ -226,14 +1797,25 @@ def clipRaster(lyr, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataTyp
 ##        gp.compression = "RLE"
     # do the clip
     try:
-        if dataType == "mosaiclayer":
+        tiles = planRasterTilesForLayer(lyr, aoi_ext, tiled)
+        if tiles:
+            msg = "-> clipping " + lyr + " as " + str(len(tiles)) + " tiles of " + str(raster_tile_pixels) + " pixels...."
+            gp.AddMessage(msg)
+            Append2Log(msg,TargetLogFile)
+            outputpath = clipRasterTiled(lyr, tiles, rasterFormat, outputpath, scratchFolderPath)
+            #Message "  clipped %s..."
+            gp.AddIDMessage("INFORMATIVE", 86135, lyr)
+            msg = "-> clipped " + lyr
+            Append2Log(msg,TargetLogFile)
+
+        elif dataType == "mosaiclayer":
             msg = "-> this is a mosaic layer...."
             gp.AddMessage(msg)
             Append2Log(msg,TargetLogFile)
             msg = "-> running clip_management(" + lyr + "," + str(aoi_ext) + "," + outputpath + ")"
             gp.AddMessage(msg)
             Append2Log(msg,TargetLogFile)
-            gp.clip_management(lyr, str(aoi_ext), outputpath)
+            timedCall("clip_management", lyr, gp.clip_management, lyr, str(aoi_ext), outputpath)
             #Message "  clipped %s..."
             gp.AddIDMessage("INFORMATIVE", 86135, lyr)
             msg = "-> clipped " + lyr
@@ -246,14 +1828,18 @@ def clipRaster(lyr, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataTyp
             msg = "-> running clip_management(" + lyr + "," + str(aoi_ext) + "," + outputpath + ")"
             gp.AddMessage(msg)
             Append2Log(msg,TargetLogFile)
-            gp.clip_management(lyr, str(aoi_ext), outputpath)
+            timedCall("clip_management", lyr, gp.clip_management, lyr, str(aoi_ext), outputpath)
             #gp.clip_management(lyr, "0 0 1 1", outputpath, aoi, "#", "ClippingGeometry")
             #Message "  clipped %s..."
             gp.AddIDMessage("INFORMATIVE", 86135, lyr)
             msg = "-> clipped " + lyr
             Append2Log(msg,TargetLogFile)
+        return outputpath
                 
     except:
+        # transient errors are retried by runLayerTask
+        if isTransientError(str(sys.exc_info()[1])):
+            raise
         errmsg = gp.getmessages(2)
         #Message "  failed to clip layer %s..."
         msg = get_ID_message(86136) % lyr
@@ -280,42 +1866,266 @@ def clipRaster(lyr, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataTyp
             Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
         pass
 
-def clipFeatures(lyr, aoi, featureFormat, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area):
-    global haveDataInterop
+def makeWriterOutputPath(inLayerName, formatList, zipFolderPath):
+    # features written by a python writer are clipped in memory and written
+    # straight to a file in the zip folder
+    inLayerName = os.path.basename(inLayerName.replace("\\", os.sep))
+    memoryName = os.path.basename(gp.createuniquename(gp.validatetablename(inLayerName, "in_memory"), "in_memory"))
+    if workspaceLock is not None:
+        workspaceLock.acquire()
     try:
-        # get the path and a validated name for the output
-        layerName, outputpath = makeOutputPath(False, lyr, convertFeaturesDuringClip, featureFormat, zipFolderPath, scratchFolderPath)
-        msg = "-> Running clip operation on " + lyr + "...."
-        Append2Log(msg,TargetLogFile)
-        gp.AddMessage(msg)
-        # do the clip
-        msg = "-> running clip_analysis(" + lyr + "," + str(aoi) + "," + outputpath + ")"
-        gp.AddMessage(msg)
-        Append2Log(msg,TargetLogFile)
-        gp.clip_analysis(lyr, aoi, outputpath)
-        #Message "  clipped %s..."
-        msg = "-> Successfully clipped " + lyr
-        Append2Log(msg,TargetLogFile)
-        gp.AddIDMessage("INFORMATIVE", 86135, lyr)
+        fileName = os.path.basename(gp.createuniquename(gp.validatetablename(inLayerName, zipFolderPath) + formatList[2].lower(), zipFolderPath))
+        # hold the name until the writer opens the file
+        open(os.path.join(zipFolderPath, fileName), 'w').close()
+    finally:
+        if workspaceLock is not None:
+            workspaceLock.release()
+    noteAttemptOutput(os.path.join(zipFolderPath, fileName))
+    return os.path.join("in_memory", memoryName), os.path.join(zipFolderPath, fileName)
 
-        # if format needs data interop, convert with data interop
-        if not convertFeaturesDuringClip:
-            # get path to zip
-            outputinzip = os.path.join(zipFolderPath, layerName + featureFormat[2])
-            if featureFormat[2].lower() in [".dxf", ".dwg", ".dgn"]:
-                #Message "..using export to cad.."
-                gp.AddWarning(get_ID_message(86139))
-                msg = "-> converting to " + featureFormat[1] + " using export to cad..."
-                Append2Log(msg,TargetLogFile)
-                gp.ExportCAD_conversion(outputpath, featureFormat[1], outputinzip)
-            else:
-                if not haveDataInterop:
-                    raise LicenseError
-                diFormatString = "%s,%s" % (featureFormat[1], outputinzip)
-                # run quick export
+def writeFeatures(features, writerClass, outputpath):
+    # read the features once and hand them to the writer
+    desc = gp.describe(features)
+    fields = [(f.name, f.type) for f in gp.ListFields(features) if f.type not in ExtractData_Writers.skipped_field_types]
+    spatialReference = {"wkid": None, "wkt": ""}
+    sr = desc.spatialreference
+    if sr is not None:
+        spatialReference["wkid"] = getattr(sr, "factoryCode", None) or None
+        if hasattr(sr, "exportToString"):
+            spatialReference["wkt"] = sr.exportToString().split(";")[0]
+    writer = writerClass(outputpath, fields, desc.shapetype, spatialReference)
+    try:
+        cur = gp.searchcursor(features)
+        for row in cur:
+            shape = ExtractData_Writers.readShape(row.getValue(desc.shapefieldname), desc.shapetype)
+            writer.write([row.getValue(name) for name, fieldType in fields], shape)
+        del cur
+    finally:
+        writer.close()
+
+# source -> its spatial index (meta, boxes, cells), read once per process and again when it is rebuilt
+spatialIndexCache = {}
+
+def getSpatialIndexKey(source):
+    return hashlib.sha1(source.lower()).hexdigest()
+
+def spatialIndexCurrent(meta):
+    # an index is current while its source hasn't been modified since it was built. the
+    # modification time of an sde source can't be read, its row count and extent have to be
+    # what they were, and the index is no older than spatial_index_max_age
+    modified = sourceModified(meta["source"])
+    if modified is not None:
+        return modified == meta["sourceModified"]
+    if time.time() - meta["created"] >= spatial_index_max_age or not meta.get("sourceFingerprint"):
+        return False
+    try:
+        return getDatasetFingerprint(meta["source"]) == meta["sourceFingerprint"]
+    except:
+        return False
+
+def loadSpatialIndex(source):
+    # the index ExtractData_SpatialIndex.py built of source, None when there is none or it is stale.
+    # boxes.bin holds oid, xmin, ymin, xmax, ymax of every feature ordered by grid cell, cells.bin
+    # where the features of every cell start in it
+    entryDir = os.path.join(spatial_index_folder, getSpatialIndexKey(source))
+    try:
+        mtime = os.path.getmtime(os.path.join(entryDir, "meta.json"))
+    except OSError:
+        return None
+    index = spatialIndexCache.get(source)
+    if index is None or index["mtime"] != mtime:
+        meta = readCacheEntry(entryDir)
+        if meta is None:
+            return None
+        boxes = array.array('d')
+        cells = array.array('i')
+        indexFile = open(os.path.join(entryDir, "boxes.bin"), 'rb')
+        boxes.fromfile(indexFile, meta["count"] * 5)
+        indexFile.close()
+        indexFile = open(os.path.join(entryDir, "cells.bin"), 'rb')
+        cells.fromfile(indexFile, meta["columns"] * meta["rows"] + 1)
+        indexFile.close()
+        index = {"meta": meta, "boxes": boxes, "cells": cells, "mtime": mtime}
+        spatialIndexCache[source] = index
+    if not spatialIndexCurrent(index["meta"]):
+        return None
+    return index
+
+def querySpatialIndex(index, polygons):
+    # (object ids of the features inside the aoi polygons, object ids of the ones crossing their boundary)
+    meta = index["meta"]
+    boxes = index["boxes"]
+    cells = index["cells"]
+    extents = [ExtractData_Geometry.ringsExtent(rings) for rings in polygons if rings]
+    aoiExtent = (min([e[0] for e in extents]), min([e[1] for e in extents]),
+                 max([e[2] for e in extents]), max([e[3] for e in extents]))
+    # a feature is in the cell of its center, so the cells read reach half the largest feature past the aoi
+    cellSize = meta["cellSize"]
+    c0 = max(0, int((aoiExtent[0] - meta["maxWidth"] / 2.0 - meta["xmin"]) // cellSize))
+    c1 = min(meta["columns"] - 1, int((aoiExtent[2] + meta["maxWidth"] / 2.0 - meta["xmin"]) // cellSize))
+    r0 = max(0, int((aoiExtent[1] - meta["maxHeight"] / 2.0 - meta["ymin"]) // cellSize))
+    r1 = min(meta["rows"] - 1, int((aoiExtent[3] + meta["maxHeight"] / 2.0 - meta["ymin"]) // cellSize))
+    oids = []
+    candidates = []
+    for row in range(r0, r1 + 1):
+        # the cells of a row are next to each other in boxes
+        for i in range(cells[row * meta["columns"] + c0], cells[row * meta["columns"] + c1 + 1]):
+            box = (boxes[i * 5 + 1], boxes[i * 5 + 2], boxes[i * 5 + 3], boxes[i * 5 + 4])
+            if ExtractData_Geometry.extentsIntersect(box, aoiExtent):
+                oids.append(int(boxes[i * 5]))
+                candidates.append(box)
+    states = ExtractData_Geometry.classifyExtents(candidates, polygons)
+    inside = [oid for oid, state in zip(oids, states) if state == ExtractData_Geometry.EXTENT_INSIDE]
+    boundary = [oid for oid, state in zip(oids, states) if state == ExtractData_Geometry.EXTENT_BOUNDARY]
+    return inside, boundary
+
+def oidWhereClause(oidField, oids):
+    # where clause selecting oids: runs of consecutive ids become ranges, the rest IN lists
+    if not oids:
+        # selects nothing, object ids are never null
+        return oidField + " IS NULL"
+    oids = sorted(oids)
+    clauses = []
+    singles = []
+    start = previous = oids[0]
+    for oid in oids[1:] + [None]:
+        if oid is not None and oid == previous + 1:
+            previous = oid
+            continue
+        if previous - start >= 2:
+            clauses.append("(%s >= %d AND %s <= %d)" % (oidField, start, oidField, previous))
+        else:
+            singles.extend(range(start, previous + 1))
+        start = previous = oid
+    for i in range(0, len(singles), prefilter_oid_chunk):
+        clauses.append("%s IN (%s)" % (oidField, ",".join([str(oid) for oid in singles[i:i + prefilter_oid_chunk]])))
+    return " OR ".join(clauses)
+
+def prefilterFeatures(lyr, describe, aoi_geometry):
+    # the features of lyr inside the aoi and the ones crossing its boundary, from the spatial
+    # index of its source. None when the layer is to be clipped whole
+    if spatial_index_folder == "" or aoi_geometry is None or not aoi_geometry["polygons"]:
+        return None
+    source = getattr(describe, "catalogPath", "")
+    sr = describe.spatialreference
+    # the index is in the coordinates of the source, the definition query has to be known
+    if not source or describe.whereClause is None or sr is None or sr.name != aoi_geometry["srName"]:
+        return None
+    try:
+        index = loadSpatialIndex(source)
+        if index is None or index["meta"]["count"] < prefilter_min_features or index["meta"]["srName"] != sr.name:
+            return None
+        inside, boundary = timedCall("prefilter", lyr, querySpatialIndex, index, aoi_geometry["polygons"])
+    except:
+        gp.AddMessage("WARNING: Unable to read the spatial index of " + lyr + ", clipping the whole layer")
+        return None
+    # most of the features have to be clipped anyway, one clip of the layer is cheaper
+    if len(boundary) > prefilter_max_boundary_share * (len(inside) + len(boundary)):
+        return None
+    msg = "-> " + str(len(inside)) + " features of " + lyr + " are inside the AOI and copied, " + \
+          str(len(boundary)) + " cross its boundary and are clipped"
+    gp.AddMessage(msg)
+    Append2Log(msg,TargetLogFile)
+    return {"oidField": index["meta"]["oidField"], "whereClause": describe.whereClause,
+            "inside": inside, "boundary": boundary}
+
+def makePrefilterLayer(lyr, name, prefilter, oids):
+    # a feature layer of lyr with only oids, on top of the layer's own definition query
+    where = oidWhereClause(prefilter["oidField"], oids)
+    if prefilter["whereClause"]:
+        where = "(" + prefilter["whereClause"] + ") AND (" + where + ")"
+    if gp.exists(name):
+        gp.Delete_management(name)
+    gp.MakeFeatureLayer_management(lyr, name, where)
+    return name
+
+def clipFeatureClass(lyr, aoi, outputpath, prefilter=None):
+    # clip_analysis of the whole layer, or with a prefilter a clip of only the features crossing
+    # the aoi boundary, with the features inside the aoi appended to it as they are
+    if prefilter is None:
+        timedCall("clip_analysis", lyr, gp.clip_analysis, lyr, aoi, outputpath)
+        return
+    layers = [makePrefilterLayer(lyr, "ExtractData_Boundary", prefilter, prefilter["boundary"])]
+    try:
+        timedCall("clip_analysis", lyr, gp.clip_analysis, layers[0], aoi, outputpath)
+        if prefilter["inside"]:
+            layers.append(makePrefilterLayer(lyr, "ExtractData_Inside", prefilter, prefilter["inside"]))
+            timedCall("copy_inside", lyr, gp.Append_management, layers[1], outputpath, "NO_TEST")
+    finally:
+        for name in layers:
+            gp.Delete_management(name)
+
+def clipFeaturesToWriter(lyr, aoi, featureFormat, writerClass, zipFolderPath, prefilter=None):
+    memoryFeatures, outputpath = makeWriterOutputPath(lyr, featureFormat, zipFolderPath)
+    msg = "-> running clip_analysis(" + lyr + "," + str(aoi) + "," + memoryFeatures + ")"
+    gp.AddMessage(msg)
+    Append2Log(msg,TargetLogFile)
+    try:
+        clipFeatureClass(lyr, aoi, memoryFeatures, prefilter)
+        msg = "-> Successfully clipped " + lyr
+        Append2Log(msg,TargetLogFile)
+        gp.AddIDMessage("INFORMATIVE", 86135, lyr)
+        msg = "-> writing " + featureFormat[1] + " " + os.path.basename(outputpath) + "..."
+        Append2Log(msg,TargetLogFile)
+        layerProgress("converting")
+        timedCall("write_" + featureFormat[1].lower(), lyr, writeFeatures, memoryFeatures, writerClass, outputpath)
+    except:
+        if os.path.exists(outputpath):
+            os.remove(outputpath)
+        raise
+    finally:
+        if gp.exists(memoryFeatures):
+            gp.Delete_management(memoryFeatures)
+    return outputpath
+
+def clipFeatures(lyr, aoi, featureFormat, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area, prefilter=None):
+    global haveDataInterop
+    try:
+        # formats with a python writer skip the scratch gdb and Data Interop
+        writerClass = ExtractData_Writers.getWriter(featureFormat[1])
+        if writerClass is not None and not convertFeaturesDuringClip:
+            msg = "-> Running clip operation on " + lyr + "...."
+            Append2Log(msg,TargetLogFile)
+            gp.AddMessage(msg)
+            return clipFeaturesToWriter(lyr, aoi, featureFormat, writerClass, zipFolderPath, prefilter)
+
+        # get the path and a validated name for the output
+        layerName, outputpath = makeOutputPath(False, lyr, convertFeaturesDuringClip, featureFormat, zipFolderPath, scratchFolderPath)
+        msg = "-> Running clip operation on " + lyr + "...."
+        Append2Log(msg,TargetLogFile)
+        gp.AddMessage(msg)
+        # do the clip
+        msg = "-> running clip_analysis(" + lyr + "," + str(aoi) + "," + outputpath + ")"
+        gp.AddMessage(msg)
+        Append2Log(msg,TargetLogFile)
+        clipFeatureClass(lyr, aoi, outputpath, prefilter)
+        #Message "  clipped %s..."
+        msg = "-> Successfully clipped " + lyr
+        Append2Log(msg,TargetLogFile)
+        gp.AddIDMessage("INFORMATIVE", 86135, lyr)
+
+        # if format needs data interop, convert with data interop
+        if not convertFeaturesDuringClip:
+            layerProgress("converting")
+            # get path to zip
+            outputinzip = makeZipOutputPath(layerName, featureFormat[2], zipFolderPath)
+            if featureFormat[2].lower() in [".dxf", ".dwg", ".dgn"]:
+                #Message "..using export to cad.."
+                gp.AddWarning(get_ID_message(86139))
+                msg = "-> converting to " + featureFormat[1] + " using export to cad..."
+                Append2Log(msg,TargetLogFile)
+                timedCall("exportcad", lyr, gp.ExportCAD_conversion, outputpath, featureFormat[1], outputinzip)
+            else:
+                if not haveDataInterop:
+                    raise LicenseError
+                diFormatString = "%s,%s" % (featureFormat[1], outputinzip)
+                # run quick export
                 msg = "-> converting to " + featureFormat[1] + " using quickexport..."
                 Append2Log(msg,TargetLogFile)
-                gp.quickexport_interop(outputpath, diFormatString)
+                timedCall("quickexport", lyr, gp.quickexport_interop, outputpath, diFormatString)
+            return outputinzip
+
+        return outputpath
 
     except LicenseError:
         #Message "  failed to export to %s.  The requested formats require the Data Interoperability extension.  This extension is currently unavailable."
@@ -325,6 +2135,9 @@ def clipFeatures(lyr, aoi, featureFormat, zipFolderPath, scratchFolderPath, conv
         pass
 
     except:
+        # transient errors are retried by runLayerTask
+        if isTransientError(str(sys.exc_info()[1])):
+            raise
         errorstring = gp.GetMessages(2)
         if errorstring.lower().find("failed to execute (quickexport)") > -1:
             #Message "  failed to export layer %s with Quick Export.  Please verify that the format you have specified is valid."
@@ -344,7 +2157,1283 @@ def clipFeatures(lyr, aoi, featureFormat, zipFolderPath, scratchFolderPath, conv
             Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
         pass
 
-def clipAndConvert(lyrs, aoi, featureFormat, rasterFormat, coordinateSystem):
+# LAYERNAME -> maxarea lookup, shared by every job run in this process
+maxAreaCache = {"table": None, "loaded": 0}
+
+def loadMaxAreaLookup():
+    # read the whole maxarea lookup table with a single cursor.
+    # names are keyed lower case, the database compares them case-insensitively
+    table = {}
+    cur = gp.searchcursor(maxarea_lookuptable)
+    for row in cur:
+        table[str(row.LAYERNAME).lower()] = row.maxarea
+    del cur
+    return table
+
+def saveMaxAreaSnapshot(table):
+    # keep the last good copy of the lookup table on disk
+    try:
+        tmpFile = maxarea_snapshot_file + "." + str(os.getpid())
+        snapshot = open(tmpFile, 'w')
+        json.dump(table, snapshot)
+        snapshot.close()
+        if os.path.exists(maxarea_snapshot_file):
+            os.remove(maxarea_snapshot_file)
+        os.rename(tmpFile, maxarea_snapshot_file)
+    except:
+        gp.AddMessage("WARNING: Unable to save the maxarea lookup snapshot to " + maxarea_snapshot_file)
+
+def loadMaxAreaSnapshot():
+    if not os.path.exists(maxarea_snapshot_file):
+        return None
+    try:
+        snapshot = open(maxarea_snapshot_file, 'r')
+        table = json.load(snapshot)
+        snapshot.close()
+        return table
+    except:
+        return None
+
+def getMaxAreaLookup():
+    # returns the cached lookup table, reloading it from SDE once maxarea_cache_ttl has passed.
+    # if SDE can't be read, the last table read (in memory or the snapshot on disk) is used.
+    # returns None if the table has never been available
+    now = time.time()
+    if maxAreaCache["table"] is not None and now - maxAreaCache["loaded"] < maxarea_cache_ttl:
+        return maxAreaCache["table"]
+
+    try:
+        if not gp.Exists(maxarea_lookuptable):
+            raise IOError(maxarea_lookuptable + " does not exist")
+        table = loadMaxAreaLookup()
+        maxAreaCache["table"] = table
+        maxAreaCache["loaded"] = now
+        saveMaxAreaSnapshot(table)
+        return table
+    except:
+        table = maxAreaCache["table"]
+        if table is None:
+            table = loadMaxAreaSnapshot()
+        if table is not None:
+            msg = "==> WARNING: Unable to read " + maxarea_lookuptable + ", using the last copy of the maxarea lookup table"
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+            # try SDE again after maxarea_retry_seconds rather than a full ttl
+            maxAreaCache["table"] = table
+            maxAreaCache["loaded"] = now - maxarea_cache_ttl + maxarea_retry_seconds
+        return table
+
+def invalidateMaxAreaCache():
+    # force the next lookup to read the table from SDE again
+    maxAreaCache["table"] = None
+    maxAreaCache["loaded"] = 0
+
+# layer -> what describe said about it, and sanitized output names, shared by every job run in this process
+layerRegistry = {"layers": {}, "names": {}, "estimates": {}, "forgotten": {}, "fileMTime": None, "checked": 0}
+
+class RegistrySpatialReference(object):
+    # the parts of a describe spatial reference the tool uses
+    def __init__(self, name, string):
+        self.name = name
+        self.string = string
+
+    def exportToString(self):
+        return self.string
+
+class RegistryExtent(object):
+    def __init__(self, xmin, ymin, xmax, ymax):
+        self.XMin = xmin
+        self.YMin = ymin
+        self.XMax = xmax
+        self.YMax = ymax
+
+    def __str__(self):
+        return "%r %r %r %r" % (self.XMin, self.YMin, self.XMax, self.YMax)
+
+class LayerDescriptor(object):
+    # a registry entry that reads like the describe object it was made from
+    def __init__(self, entry):
+        self.DataType = entry["dataType"]
+        self.catalogPath = entry.get("catalogPath", "")
+        self.featureCount = entry.get("featureCount")
+        # None when the layer was described before its definition query was kept
+        self.whereClause = entry.get("whereClause")
+        self.spatialreference = None
+        if entry.get("srName") is not None:
+            self.spatialreference = RegistrySpatialReference(entry["srName"], entry.get("srString", ""))
+        self.extent = None
+        if entry.get("extent") is not None:
+            self.extent = RegistryExtent(*entry["extent"])
+        # None when the layer isn't a raster or was described before they were kept
+        self.rasterProperties = entry.get("rasterProperties")
+
+def readLayerDescriptor(lyr):
+    # describe a layer into a registry entry of plain values
+    d = gp.describe(lyr)
+    entry = {"dataType": d.DataType, "described": time.time()}
+    try:
+        entry["catalogPath"] = str(d.catalogPath)
+    except:
+        entry["catalogPath"] = ""
+    try:
+        entry["whereClause"] = str(getattr(d, "whereClause", "") or "")
+    except:
+        pass
+    try:
+        sr = d.spatialreference
+        if sr is not None:
+            entry["srName"] = sr.name
+            entry["srString"] = sr.exportToString()
+    except:
+        pass
+    try:
+        ext = d.extent
+        entry["extent"] = [ext.XMin, ext.YMin, ext.XMax, ext.YMax]
+    except:
+        pass
+    if entry["dataType"].lower() in ["rasterlayer", "mosaiclayer"]:
+        try:
+            entry["rasterProperties"] = dict([(property, readRasterProperty(lyr, property)) for property in raster_registry_properties])
+        except:
+            pass
+    if layer_registry_counts and entry["dataType"].lower() == "featurelayer":
+        try:
+            entry["featureCount"] = int(gp.GetCount_management(lyr).getOutput(0))
+        except:
+            pass
+    return entry
+
+def describeLayer(lyr):
+    # the registry entry of lyr, described only when it isn't known yet or is older than layer_registry_ttl
+    if os.path.isabs(lyr):
+        # datasets in the job's own folders (batch intermediates) aren't worth keeping
+        return LayerDescriptor(readLayerDescriptor(lyr))
+    checkLayerRegistryFile()
+    entry = layerRegistry["layers"].get(lyr)
+    if entry is None or time.time() - entry["described"] > layer_registry_ttl:
+        entry = readLayerDescriptor(lyr)
+        layerRegistry["layers"][lyr] = entry
+        saveLayerRegistryFile()
+    return LayerDescriptor(entry)
+
+def invalidateLayerRegistry(lyr=None):
+    # forget one layer, or every layer ("*"), so it is described again by the next job. the
+    # time it was forgotten is saved too, so merging the file doesn't bring the old entry back
+    now = time.time()
+    if lyr is None:
+        layerRegistry["layers"].clear()
+        layerRegistry["names"].clear()
+        layerRegistry["estimates"].clear()
+        layerRegistry["forgotten"]["*"] = now
+    else:
+        layerRegistry["layers"].pop(lyr, None)
+        layerRegistry["forgotten"][lyr] = now
+    saveLayerRegistryFile()
+
+def forgottenSince(lyr):
+    # when lyr was last invalidated, entries described before that are stale
+    return max(layerRegistry["forgotten"].get(lyr, 0), layerRegistry["forgotten"].get("*", 0))
+
+def checkLayerRegistryFile():
+    # pick up what other processes (clip workers, other service instances) described, once
+    # every layer_registry_check_seconds and only when the file has changed
+    now = time.time()
+    if layer_registry_file == "" or now - layerRegistry["checked"] < layer_registry_check_seconds:
+        return
+    layerRegistry["checked"] = now
+    try:
+        mtime = os.path.getmtime(layer_registry_file)
+    except OSError:
+        return
+    if mtime == layerRegistry["fileMTime"]:
+        return
+    if mergeLayerRegistryFile():
+        layerRegistry["fileMTime"] = mtime
+
+def mergeLayerRegistryFile():
+    # add the newer entries of layer_registry_file to the registry
+    try:
+        registryFile = open(layer_registry_file, 'r')
+        stored = json.load(registryFile)
+        registryFile.close()
+    except:
+        return False
+    now = time.time()
+    for lyr, forgotten in stored.get("forgotten", {}).items():
+        # a forgotten layer is re-described within layer_registry_ttl anyway
+        if lyr == "*" or now - forgotten < layer_registry_ttl:
+            layerRegistry["forgotten"][lyr] = max(layerRegistry["forgotten"].get(lyr, 0), forgotten)
+    for lyr, entry in stored.get("layers", {}).items():
+        if lyr not in layerRegistry["layers"] or layerRegistry["layers"][lyr]["described"] < entry["described"]:
+            layerRegistry["layers"][lyr] = entry
+    for key, name in stored.get("names", {}).items():
+        layerRegistry["names"].setdefault(key, name)
+    for lyr, learned in stored.get("estimates", {}).items():
+        if lyr not in layerRegistry["estimates"] or layerRegistry["estimates"][lyr]["updated"] < learned["updated"]:
+            layerRegistry["estimates"][lyr] = learned
+    # what was described before another process forgot it
+    for lyr, entry in layerRegistry["layers"].items():
+        if entry["described"] <= forgottenSince(lyr):
+            del layerRegistry["layers"][lyr]
+    for lyr, learned in layerRegistry["estimates"].items():
+        if learned["updated"] <= layerRegistry["forgotten"].get("*", 0):
+            del layerRegistry["estimates"][lyr]
+    return True
+
+def saveLayerRegistryFile():
+    # other processes save to the same file, keep what they added
+    if layer_registry_file == "":
+        return
+    try:
+        if os.path.exists(layer_registry_file):
+            mergeLayerRegistryFile()
+        tmpFile = layer_registry_file + "." + str(os.getpid())
+        registryFile = open(tmpFile, 'w')
+        json.dump({"layers": layerRegistry["layers"], "names": layerRegistry["names"], "estimates": layerRegistry["estimates"],
+                   "forgotten": layerRegistry["forgotten"]}, registryFile, separators=(',', ':'))
+        registryFile.close()
+        if os.path.exists(layer_registry_file):
+            os.remove(layer_registry_file)
+        os.rename(tmpFile, layer_registry_file)
+        layerRegistry["fileMTime"] = os.path.getmtime(layer_registry_file)
+    except:
+        gp.AddMessage("WARNING: Unable to save the layer registry to " + layer_registry_file)
+
+def sanitizedOutputName(inLayerName, outFormat, outwkspc):
+    # output name of a layer for the kind of workspace it is written to, validated once per process
+    kind = os.path.splitext(outwkspc)[1].lower() or "folder"
+    if outFormat == "grid":
+        kind = "grid"
+    key = kind + "|" + inLayerName
+    name = layerRegistry["names"].get(key)
+    if name is None:
+        name = inLayerName
+        # make sure there are no spaces in the out raster name and make sure its less than 13 chars
+        if outFormat == "grid":
+            if len(name) > 12:
+                name = name[:12]
+            if name.find(" ") > -1:
+                name = name.replace(" ", "_")
+        name = gp.validatetablename(name, outwkspc)
+        layerRegistry["names"][key] = name
+    return name
+
+def countFeaturesInAOI(lyr, aoi, describe, aoi_ext):
+    # features of lyr in the aoi: a spatial selection uses the layer's spatial index,
+    # otherwise the layer's feature count times the share of its extent the aoi box covers
+    if preflight_count_features and (preflight_max_bytes > 0 or preflight_max_seconds > 0):
+        try:
+            selection = "ExtractData_Preflight"
+            gp.MakeFeatureLayer_management(lyr, selection)
+            try:
+                gp.SelectLayerByLocation_management(selection, "INTERSECT", aoi)
+                return int(gp.GetCount_management(selection).getOutput(0))
+            finally:
+                gp.Delete_management(selection)
+        except:
+            pass
+    count = describe.featureCount
+    if count is None:
+        count = int(gp.GetCount_management(lyr).getOutput(0))
+    return int(math.ceil(count * extentShare(describe, aoi_ext)))
+
+def extentShare(describe, aoi_ext):
+    # share of the layer extent the aoi box covers
+    xmin, ymin, xmax, ymax = [float(v) for v in str(aoi_ext).split()[:4]]
+    ext = describe.extent
+    if ext is None:
+        return 1.0
+    width = min(xmax, ext.XMax) - max(xmin, ext.XMin)
+    height = min(ymax, ext.YMax) - max(ymin, ext.YMin)
+    layerArea = (ext.XMax - ext.XMin) * (ext.YMax - ext.YMin)
+    if width <= 0 or height <= 0 or layerArea <= 0:
+        return 0.0
+    return min(1.0, width * height / layerArea)
+
+def estimateLayer(lyr, aoi, aoi_ext, aoi_geometry, featureFormat, rasterFormat):
+    # {"layer", "bytes", "seconds", "features" or "pixelBytes"} the extract of lyr is expected to write and take
+    estimate = {"layer": lyr, "bytes": 0, "seconds": 0.0}
+    if lyr.find(" ") > -1:
+        lyr = lyr.replace("'", "")
+    describe = describeLayer(lyr)
+    dataType = describe.DataType.lower()
+    if dataType not in ["featurelayer", "rasterlayer", "mosaiclayer"] or not aoiTouchesLayer(aoi_geometry, describe):
+        return estimate
+    learned = layerRegistry["estimates"].get(estimate["layer"], {})
+    if dataType == "featurelayer":
+        estimate["features"] = countFeaturesInAOI(lyr, aoi, describe, aoi_ext)
+        estimate["bytes"] = int(estimate["features"] * learned.get("bytesPerFeature", default_bytes_per_feature))
+    else:
+        # the raster is clipped to the aoi box, so the pixels of the box within the raster
+        xmin, ymin, xmax, ymax = [float(v) for v in str(aoi_ext).split()[:4]]
+        ext = describe.extent
+        width = min(xmax, ext.XMax) - max(xmin, ext.XMin)
+        height = min(ymax, ext.YMax) - max(ymin, ext.YMin)
+        if width <= 0 or height <= 0:
+            return estimate
+        cellX = float(getRasterProperty(lyr, "CELLSIZEX"))
+        cellY = float(getRasterProperty(lyr, "CELLSIZEY"))
+        bands = int(float(getRasterProperty(lyr, "BANDCOUNT")))
+        bits = int(raster_pixel_types.get(getRasterProperty(lyr, "VALUETYPE"), "8_BIT").split("_")[0])
+        estimate["pixelBytes"] = int(math.ceil(width / cellX) * math.ceil(height / cellY) * bands * bits / 8.0)
+        ratio = learned.get("bytesPerPixelByte", raster_format_ratios.get(rasterFormat[1].lower(), 1.0))
+        estimate["bytes"] = int(estimate["pixelBytes"] * ratio)
+    estimate["seconds"] = layer_overhead_seconds + estimate["bytes"] / 1048576.0 * learned.get("secondsPerMB", default_seconds_per_mb)
+    return estimate
+
+def learnFromExtract(estimate, outputBytes, seconds):
+    # move the learned bytes per feature/pixel and seconds per MB of a layer towards what its extract did
+    lyr = estimate["layer"]
+    learned = layerRegistry["estimates"].setdefault(lyr, {})
+    rate = estimate_learning_rate
+    def update(key, value):
+        if key in learned:
+            value = learned[key] * (1 - rate) + value * rate
+        learned[key] = value
+    if estimate.get("features"):
+        update("bytesPerFeature", outputBytes / float(estimate["features"]))
+    if estimate.get("pixelBytes"):
+        update("bytesPerPixelByte", outputBytes / float(estimate["pixelBytes"]))
+    if outputBytes > 0:
+        update("secondsPerMB", max(seconds - layer_overhead_seconds, 0) / (outputBytes / 1048576.0))
+    learned["updated"] = time.time()
+
+def preflightCheck(lyrs, aoi, aoi_ext, aoi_geometry, featureFormat, rasterFormat):
+    # estimate every layer before anything is clipped and hold the job to the budget.
+    # returns the layers to extract and the estimates. over budget the most expensive layers
+    # are left out (preflight_over_budget = "downgrade") or the job is rejected ("reject")
+    estimates = {}
+    for lyr in lyrs:
+        try:
+            estimates[lyr] = timedCall("estimate", lyr, estimateLayer, lyr, aoi, aoi_ext, aoi_geometry, featureFormat, rasterFormat)
+        except:
+            # a layer that can't be estimated is left to runLayerTask
+            estimates[lyr] = {"layer": lyr, "bytes": 0, "seconds": 0.0}
+    totalBytes = sum([e["bytes"] for e in estimates.values()])
+    totalSeconds = sum([e["seconds"] for e in estimates.values()])
+    jobMetrics.job["estimatedBytes"] = totalBytes
+    jobMetrics.job["estimatedSeconds"] = round(totalSeconds, 1)
+    msg = "-> Estimated output " + formatBytes(totalBytes) + " in about " + str(int(totalSeconds)) + " seconds"
+    gp.AddMessage(msg)
+    Append2Log(msg,TargetLogFile)
+
+    def overBudget(bytes, seconds):
+        return (preflight_max_bytes > 0 and bytes > preflight_max_bytes) or (preflight_max_seconds > 0 and seconds > preflight_max_seconds)
+
+    dropped = []
+    if overBudget(totalBytes, totalSeconds):
+        budget = "the budget of " + formatBytes(preflight_max_bytes) + " and " + str(preflight_max_seconds) + " seconds"
+        if preflight_over_budget == "reject":
+            reportEstimate(estimates, lyrs, dropped)
+            raise Exception, "EXTRACT_REJECTED: the estimated output (" + formatBytes(totalBytes) + ", " + str(int(totalSeconds)) + " seconds) is over " + budget + ", please use a smaller area of interest or fewer layers"
+        # leave out the layers that use the largest share of the budget first
+        def share(e):
+            return max(preflight_max_bytes > 0 and e["bytes"] / float(preflight_max_bytes) or 0,
+                       preflight_max_seconds > 0 and e["seconds"] / float(preflight_max_seconds) or 0)
+        for e in sorted(estimates.values(), key=share, reverse=True):
+            if not overBudget(totalBytes, totalSeconds):
+                break
+            totalBytes -= e["bytes"]
+            totalSeconds -= e["seconds"]
+            dropped.append(e["layer"])
+            msg = "==> WARNING: " + e["layer"] + " (estimated " + formatBytes(e["bytes"]) + ") is left out to keep the extract within " + budget
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+            layerStatus.record(e["layer"], "over budget", 0, 0, "estimated " + formatBytes(e["bytes"]) + ", " + str(int(e["seconds"])) + " seconds")
+            jobManifest.setFailed(e["layer"], "over budget", "estimated " + formatBytes(e["bytes"]))
+        jobMetrics.job["droppedLayers"] = len(dropped)
+    reportEstimate(estimates, lyrs, dropped)
+    return [lyr for lyr in lyrs if lyr not in dropped], estimates
+
+def reportEstimate(estimates, lyrs, dropped):
+    # the frontend picks the EXTRACT_ESTIMATE message out of the job messages
+    report = {"bytes": sum([estimates[lyr]["bytes"] for lyr in lyrs if lyr not in dropped]),
+              "seconds": int(sum([estimates[lyr]["seconds"] for lyr in lyrs if lyr not in dropped])),
+              "maxBytes": preflight_max_bytes,
+              "maxSeconds": preflight_max_seconds,
+              "layers": [{"layer": lyr, "bytes": estimates[lyr]["bytes"], "seconds": int(estimates[lyr]["seconds"]),
+                          "dropped": lyr in dropped} for lyr in lyrs]}
+    gp.AddMessage("EXTRACT_ESTIMATE " + json.dumps(report, separators=(',', ':')))
+
+def learnFromLayers(estimates):
+    # what the extracted layers actually wrote and took, for the next estimates
+    timings = dict([(t["layer"], t) for t in jobMetrics.timings if t["stage"] == "layer" and t.get("bytes")])
+    learned = False
+    for lyr, estimate in estimates.items():
+        row = layerStatus.rows.get(lyr)
+        if row is not None and row["status"] == "extracted" and lyr in timings and estimate["bytes"]:
+            learnFromExtract(estimate, timings[lyr]["bytes"], timings[lyr]["seconds"])
+            learned = True
+    if learned:
+        saveLayerRegistryFile()
+
+def formatBytes(bytes):
+    for unit in ["bytes", "KB", "MB", "GB"]:
+        if bytes < 1024 or unit == "GB":
+            break
+        bytes /= 1024.0
+    return "%.1f %s" % (bytes, unit)
+
+def getAOIHash(aoiLayer):
+    # hash of the aoi geometry that doesn't change with feature order or coordinate noise
+    featureHashes = []
+    desc = gp.describe(aoiLayer)
+    shapeField = desc.shapefieldname
+    cur = gp.searchcursor(aoiLayer)
+    for row in cur:
+        coords = []
+        for ring in ExtractData_Geometry.geometryRings(row.getValue(shapeField)):
+            for x, y in ring:
+                coords.append("%.*f %.*f" % (aoi_hash_precision, x, aoi_hash_precision, y))
+        featureHashes.append(hashlib.sha1(",".join(coords)).hexdigest())
+    del cur
+    featureHashes.sort()
+    return hashlib.sha1(str(desc.spatialreference.name) + ";" + ";".join(featureHashes)).hexdigest()
+
+def getResultCacheKey(lyr, describe, source, aoi_hash, formatList, coordinateSystem):
+    # the layer's dataset and definition query, so layers of the same name in different folders
+    # don't share entries, and its source fingerprint, so an edited source misses the cache
+    layerPath = str(getattr(describe, "catalogPath", "") or lyr)
+    whereClause = str(getattr(describe, "whereClause", "") or "")
+    key = "|".join([layerPath.lower(), whereClause, source, aoi_hash, " - ".join(formatList).lower(), str(coordinateSystem).lower()])
+    return hashlib.sha1(key).hexdigest()
+
+def readCacheEntry(entryDir):
+    # meta.json is written last, an entry without it is incomplete
+    try:
+        metaFile = open(os.path.join(entryDir, "meta.json"), 'r')
+        meta = json.load(metaFile)
+        metaFile.close()
+        return meta
+    except (IOError, ValueError):
+        return None
+
+def copyCachedFile(src, dst):
+    # hardlink when the platform supports it, otherwise copy
+    if hasattr(os, "link"):
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+def restoreCachedOutput(key, raster, lyr, convert, formatList, zipFolderPath, scratchFolderPath):
+    # copy a cached clip into the zip folder, returns the output path or None on a cache miss
+    entryDir = os.path.join(result_cache_folder, key)
+    meta = readCacheEntry(entryDir)
+    if meta is None:
+        return None
+    if time.time() - meta["created"] > result_cache_max_age:
+        shutil.rmtree(entryDir, True)
+        return None
+
+    if meta["kind"] == "files":
+        # same base name as the cached files unless that is already taken in the zip folder,
+        # or reserved there by another clip worker (see reserveOutputName)
+        baseName = meta["baseName"]
+        prefix = "." + os.path.basename(zipFolderPath) + "."
+        if workspaceLock is not None:
+            workspaceLock.acquire()
+        try:
+            newBase = baseName
+            n = 0
+            while [f for f in os.listdir(zipFolderPath) if f == newBase or f.startswith(newBase + ".") or
+                   (f.startswith(prefix + newBase + ".") and f.endswith(".lock"))]:
+                newBase = baseName + str(n)
+                n += 1
+            if workspaceLock is not None:
+                open(os.path.join(zipFolderPath, prefix + newBase + ".lock"), 'w').close()
+        finally:
+            if workspaceLock is not None:
+                workspaceLock.release()
+        for file in meta["files"]:
+            target = os.path.join(zipFolderPath, newBase + file[len(baseName):])
+            if not os.path.exists(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            noteAttemptOutput(target)
+            copyCachedFile(os.path.join(entryDir, file), target)
+        outputpath = os.path.join(zipFolderPath, newBase + meta["primary"][len(baseName):])
+    else:
+        layerName, outputpath = makeOutputPath(raster, lyr, True, formatList, zipFolderPath, scratchFolderPath)
+        gp.Copy_management(os.path.join(entryDir, meta["dataset"]), outputpath)
+
+    # touch the entry so it is the most recently used
+    os.utime(os.path.join(entryDir, "meta.json"), None)
+    return outputpath
+
+def storeCachedOutput(key, outputpath):
+    # keep a copy of a clipped output in the result cache
+    entryDir = os.path.join(result_cache_folder, key)
+    if not os.path.exists(result_cache_folder):
+        os.makedirs(result_cache_folder)
+    try:
+        # only one job stores a given key
+        os.mkdir(entryDir)
+    except OSError:
+        return
+
+    try:
+        meta = {"created": time.time()}
+        files = listOutputFiles(outputpath)
+        if files:
+            meta["kind"] = "files"
+            meta["primary"] = os.path.basename(outputpath)
+            meta["baseName"] = os.path.splitext(meta["primary"])[0]
+            meta["files"] = []
+            for filepath in files:
+                relpath = filepath[len(os.path.dirname(outputpath)) + len(os.sep):]
+                if not os.path.exists(os.path.join(entryDir, os.path.dirname(relpath))):
+                    os.makedirs(os.path.join(entryDir, os.path.dirname(relpath)))
+                copyCachedFile(filepath, os.path.join(entryDir, relpath))
+                meta["files"].append(relpath)
+        else:
+            # datasets in a gdb/mdb and GRIDs are copied with the geoprocessor
+            outwkspc = os.path.dirname(outputpath)
+            format = os.path.splitext(outwkspc)[1].lower()[1:]
+            cachewkspc = _getTempLocationPath(entryDir, format)
+            gp.Copy_management(outputpath, os.path.join(cachewkspc, os.path.basename(outputpath)))
+            meta["kind"] = "dataset"
+            meta["dataset"] = os.path.join(cachewkspc, os.path.basename(outputpath))[len(entryDir) + len(os.sep):]
+
+        meta["bytes"] = folderSize(entryDir)
+        metaFile = open(os.path.join(entryDir, "meta.json"), 'w')
+        json.dump(meta, metaFile)
+        metaFile.close()
+    except:
+        shutil.rmtree(entryDir, True)
+        raise
+
+    evictResultCache()
+
+def folderSize(folder):
+    size = 0
+    for (dirpath, dirnames, filenames) in os.walk(folder):
+        for file in filenames:
+            size += os.path.getsize(os.path.join(dirpath, file))
+    return size
+
+def evictResultCache():
+    # drop the least recently used entries until the cache fits in result_cache_maxbytes
+    entries = []
+    total = 0
+    for key in os.listdir(result_cache_folder):
+        entryDir = os.path.join(result_cache_folder, key)
+        meta = readCacheEntry(entryDir)
+        if meta is None:
+            continue
+        lastUsed = os.path.getmtime(os.path.join(entryDir, "meta.json"))
+        entries.append((lastUsed, entryDir, meta["bytes"]))
+        total += meta["bytes"]
+    entries.sort()
+    for lastUsed, entryDir, size in entries:
+        if total <= result_cache_maxbytes:
+            break
+        shutil.rmtree(entryDir, True)
+        total -= size
+
+def clipWithResultCache(raster, lyr, describe, convert, formatList, coordinateSystem, zipFolderPath, scratchFolderPath, aoi_hash, clip):
+    # use a cached output of the same layer/source/aoi/format/coordinate system if there is one,
+    # otherwise run clip() and cache what it wrote. a layer whose source fingerprint couldn't be
+    # taken (see layerUnchanged) can't be told apart from an edited one and isn't cached
+    source = jobManifest.layers.get(lyr, {}).get("source")
+    if result_cache_folder == "" or aoi_hash is None or source is None:
+        return clip()
+
+    key = getResultCacheKey(lyr, describe, source, aoi_hash, formatList, coordinateSystem)
+    try:
+        outputpath = restoreCachedOutput(key, raster, lyr, convert, formatList, zipFolderPath, scratchFolderPath)
+        if outputpath is not None:
+            msg = "-> Using cached clip of " + lyr
+            gp.AddMessage(msg)
+            Append2Log(msg,TargetLogFile)
+            return outputpath
+    except:
+        msg = "==> WARNING: Unable to use the cached clip of " + lyr + ", clipping it again"
+        gp.AddWarning(msg)
+        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+
+    outputpath = clip()
+    if outputpath is not None:
+        try:
+            storeCachedOutput(key, outputpath)
+        except:
+            gp.AddMessage("WARNING: Unable to add the clip of " + lyr + " to the result cache")
+    return outputpath
+
+def getProjectedStoreKey(source, coordinateSystem):
+    return hashlib.sha1(source.lower() + "|" + str(coordinateSystem).lower()).hexdigest()
+
+def projectedCopyCurrent(meta):
+    # a copy is current while its source hasn't been modified since it was projected. the
+    # modification time of an sde source can't be read, its row count and extent have to be
+    # what they were, and the copy is no older than projected_store_max_age
+    modified = sourceModified(meta["source"])
+    if modified is not None:
+        return modified == meta["sourceModified"]
+    if time.time() - meta["created"] >= projected_store_max_age or not meta.get("sourceFingerprint"):
+        return False
+    try:
+        return getDatasetFingerprint(meta["source"]) == meta["sourceFingerprint"]
+    except:
+        return False
+
+def findProjectedSource(lyr, describe, coordinateSystem):
+    # the copy of lyr in the projected store that is already in coordinateSystem, or None.
+    # copies are of the whole dataset, a layer with a definition query (or one that isn't known)
+    # is clipped itself so the extract has only the features the layer shows
+    if projected_store_folder == "" or not getattr(describe, "catalogPath", ""):
+        return None
+    if getattr(describe, "whereClause", None) != "":
+        return None
+    entryDir = os.path.join(projected_store_folder, getProjectedStoreKey(describe.catalogPath, coordinateSystem))
+    meta = readCacheEntry(entryDir)
+    if meta is None or not projectedCopyCurrent(meta):
+        return None
+    # touch the entry so it is the most recently used
+    try:
+        os.utime(os.path.join(entryDir, "meta.json"), None)
+    except OSError:
+        pass
+    msg = "-> Clipping the copy of " + lyr + " already projected to the output coordinate system"
+    gp.AddMessage(msg)
+    Append2Log(msg,TargetLogFile)
+    return os.path.join(entryDir, meta["dataset"])
+
+def recordProjectionRequest(lyr, describe, coordinateSystem, projected, seconds):
+    # one line per clip to another coordinate system, what ExtractData_ProjectedStore.py
+    # picks the layers to pre-project from
+    if projection_stats_file == "" or coordinateSystem.lower() == "same as input":
+        return
+    source = getattr(describe, "catalogPath", "")
+    if not source:
+        return
+    line = json.dumps({"time": round(time.time()),
+                       "layer": lyr,
+                       "source": source,
+                       "dataType": describe.DataType,
+                       "coordinateSystem": str(coordinateSystem),
+                       "projected": projected,
+                       "seconds": round(seconds, 3)}, separators=(',', ':'))
+    try:
+        statsFile = open(projection_stats_file, 'a')
+        statsFile.write(line + "\n")
+        statsFile.close()
+    except:
+        gp.AddMessage("WARNING: Unable to record the projection request in " + projection_stats_file)
+
+def clipWithProjectionStats(lyr, describe, coordinateSystem, source, clip, *args):
+    # run clip(*args) and record how long lyr took to clip to coordinateSystem, and whether
+    # it was clipped from a pre-projected copy (source) or reprojected on the fly
+    started = time.time()
+    try:
+        return clip(*args)
+    finally:
+        recordProjectionRequest(lyr, describe, coordinateSystem, source != lyr, time.time() - started)
+
+def readAOIPolygons(aoiLayer):
+    # rings of every aoi feature, one list of rings per feature
+    polygons = []
+    shapeField = gp.describe(aoiLayer).shapefieldname
+    cur = gp.searchcursor(aoiLayer)
+    for row in cur:
+        rings = ExtractData_Geometry.geometryRings(row.getValue(shapeField))
+        if rings:
+            polygons.append(rings)
+    del cur
+    return polygons
+
+def aoiTouchesLayer(aoi_geometry, describe):
+    # False only when the aoi polygons are known not to overlap the layer extent.
+    # the extents can only be compared when aoi and layer share a coordinate system
+    if aoi_geometry is None or not aoi_geometry["polygons"]:
+        return True
+    try:
+        sr = describe.spatialreference
+        if sr is None or sr.name != aoi_geometry["srName"]:
+            return True
+        ext = describe.extent
+        return ExtractData_Geometry.polygonsIntersectExtent(aoi_geometry["polygons"], (ext.XMin, ext.YMin, ext.XMax, ext.YMax))
+    except:
+        return True
+
+def isTransientError(error):
+    error = error.lower()
+    return len([e for e in transient_errors if error.find(e) > -1]) > 0
+
+def runLayerTask(lyr, process, *args):
+    # run process(*args) for one layer in isolation. errors that look transient are retried
+    # with backoff, anything else fails this layer only and the job carries on with the others.
+    # returns the outputs of the layer, [] when it failed
+    global currentLayer
+    currentLayer = lyr
+    started = time.time()
+    attempts = 0
+    while True:
+        attempts += 1
+        del attemptOutputs[:]
+        try:
+            outputs = process(*args)
+            if not isinstance(outputs, list):
+                outputs = [outputs]
+            if [outputpath for outputpath in outputs if outputpath is not None]:
+                status = "extracted"
+            elif jobManifest.layers.get(lyr, {}).get("status") == "unchanged":
+                status = "unchanged"
+            else:
+                status = "not extracted"
+            layerStatus.record(lyr, status, attempts, time.time() - started)
+            return outputs
+        except:
+            error = sys.exc_info()[0].__name__ + ": " + str(sys.exc_info()[1])
+            tbinfo = traceback.format_tb(sys.exc_info()[2])[-1]
+            # what the attempt wrote would be swept into the zip with the other layers' outputs
+            deleteAttemptOutputs(lyr)
+            if isTransientError(error) and attempts <= layer_retries:
+                wait = layer_retry_backoff * 2 ** (attempts - 1)
+                msg = "==> WARNING: " + lyr + " failed with a transient error, trying again in " + str(wait) + " seconds: " + error
+                gp.AddWarning(msg)
+                Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+                time.sleep(wait)
+                continue
+            msg = "==> ERROR: " + lyr + " failed and is not in the extract: " + error
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "<br>" + tbinfo + "</font></strong>",TargetLogFile)
+            layerStatus.record(lyr, "failed", attempts, time.time() - started, error)
+            jobManifest.setFailed(lyr, "failed", error)
+            # the layer may have been moved, dropped or changed since it was described
+            if not os.path.isabs(lyr):
+                invalidateLayerRegistry(lyr)
+            return []
+
+def deleteAttemptOutputs(lyr):
+    # datasets (in a gdb/mdb, shapefiles with their sidecar files, GRIDs) go with the
+    # geoprocessor, plain files (python writers, conversions, restored cache files) directly
+    for outputpath in attemptOutputs:
+        try:
+            if os.path.splitext(os.path.dirname(outputpath))[1].lower() in [".gdb", ".mdb"] or \
+               os.path.splitext(outputpath)[1].lower() == ".shp" or os.path.isdir(outputpath):
+                if gp.exists(outputpath):
+                    gp.Delete_management(outputpath)
+            elif os.path.isfile(outputpath):
+                os.remove(outputpath)
+        except:
+            msg = "==> WARNING: Unable to delete " + outputpath + " of the failed attempt at " + lyr + ": " + str(sys.exc_info()[1])
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+    del attemptOutputs[:]
+
+def processLayer(lyr, aoi, featureFormat, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area, aoi_ext, aoi_hash=None, aoi_geometry=None):
+    # process one layer and record how long it took and how much it wrote
+    started = time.time()
+    outputpath = None
+    try:
+        outputpath = _processLayer(lyr, aoi, featureFormat, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area, aoi_ext, aoi_hash, aoi_geometry)
+        timedCall("manifest", lyr, jobManifest.addOutput, lyr, outputpath, zipFolderPath)
+        return outputpath
+    finally:
+        outputBytes = None
+        if outputpath is not None:
+            outputBytes = outputSize(outputpath)
+        jobMetrics.record("layer", lyr, time.time() - started, outputBytes)
+
+def layerUnchanged(lyr, describe):
+    # True when lyr hasn't changed since the previous extract and doesn't need to be clipped again
+    try:
+        source = timedCall("fingerprint", lyr, getSourceFingerprint, lyr, describe)
+    except:
+        source = None
+    if jobManifest.unchanged(lyr, source):
+        msg = "-> " + lyr + " is unchanged since the previous extract, it is not extracted again"
+        gp.AddMessage(msg)
+        Append2Log(msg,TargetLogFile)
+        return True
+    jobManifest.setSource(lyr, source)
+    return False
+
+def getLayerMaxArea(lyr):
+    # - set extract_maxarea to default_maxarea parameter
+    extract_maxarea = default_maxarea
+    
+    # See if the current lyr has a MaxArea defined in the maxarea_lookuptable
+    # (read once per process, see getMaxAreaLookup)
+    maxareas = timedCall("maxarea_lookup", lyr, getMaxAreaLookup)
+    if maxareas is not None:
+        # Determine if there is a slash deliminter ("\"), which happens when this runs on the AGS server, and strip out stuff before the "\" slash
+        if lyr.find("\\"):
+            lyrNameOnly = lyr.split("\\")[-1]
+        else:
+            lyrNameOnly = lyr
+        msg = "-> Checking maxarea lookup table for LAYERNAME = '" + lyrNameOnly + "'"
+        gp.AddMessage(msg)
+        Append2Log(msg,TargetLogFile)
+        if lyrNameOnly.lower() in maxareas:
+            extract_maxarea = maxareas[lyrNameOnly.lower()]
+    else:
+        msg = "==> ERROR: " + maxarea_lookuptable + " does not exist!"
+        gp.AddMessage(msg)
+        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+
+    msg = "-> maximum area to extract for this layer is " + str(extract_maxarea) + " sq meters"
+    gp.AddMessage(msg)
+    Append2Log(msg,TargetLogFile)
+    return extract_maxarea
+
+def _processLayer(lyr, aoi, featureFormat, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area, aoi_ext, aoi_hash, aoi_geometry):
+    # describe a single layer, check it against its maxarea and clip it
+    # returns the path of the clipped output or None if nothing was written
+    # temporary stop gap measure to counteract bug  
+    if lyr.find(" ") > -1:
+        lyr = lyr.replace("'", "")
+    describe = timedCall("describe", lyr, describeLayer, lyr)
+    dataType = describe.DataType.lower()
+    msg = "--> Processing " + lyr
+    gp.AddMessage(msg)
+    Append2Log("<strong>" + msg + "</strong>",TargetLogFile)
+
+    # no need to look anything up or clip when the aoi doesn't touch the layer
+    if dataType in ["featurelayer", "rasterlayer", "mosaiclayer"] and not aoiTouchesLayer(aoi_geometry, describe):
+        msg = "-> AOI does not overlap " + lyr + ", nothing to extract"
+        gp.AddMessage(msg)
+        Append2Log(msg,TargetLogFile)
+        return None
+    if dataType in ["featurelayer", "rasterlayer", "mosaiclayer"] and layerUnchanged(lyr, describe):
+        return None
+    #
+    # - set extract_maxarea to default_maxarea parameter, or the layer's MaxArea
+    extract_maxarea = getLayerMaxArea(lyr)
+    # make sure we are dealing with features or raster and not some other layer type (group, tin, etc)
+    if dataType in ["featurelayer", "rasterlayer", "mosaiclayer"]:
+        # if the coordinate system is the same as the input
+        # set the environment to the coord sys of the layer being clipped
+        # may not be necessary, but is a failsafe.
+        # otherwise clip the pre-projected copy of the layer when there is one
+        source = lyr
+        if coordinateSystem.lower() == "same as input":
+            sr = describe.spatialreference
+            if sr != None:
+                setOutputCoordinateSystem(sr.exportToString())
+        else:
+            source = findProjectedSource(lyr, describe, coordinateSystem) or lyr
+
+        # raster branch
+        if dataType in ["rasterlayer", "mosaiclayer"]:
+            # clipping in tiles keeps memory bounded, so somewhat larger aois can be served that way
+            if aoi_area >= extract_maxarea and raster_tile_pixels > 0 and aoi_area < extract_maxarea * tiled_maxarea_factor:
+                msg = "-> AOI area (" + str(aoi_area) + ") exceeds the maximum area to extract (" + str(extract_maxarea) + " sq meters), clipping " + lyr + " in tiles"
+                gp.AddMessage(msg)
+                Append2Log(msg,TargetLogFile)
+                return clipWithResultCache(True, lyr, describe, True, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, aoi_hash,
+                    lambda: clipWithProjectionStats(lyr, describe, coordinateSystem, source, clipRaster,
+                                                    source, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataType, aoi_area, aoi_ext, True))
+            elif aoi_area >= extract_maxarea:
+                msg = "==> WARNING: AOI area (" + str(aoi_area) + ") exceeds the maximum area to extract (" + str(extract_maxarea) + " sq meters). " + lyr + " WILL BE SKIPPED!"
+                gp.AddWarning(msg)
+                gp.AddWarning(get_ID_message(86136) % lyr)
+                Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+            else:
+                return clipWithResultCache(True, lyr, describe, True, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, aoi_hash,
+                    lambda: clipWithProjectionStats(lyr, describe, coordinateSystem, source, clipRaster,
+                                                    source, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataType, aoi_area, aoi_ext))
+
+        # feature branch
+        else:
+            if aoi_area >= extract_maxarea:
+                msg = "==> WARNING: AOI area (" + str(aoi_area) + ") exceeds the maximum area to extract (" + str(extract_maxarea) + " sq meters). " + lyr + " WILL BE SKIPPED!"
+                gp.AddWarning(msg)
+                gp.AddWarning(get_ID_message(86136) % lyr)
+                Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+            else:
+                return clipWithResultCache(False, lyr, describe, convertFeaturesDuringClip, featureFormat, coordinateSystem, zipFolderPath, scratchFolderPath, aoi_hash,
+                    lambda: clipWithProjectionStats(lyr, describe, coordinateSystem, source, clipFeatures,
+                                                    source, aoi, featureFormat, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area,
+                                                    source == lyr and prefilterFeatures(lyr, describe, aoi_geometry) or None))
+    else:
+        #Message "  Cannot clip layer: %s.  This tool does not clip layers of type: %s..."
+        msg = get_ID_message(86143) % (lyr, dataType)
+        gp.AddWarning(msg)
+        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+    return None
+
+def readAOIFeatures(aoiLayer, nameField):
+    # [(object id, name, rings), ...] of the aoi features, named by nameField when the aoi has it
+    desc = gp.describe(aoiLayer)
+    oidField = desc.OIDFieldName
+    fieldNames = [f.name.lower() for f in gp.ListFields(aoiLayer)]
+    features = []
+    cur = gp.searchcursor(aoiLayer)
+    for row in cur:
+        oid = row.getValue(oidField)
+        name = "aoi_" + str(oid)
+        if nameField.lower() in fieldNames and row.getValue(nameField) not in [None, ""]:
+            name = str(row.getValue(nameField))
+        rings = ExtractData_Geometry.geometryRings(row.getValue(desc.shapefieldname))
+        if rings:
+            features.append((oid, name, rings))
+    del cur
+    return features
+
+def prepareBatch(aoiLayer, nameField, srName, zipFolderPath, scratchFolderPath):
+    # batch mode: every aoi feature gets its own folder in the zip folder and its own
+    # feature class in the scratch gdb. returns the dissolved union of the aois and
+    # [{"name", "path", "folder", "area", "ext", "geometry"}, ...], one per aoi feature
+    scratchGDB = getTempLocationPath(scratchFolderPath, "gdb")
+    oidField = gp.describe(aoiLayer).OIDFieldName
+    batch = []
+    for oid, name, rings in readAOIFeatures(aoiLayer, nameField):
+        folderName = re.sub(r"[^A-Za-z0-9_\-]", "_", name)
+        folderPath = gp.CreateUniqueName(folderName, zipFolderPath)
+        gp.CreateFolder_management(zipFolderPath, os.path.basename(folderPath))
+        aoiPath = os.path.join(scratchGDB, "aoi_" + str(oid))
+        gp.Select_analysis(aoiLayer, aoiPath, oidField + " = " + str(oid))
+        xmin, ymin, xmax, ymax = ExtractData_Geometry.ringsExtent(rings)
+        batch.append({"name": name,
+                      "path": aoiPath,
+                      "folder": folderPath,
+                      "area": ExtractData_Geometry.polygonArea(rings),
+                      "ext": "%r %r %r %r" % (xmin, ymin, xmax, ymax),
+                      "geometry": {"polygons": [rings], "srName": srName}})
+
+    # the layers are read once, through the union of all the aois
+    unionPath = os.path.join(scratchGDB, "aoi_union")
+    gp.Dissolve_management(aoiLayer, unionPath)
+    return unionPath, batch
+
+def clipBatchSource(lyr, aoi, aoi_ext, raster, scratchFolderPath):
+    # the part of a layer under the union of the batch aois, in the scratch gdb
+    scratchGDB = getTempLocationPath(scratchFolderPath, "gdb")
+    outputpath = gp.createuniquename(gp.validatetablename(os.path.basename(lyr.replace("\\", os.sep)), scratchGDB), scratchGDB)
+    try:
+        if raster:
+            msg = "-> running clip_management(" + lyr + "," + str(aoi_ext) + "," + outputpath + ")"
+            gp.AddMessage(msg)
+            Append2Log(msg,TargetLogFile)
+            timedCall("clip_management", lyr, gp.clip_management, lyr, str(aoi_ext), outputpath)
+        else:
+            msg = "-> running clip_analysis(" + lyr + "," + str(aoi) + "," + outputpath + ")"
+            gp.AddMessage(msg)
+            Append2Log(msg,TargetLogFile)
+            timedCall("clip_analysis", lyr, gp.clip_analysis, lyr, aoi, outputpath)
+        return outputpath
+    except:
+        if isTransientError(str(sys.exc_info()[1])):
+            raise
+        msg = get_ID_message(86142) % lyr
+        gp.AddWarning(msg)
+        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+        msg = gp.GetMessages(2)
+        gp.AddWarning(msg)
+        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+        return None
+
+def processLayerBatch(lyr, aoi, batch, featureFormat, rasterFormat, coordinateSystem, scratchFolderPath, convertFeaturesDuringClip, aoi_ext):
+    # process one layer for every aoi of a batch and record how long it took and how much it wrote
+    started = time.time()
+    outputs = []
+    try:
+        _processLayerBatch(lyr, aoi, batch, featureFormat, rasterFormat, coordinateSystem, scratchFolderPath, convertFeaturesDuringClip, aoi_ext, outputs)
+        zipFolderPath = os.path.dirname(batch[0]["folder"])
+        for outputpath in outputs:
+            timedCall("manifest", lyr, jobManifest.addOutput, lyr, outputpath, zipFolderPath)
+        return outputs
+    finally:
+        outputBytes = None
+        if outputs:
+            outputBytes = sum([outputSize(outputpath) for outputpath in outputs])
+        jobMetrics.record("layer", lyr, time.time() - started, outputBytes)
+
+def _processLayerBatch(lyr, aoi, batch, featureFormat, rasterFormat, coordinateSystem, scratchFolderPath, convertFeaturesDuringClip, aoi_ext, outputs):
+    # describe and look up the layer once, clip it once to the union of the aois
+    # (aoi) and clip that much smaller intermediate into each aoi's folder
+    if lyr.find(" ") > -1:
+        lyr = lyr.replace("'", "")
+    describe = timedCall("describe", lyr, describeLayer, lyr)
+    dataType = describe.DataType.lower()
+    msg = "--> Processing " + lyr + " for " + str(len(batch)) + " areas of interest"
+    gp.AddMessage(msg)
+    Append2Log("<strong>" + msg + "</strong>",TargetLogFile)
+
+    if dataType not in ["featurelayer", "rasterlayer", "mosaiclayer"]:
+        #Message "  Cannot clip layer: %s.  This tool does not clip layers of type: %s..."
+        msg = get_ID_message(86143) % (lyr, dataType)
+        gp.AddWarning(msg)
+        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+        return
+    if layerUnchanged(lyr, describe):
+        return
+    raster = dataType in ["rasterlayer", "mosaiclayer"]
+    extract_maxarea = getLayerMaxArea(lyr)
+
+    # the aois that touch the layer and are within its maxarea, each checked on its own
+    # the way a separate job for it would be
+    targets = []
+    for item in batch:
+        if not aoiTouchesLayer(item["geometry"], describe):
+            msg = "-> AOI " + item["name"] + " does not overlap " + lyr + ", nothing to extract"
+            gp.AddMessage(msg)
+            Append2Log(msg,TargetLogFile)
+        elif raster and raster_tile_pixels > 0 and item["area"] < extract_maxarea * tiled_maxarea_factor:
+            targets.append((item, item["area"] >= extract_maxarea))
+        elif item["area"] < extract_maxarea:
+            targets.append((item, False))
+        else:
+            msg = "==> WARNING: AOI " + item["name"] + " area (" + str(item["area"]) + ") exceeds the maximum area to extract (" + str(extract_maxarea) + " sq meters). " + lyr + " WILL BE SKIPPED for this AOI!"
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+    if not targets:
+        return
+
+    source = lyr
+    if coordinateSystem.lower() == "same as input":
+        sr = describe.spatialreference
+        if sr != None:
+            setOutputCoordinateSystem(sr.exportToString())
+    else:
+        source = findProjectedSource(lyr, describe, coordinateSystem) or lyr
+
+    # read the layer once. a raster is only read through the union extent when that
+    # extent isn't much more than the layer allows, far apart aois clip the layer directly
+    xmin, ymin, xmax, ymax = [float(v) for v in str(aoi_ext).split()[:4]]
+    if not raster or (xmax - xmin) * (ymax - ymin) < extract_maxarea * tiled_maxarea_factor:
+        intermediate = clipWithProjectionStats(lyr, describe, coordinateSystem, source, clipBatchSource,
+                                               source, aoi, aoi_ext, raster, scratchFolderPath)
+        if intermediate is not None:
+            source = intermediate
+
+    for item, tiled in targets:
+        msg = "-> Extracting " + lyr + " for AOI " + item["name"]
+        gp.AddMessage(msg)
+        Append2Log(msg,TargetLogFile)
+        if raster:
+            if os.path.isabs(source):
+                dataType = "rasterlayer"
+            outputpath = clipRaster(source, item["path"], rasterFormat, item["folder"], scratchFolderPath, dataType, item["area"], item["ext"], tiled)
+        else:
+            outputpath = clipFeatures(source, item["path"], featureFormat, item["folder"], scratchFolderPath, convertFeaturesDuringClip, item["area"])
+        if outputpath is not None:
+            outputs.append(outputpath)
+
+def initClipWorker(lock, events, interop):
+    # runs once in every worker process of the clip pool, the settings of a job come with its layers
+    global workspaceLock, workerEvents, haveDataInterop
+    workspaceLock = lock
+    workerEvents = events
+    haveDataInterop = interop
+    # the job writes the progress events, the workers send theirs through events
+    jobProgress.reset()
+    if haveDataInterop:
+        gp.CheckOutExtension("DataInteroperability")
+
+def setUpClipWorkerJob(settings):
+    # runs in a worker of the clip pool before the first layer of a job it clips
+    global workerSettings
+    workerSettings = dict(settings)
+    # use the lookup table the job already read rather than going back to SDE
+    if settings["maxareas"] is not None:
+        maxAreaCache["table"] = settings["maxareas"]
+        maxAreaCache["loaded"] = time.time()
+    # the job already checked the previous manifest against this job
+    jobManifest.previous = settings["manifestPrevious"]
+    # and what the job knows about the layers
+    layerRegistry["layers"].update(settings["layerRegistry"])
+    if settings["coordinateSystem"].lower() != "same as input":
+        setOutputCoordinateSystem(settings["coordinateSystem"])
+    else:
+        # a worker of a warm worker's pool may still have an earlier job's coordinate system
+        setOutputCoordinateSystem(None)
+    # each worker gets its own sub-folder of the job scratch folder
+    gp.scratchworkspace = settings["scratchFolderPath"]
+    workerSettings["workerFolderPath"] = createFolderInScratch("worker")
+
+def clipLayerWorker(task):
+    # clip one layer inside a pool worker and hand back its output and its part of the processing log
+    global TargetLogFile, workerTaskIndex
+    index, lyr, settings = task
+    if workerSettings is None or workerSettings["jobId"] != settings["jobId"]:
+        setUpClipWorkerJob(settings)
+    workerTaskIndex = index
+    s = workerSettings
+    # the job times the layer out from when a worker picks it up
+    workerEvents.put((s["jobId"], index, time.time(), "clipping", None))
+    TargetLogFile = os.path.join(s["workerFolderPath"], "_ExtractData_ProcessingLog.html")
+    InitLog("", TargetLogFile)
+    jobMetrics.reset()
+    jobManifest.layers = {}
+    layerStatus.reset()
+    try:
+        if s["batch"] is not None:
+            outputs = runLayerTask(lyr, processLayerBatch, lyr, s["aoi"], s["batch"], s["featureFormat"], s["rasterFormat"], s["coordinateSystem"],
+                         s["workerFolderPath"], s["convertFeaturesDuringClip"], s["aoi_ext"])
+        else:
+            outputs = runLayerTask(lyr, processLayer, lyr, s["aoi"], s["featureFormat"], s["rasterFormat"], s["coordinateSystem"], s["zipFolderPath"],
+                         s["workerFolderPath"], s["convertFeaturesDuringClip"], s["aoi_area"], s["aoi_ext"], s["aoi_hash"], s["aoi_geometry"])
+    finally:
+        content = getLog(TargetLogFile).render()
+        # every job has its own worker folder, a warm worker's pool would keep a handle open per job
+        # (which also keeps trashScratchWorkspace from removing the folder on windows)
+        CloseLog(TargetLogFile)
+    return index, content, outputs, jobMetrics.timings, jobManifest.layers, layerStatus.rows
+
+def clipLayersParallel(lyrs, aoi, featureFormat, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area, aoi_ext, aoi_hash, aoi_geometry, workerCount, zipStream=None, batch=None):
+    # the feature set can't be handed to another process, so write the aoi to the scratch gdb
+    aoiPath = os.path.join(getTempLocationPath(scratchFolderPath, "gdb"), "aoi")
+    gp.CopyFeatures_management(aoi, aoiPath)
+
+    # the workers of earlier jobs saved what they described to layer_registry_file
+    layerRegistry["checked"] = 0
+    checkLayerRegistryFile()
+
+    settings = {"jobId": uuid.uuid4().hex,
+                "aoi": aoiPath,
+                "featureFormat": featureFormat,
+                "rasterFormat": rasterFormat,
+                "coordinateSystem": coordinateSystem,
+                "zipFolderPath": zipFolderPath,
+                "scratchFolderPath": scratchFolderPath,
+                "convertFeaturesDuringClip": convertFeaturesDuringClip,
+                "aoi_area": aoi_area,
+                "aoi_ext": str(aoi_ext),
+                "aoi_hash": aoi_hash,
+                "aoi_geometry": aoi_geometry,
+                "batch": batch,
+                "maxareas": getMaxAreaLookup(),
+                "manifestPrevious": jobManifest.previous,
+                "layerRegistry": layerRegistry["layers"]}
+
+    msg = "-> Clipping " + str(len(lyrs)) + " layers with " + str(workerCount) + " worker processes"
+    gp.AddMessage(msg)
+    Append2Log(msg,TargetLogFile)
+
+    # a warm worker's pool is already running, otherwise the job starts its own
+    if clipPool is not None:
+        pool, events = clipPool, clipPoolEvents
+    else:
+        pool, events = createClipPool(workerCount)
+    finished = Queue.Queue()
+    pending = dict([(index, pool.apply_async(clipLayerWorker, ((index, lyr, settings),), callback=finished.put)) for index, lyr in enumerate(lyrs)])
+    started = {}
+    layerOutputs = {}
+    results = []
+    timedOut = []
+
+    def readEvents():
+        # note when the workers picked layers up and what they wrote
+        try:
+            while True:
+                jobId, index, eventTime, state, outputpath = events.get_nowait()
+                # late events of an earlier job of the warm worker's pool
+                if jobId != settings["jobId"]:
+                    continue
+                if state == "output":
+                    layerOutputs.setdefault(index, []).append(outputpath)
+                    continue
+                if state == "clipping":
+                    started[index] = eventTime
+                if index in pending:
+                    jobProgress.layer(lyrs[index], state)
+        except Queue.Empty:
+            pass
+
+    try:
+        while pending:
+            # wait for a layer to finish
+            try:
+                finished.get(True, 1)
+            except Queue.Empty:
+                pass
+            readEvents()
+            for index in sorted(pending.keys()):
+                lyr = lyrs[index]
+                if pending[index].ready():
+                    try:
+                        index, content, outputs, timings, manifestLayers, statusRows = pending.pop(index).get()
+                    except:
+                        error = sys.exc_info()[0].__name__ + ": " + str(sys.exc_info()[1])
+                        content = "<strong><font color='red'>==> ERROR: " + lyr + " failed and is not in the extract: " + error + "</font></strong><br>"
+                        outputs, timings, manifestLayers = [], [], {}
+                        statusRows = {lyr: {"layer": lyr, "status": "failed", "attempts": 1, "seconds": 0, "error": error}}
+                        jobManifest.setFailed(lyr, "failed", error)
+                    results.append((index, content))
+                    jobMetrics.timings.extend(timings)
+                    jobManifest.layers.update(manifestLayers)
+                    layerStatus.rows.update(statusRows)
+                    # hand each layer to the zip stage as soon as its worker is done with it
+                    finishLayer(lyr, outputs, zipStream)
+                elif layer_timeout > 0 and index in started and time.time() - started[index] > layer_timeout:
+                    # the worker can't be stopped on its own, the pool is terminated once the other layers are done
+                    del pending[index]
+                    timedOut.append(index)
+                    msg = "==> ERROR: " + lyr + " took more than " + str(layer_timeout) + " seconds and is not in the extract"
+                    gp.AddWarning(msg)
+                    results.append((index, "<strong><font color='red'>" + msg + "</font></strong><br>"))
+                    layerStatus.record(lyr, "timed out", 1, time.time() - started[index], msg[len("==> ERROR: "):])
+                    jobManifest.setFailed(lyr, "timed out", msg[len("==> ERROR: "):])
+                    jobProgress.layer(lyr, "timed out")
+    finally:
+        if pool is clipPool:
+            # a worker stuck on a layer can only be stopped with its pool, the warm worker gets a new one
+            if timedOut or pending:
+                stopClipPool(True)
+                startClipPool(clipPoolWorkers)
+        else:
+            if timedOut or pending:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+    # what the timed out layers had written would be swept into the zip, their workers are stopped now
+    readEvents()
+    for index in timedOut:
+        del attemptOutputs[:]
+        attemptOutputs.extend(layerOutputs.get(index, []))
+        deleteAttemptOutputs(lyrs[index])
+
+    # merge the worker logs back in the order the layers were requested
+    results.sort()
+    for index, content in results:
+        AppendLogContent(content, TargetLogFile)
+
+def createClipPool(workerCount):
+    # inside ArcGIS the running executable isn't python, so point multiprocessing at it
+    if sys.platform == "win32":
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+    lock = multiprocessing.Lock()
+    events = multiprocessing.Queue()
+    pool = multiprocessing.Pool(workerCount, initClipWorker, (lock, events, haveDataInterop))
+    return pool, events
+
+def startClipPool(workerCount=None):
+    # a warm worker keeps one clip pool for all its jobs, so the clip workers create the
+    # geoprocessor and check out Data Interop once rather than for every job
+    global clipPool, clipPoolEvents, clipPoolWorkers
+    clipPoolWorkers = workerCount or max_clip_workers
+    if clipPoolWorkers > 1 and clipPool is None:
+        clipPool, clipPoolEvents = createClipPool(clipPoolWorkers)
+
+def stopClipPool(terminate=False):
+    global clipPool, clipPoolEvents
+    if clipPool is None:
+        return
+    if terminate:
+        clipPool.terminate()
+    else:
+        clipPool.close()
+    clipPool.join()
+    clipPool = None
+    clipPoolEvents = None
+
+def clipAndConvert(lyrs, aoi, featureFormat, rasterFormat, coordinateSystem, outZipFile=None, batchField="", sinceManifest=""):
+    # when outZipFile is given the output is zipped while the layers are clipped.
+    # when batchField is given every aoi feature is extracted into its own folder,
+    # named by the batchField value of the feature.
+    # when sinceManifest (a previous extract's zip or manifest) is given, layers that
+    # haven't changed since that extract are listed in the manifest but not extracted
+    zipStream = None
+    jobMetrics.reset(layers=len(lyrs), featureFormat=featureFormat[1], rasterFormat=rasterFormat[1],
+                     coordinateSystem=coordinateSystem, outZipFile=outZipFile)
+    layerStatus.reset()
+    jobProgress.reset(outZipFile)
     try:
         # for certain output formats we don't need to use Data Interop to do the conversion
         convertFeaturesDuringClip = False
@@ -352,13 +3441,20 @@ def clipAndConvert(lyrs, aoi, featureFormat, rasterFormat, coordinateSystem):
             convertFeaturesDuringClip = True
 
         # get a scratch folder for temp data and a zip folder to hold
-        # the final data we want to zip and send
-        zipFolderPath = createFolderInScratch("zipfolder")
-        scratchFolderPath = createFolderInScratch("scratchfolder")
+        # the final data we want to zip and send, ready made from the scratch pool when there is one
+        started = time.time()
+        workspace = claimScratchWorkspace()
+        if workspace is not None:
+            zipFolderPath, scratchFolderPath = workspace
+        else:
+            zipFolderPath = createFolderInScratch("zipfolder")
+            scratchFolderPath = createFolderInScratch("scratchfolder")
+        jobMetrics.record("workspace", None, time.time() - started)
 
         # Set TargetLogFile
         global TargetLogFile
         TargetLogFile = os.path.join(zipFolderPath, "_ExtractData_ProcessingLog.html")
+        jobMetrics.job["zipFolder"] = zipFolderPath
 
         # Init geoprocessing log
         # log Header
@@ -414,89 +3510,107 @@ def clipAndConvert(lyrs, aoi, featureFormat, rasterFormat, coordinateSystem):
 ##        gp.AddMessage(msg)
 ##        Append2Log(msg,TargetLogFile)
         aoi_area = width * height
+        msg = "-> AOI bounding box area = " + str(aoi_area) + " sq meters"
+        gp.AddMessage(msg)
+        Append2Log(msg,TargetLogFile)
+
+        # the bounding box overstates thin or diagonal aois, use the area of the polygons themselves
+        aoi_geometry = None
+        try:
+            aoi_geometry = {"polygons": readAOIPolygons(Clip_FeatureLayer),
+                            "srName": desc.spatialreference.name}
+            if aoi_geometry["polygons"]:
+                aoi_area = sum([ExtractData_Geometry.polygonArea(rings) for rings in aoi_geometry["polygons"]])
+        except:
+            aoi_geometry = None
+            msg = "==> WARNING: Unable to read the AOI polygons, using the AOI bounding box area"
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
         msg = "-> AOI area to extract = " + str(aoi_area) + " sq meters"
         gp.AddMessage(msg)
         Append2Log(msg,TargetLogFile)
-        
-        # loop through the list of layers recieved
-        for lyr in lyrs:
-            # temporary stop gap measure to counteract bug  
-            if lyr.find(" ") > -1:
-                lyr = lyr.replace("'", "")
-            describe = gp.describe(lyr)
-            dataType = describe.DataType.lower()
-            msg = "--> Processing " + lyr
+
+        # batch mode: one folder per aoi feature, the layers are read once through the union of the aois
+        batch = None
+        if batchField:
+            aoi, batch = prepareBatch(Clip_FeatureLayer, batchField, desc.spatialreference.name, zipFolderPath, scratchFolderPath)
+            jobMetrics.job["aois"] = len(batch)
+            msg = "-> Batch of " + str(len(batch)) + " areas of interest, one folder each named by " + batchField
             gp.AddMessage(msg)
-            Append2Log("<strong>" + msg + "</strong>",TargetLogFile)
-            #
-            # - set extract_maxarea to default_maxarea parameter
-            extract_maxarea = default_maxarea
-            
-            # See if the current lyr has a MaxArea defined in the maxarea_lookuptable
-            # verify that table exists
-            if gp.Exists(maxarea_lookuptable):
-                # Determine if there is a slash deliminter ("\"), which happens when this runs on the AGS server, and strip out stuff before the "\" slash
-                if lyr.find("\\"):
-                    lyrNameOnly = lyr.split("\\")[-1]
-                else:
-                    lyrNameOnly = lyr
-                whereclause = '"LAYERNAME" = ' + "'" + lyrNameOnly + "'"
-                msg = "-> Checking maxarea lookup table where " + whereclause
-                gp.AddMessage(msg)
-                Append2Log(msg,TargetLogFile)
-                cur = gp.searchcursor(maxarea_lookuptable,whereclause)
-                # Iterate through the rows in the cursor
-                #
-                for row in cur:
-                    extract_maxarea = row.maxarea
+            Append2Log(msg,TargetLogFile)
 
-                del cur
-            else:
-                msg = "==> ERROR: " + maxarea_lookuptable + " does not exist!"
+        # the manifest ties the extract to the aoi, formats and coordinate system it was made for
+        previousManifest = None
+        if sinceManifest:
+            try:
+                previousManifest = loadManifest(sinceManifest)
+                msg = "-> Extracting only the layers that changed since " + str(previousManifest.get("created"))
                 gp.AddMessage(msg)
+                Append2Log(msg,TargetLogFile)
+            except:
+                msg = "==> WARNING: Unable to read the manifest " + sinceManifest + ", extracting every layer"
+                gp.AddWarning(msg)
                 Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+        manifest_aoi_hash = getAOIHash(Clip_FeatureLayer)
+        jobManifest.reset(previousManifest, aoiHash=manifest_aoi_hash, featureFormat=" - ".join(featureFormat),
+                          rasterFormat=" - ".join(rasterFormat), coordinateSystem=str(coordinateSystem), batchField=batchField)
 
-            msg = "-> maximum area to extract for this layer is " + str(extract_maxarea) + " sq meters"
+        # the aoi geometry is part of the result cache key, batches don't use the cache
+        aoi_hash = None
+        if result_cache_folder != "" and batch is None:
+            aoi_hash = manifest_aoi_hash
+        
+        # estimate the output before anything is clipped, the job has to fit the budget
+        requestedLyrs = lyrs
+        lyrs, estimates = preflightCheck(requestedLyrs, aoi, aoi_ext, aoi_geometry, featureFormat, rasterFormat)
+
+        # loop through the list of layers recieved
+        if outZipFile is not None:
+            zipStream = ZipStream(zipFolderPath, outZipFile)
+
+        workerCount = min(max_clip_workers, len(lyrs))
+        jobProgress.queued(requestedLyrs, lyrs, estimates, workerCount)
+        # a layer can only be timed out in a worker process
+        if workerCount > 1 or (layer_timeout > 0 and lyrs):
+            clipLayersParallel(lyrs, aoi, featureFormat, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area, aoi_ext, aoi_hash, aoi_geometry, workerCount, zipStream, batch)
+        else:
+            for lyr in lyrs:
+                jobProgress.layer(lyr, "clipping")
+                if batch is not None:
+                    outputs = runLayerTask(lyr, processLayerBatch, lyr, aoi, batch, featureFormat, rasterFormat, coordinateSystem, scratchFolderPath, convertFeaturesDuringClip, aoi_ext)
+                else:
+                    outputs = runLayerTask(lyr, processLayer, lyr, aoi, featureFormat, rasterFormat, coordinateSystem, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area, aoi_ext, aoi_hash, aoi_geometry)
+                finishLayer(lyr, outputs, zipStream)
+
+        # how each layer ended, the layers that worked are zipped whatever happened to the others
+        lyrs = requestedLyrs
+        learnFromLayers(estimates)
+        failed = layerStatus.failed()
+        jobMetrics.job["failedLayers"] = len(failed)
+        Append2Log("<br><strong>Layer status</strong><br>" + layerStatus.toHTML(lyrs) + "<br>",TargetLogFile)
+        if failed:
+            msg = "==> WARNING: " + str(len(failed)) + " of " + str(len(lyrs)) + " layers failed and are not in the extract: " + ", ".join([row["layer"] for row in failed])
+            gp.AddWarning(msg)
+            Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
+
+        unchanged = [lyr for lyr in jobManifest.layers if jobManifest.layers[lyr]["status"] == "unchanged"]
+        if sinceManifest:
+            jobMetrics.job["unchangedLayers"] = len(unchanged)
+            msg = "-> " + str(len(unchanged)) + " of " + str(len(lyrs)) + " layers are unchanged since the previous extract"
             gp.AddMessage(msg)
             Append2Log(msg,TargetLogFile)
-            # make sure we are dealing with features or raster and not some other layer type (group, tin, etc)
-            if dataType in ["featurelayer", "rasterlayer", "mosaiclayer"]:
-                # if the coordinate system is the same as the input
-                # set the environment to the coord sys of the layer being clipped
-                # may not be necessary, but is a failsafe.
-                if coordinateSystem.lower() == "same as input":
-                    sr = describe.spatialreference
-                    if sr != None:
-                        gp.outputcoordinatesystem = sr
-
-                # raster branch
-                if dataType in ["rasterlayer", "mosaiclayer"]:
-                    if aoi_area >= extract_maxarea:
-                        msg = "==> WARNING: AOI area (" + str(aoi_area) + ") exceeds the maximum area to extract (" + str(extract_maxarea) + " sq meters). " + lyr + " WILL BE SKIPPED!"
-                        arcpy.AddWarning(msg)
-                        gp.AddWarning(get_ID_message(86136) % lyr)
-                        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
-                    else:
-                        clipRaster(lyr, aoi, rasterFormat, zipFolderPath, scratchFolderPath, dataType, aoi_area, aoi_ext)
-
-                # feature branch
-                else:
-                    if aoi_area >= extract_maxarea:
-                        msg = "==> WARNING: AOI area (" + str(aoi_area) + ") exceeds the maximum area to extract (" + str(extract_maxarea) + " sq meters). " + lyr + " WILL BE SKIPPED!"
-                        arcpy.AddWarning(msg)
-                        gp.AddWarning(get_ID_message(86136) % lyr)
-                        Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
-                    else:
-                        clipFeatures(lyr, aoi, featureFormat, zipFolderPath, scratchFolderPath, convertFeaturesDuringClip, aoi_area)
-            else:
-                #Message "  Cannot clip layer: %s.  This tool does not clip layers of type: %s..."
-                msg = get_ID_message(86143) % (lyr, dataType)
-                gp.AddWarning(msg)
-                Append2Log("<strong><font color='red'>" + msg + "</font></strong>",TargetLogFile)
-                
+        jobManifest.write(zipFolderPath, layerStatus.toRows(lyrs))
+
+        # add whatever could not be zipped per layer (gdb, grid, the log, the manifest) and finish the zip
+        if zipStream is not None:
+            FlushLog(TargetLogFile)
+            zipStream.close()
+
         return zipFolderPath
 
     except:
+        if zipStream is not None:
+            zipStream.abort()
         errstring = get_ID_message(86144)#"Failure in clipAndConvert..\n"
         tb = sys.exc_info()[2]
         tbinfo = traceback.format_tb(tb)[0]
@@ -504,11 +3618,85 @@ def clipAndConvert(lyrs, aoi, featureFormat, rasterFormat, coordinateSystem):
                 str(sys.exc_type)+ ": " + str(sys.exc_value) + "\n"
         errstring += pymsg
         Append2Log("<strong><font color='red'>" + errstring + "</font></strong>",TargetLogFile)
+        FlushLog(TargetLogFile)
         raise Exception, errstring
 
 def get_ID_message(ID):
     return re.sub("%1|%2", "%s", gp.GetIDMessage(ID))
 
+def checkOutDataInterop():
+    # Data Interop is checked out once per process, a warm worker keeps it for all its jobs
+    global haveDataInterop
+    if gp.CheckExtension("DataInteroperability") == "Available":
+        gp.CheckOutExtension("DataInteroperability")
+        haveDataInterop = True
+    else:
+        haveDataInterop = False
+    return haveDataInterop
+
+def setUpScratchWorkspace():
+    # Do this so the tool works even when the scratch isn't set or if it is set to gdb/mdb/sde
+    if gp.scratchworkspace is None or os.path.exists(str(gp.scratchworkspace)) is False:
+        gp.scratchworkspace = gp.getsystemenvironment("TEMP")
+    else:
+        swd = gp.describe(gp.scratchworkspace)
+        wsid = swd.workspacefactoryprogid
+        if wsid == 'esriDataSourcesGDB.FileGDBWorkspaceFactory.1' or\
+           wsid == 'esriDataSourcesGDB.AccessWorkspaceFactory.1' or\
+           wsid == 'esriDataSourcesGDB.SdeWorkspaceFactory.1':
+            gp.scratchworkspace = gp.getsystemenvironment("TEMP")
+
+def parseFormat(inputFormat, default):
+    # Do a little internal validation.
+    # Expecting "long name - short name - extension, the default when no format is specified
+    if inputFormat == "":
+        return list(default)
+    format = map(lambda x: x.strip(), inputFormat.split("-"))
+    if len(format) < 3:
+        format.append("")
+    return format
+
+def runExtract(layers, areaOfInterest, inputFeatureFormat, inputRasterFormat, coordinateSystem, customCoordSystemFolder, outputZipFile, batchField="", sinceManifest=""):
+    # one extract with the tool's parameters, run by the tool and by the warm workers of
+    # ExtractData_Worker.py. the geoprocessor, licenses and scratch workspace are already set up
+    # If no format is specified, send features to GDB and rasters to GRID.
+    featureFormat = parseFormat(inputFeatureFormat, ["File Geodatabase", "GDB", ".gdb"])
+    rasterFormat = parseFormat(inputRasterFormat, ["ESRI GRID", "GRID", ""])
+
+    coordinateSystem = setUpCoordSystemEnvironment(coordinateSystem, customCoordSystemFolder)
+
+    # a failure before the first layer is still reported to whoever follows the job's progress
+    jobProgress.reset(outputZipFile)
+
+    # clip and convert the layers, zipping each layer's output as soon as it is done
+    zipFolder = clipAndConvert(layers, areaOfInterest, featureFormat, rasterFormat, coordinateSystem, outputZipFile, batchField, sinceManifest)
+
+    # Processing complete notice
+    msg = "Data extract processing complete!"
+    gp.AddMessage(msg)
+    Append2Log("<strong><font color='blue'>" + msg + "</font></strong>",TargetLogFile)
+
+    # Add end date/time stamp to the log
+    datetime_stamp_end = str(time.strftime("%m/%d/%Y %H:%M:%S", time.localtime()))
+    msg = "Processing End Time: " + datetime_stamp_end
+    Append2Log(msg,TargetLogFile)
+    CloseLog(TargetLogFile)
+    writeJobMetrics("succeeded")
+    jobProgress.finish("succeeded", bytes=os.path.getsize(outputZipFile), failedLayers=len(layerStatus.failed()))
+    return zipFolder
+
+def reportJobError():
+    # report the exception being handled as the job's error, returns the message
+    tb = sys.exc_info()[2]
+    tbinfo = traceback.format_tb(tb)[0]
+    pymsg = "ERRORS:\nTraceback Info:\n" + tbinfo + "\nError Info:\n    " + \
+            str(sys.exc_type)+ ": " + str(sys.exc_value) + "\n"
+    gp.AddError(pymsg)
+    FlushLog()
+    writeJobMetrics("failed")
+    jobProgress.finish("failed", error=str(sys.exc_value))
+    return pymsg
+
 if __name__ == '__main__':
     try:
         # Get the Parameters
@@ -519,77 +3707,23 @@ if __name__ == '__main__':
         coordinateSystem = gp.getparameterastext(4)
         customCoordSystemFolder = gp.getparameterastext(5)
         outputZipFile = gp.getparameterastext(6).replace("\\",os.sep)
-        
-        # Set constants
-        # Version number of this program
-        version = "1a"
-        global TargetLogFile
-        TargetLogFile = "none"
-        
-        # Max Area lookup table
-        maxarea_lookuptable = r"\\ags\AGS_services\VCGI_services\ClipAndShip\ToolData\SDE.VCGI.ORG-GDB_VCGI_Web-as-VCGI_AGS_user.sde\GDB_VCGI_Web.VCGI_ADMIN.DWARE_Datasets_MaxSize"
-        # Default max area to extract (state of VT and beyond)
-        default_maxarea = 400000000000
-        
-        if gp.CheckExtension("DataInteroperability") == "Available":
-            gp.CheckOutExtension("DataInteroperability")
-            haveDataInterop = True
-        else:
-            haveDataInterop = False
-        # Do a little internal validation.
-        # Expecting "long name - short name - extension
-        # If no format is specified, send features to GDB.
-        if inputFeatureFormat == "":
-            featureFormat = ["File Geodatabase", "GDB", ".gdb"]
-        else:
-            #featureFormat = inputFeatureFormat.split(" - ")
-            featureFormat = map(lambda x: x.strip(), inputFeatureFormat.split("-"))
-            if len(featureFormat) < 3:
-                featureFormat.append("")
-
-        # If no format is specified, send rasters to GRID.
-        # Expecting "long name - short name - extension
-        if inputRasterFormat == "":
-            rasterFormat = ["ESRI GRID", "GRID", ""]
-        else:
-            #rasterFormat = inputRasterFormat.split(" - ")
-            rasterFormat = map(lambda x: x.strip(), inputRasterFormat.split("-"))
-            if len(rasterFormat) < 3:
-                rasterFormat.append("")
+        # optional: extract each aoi feature into its own folder, named by this aoi field
+        batchField = ""
+        if gp.GetArgumentCount() > 7:
+            batchField = gp.getparameterastext(7)
+        # optional: a previous extract (its zip or manifest), only the layers changed since are extracted
+        sinceManifest = ""
+        if gp.GetArgumentCount() > 8:
+            sinceManifest = gp.getparameterastext(8)
 
-        coordinateSystem = setUpCoordSystemEnvironment(coordinateSystem, customCoordSystemFolder)
-
-        # Do this so the tool works even when the scratch isn't set or if it is set to gdb/mdb/sde
-        if gp.scratchworkspace is None or os.path.exists(str(gp.scratchworkspace)) is False:
-            gp.scratchworkspace = gp.getsystemenvironment("TEMP")
-        else:
-            swd = gp.describe(gp.scratchworkspace)
-            wsid = swd.workspacefactoryprogid
-            if wsid == 'esriDataSourcesGDB.FileGDBWorkspaceFactory.1' or\
-               wsid == 'esriDataSourcesGDB.AccessWorkspaceFactory.1' or\
-               wsid == 'esriDataSourcesGDB.SdeWorkspaceFactory.1':
-                gp.scratchworkspace = gp.getsystemenvironment("TEMP")
-
-        # clip and convert the layers and get the path to the folder we want to zip
-        zipFolder = clipAndConvert(layers, areaOfInterest, featureFormat, rasterFormat, coordinateSystem)
-
-        # zip the folder
-        zipUpFolder(zipFolder, outputZipFile)
-
-        # Processing complete notice
-        msg = "Data extract processing complete!"
-        gp.AddMessage(msg)
-        Append2Log("<strong><font color='blue'>" + msg + "</font></strong>",TargetLogFile)
-        
-        # Add end date/time stamp to the log
-        datetime_stamp_end = str(time.strftime("%m/%d/%Y %H:%M:%S", time.localtime()))
-        msg = "Processing End Time: " + datetime_stamp_end
-        Append2Log(msg,TargetLogFile)
+        checkOutDataInterop()
+        setUpScratchWorkspace()
+        runExtract(layers, areaOfInterest, inputFeatureFormat, inputRasterFormat, coordinateSystem, customCoordSystemFolder,
+                   outputZipFile, batchField, sinceManifest)
 
     except:
-        tb = sys.exc_info()[2]
-        tbinfo = traceback.format_tb(tb)[0]
-        pymsg = "ERRORS:\nTraceback Info:\n" + tbinfo + "\nError Info:\n    " + \
-                str(sys.exc_type)+ ": " + str(sys.exc_value) + "\n"
-        gp.AddError(pymsg)
+        reportJobError()
+
+    # the job is done with its workspace, the next job's claim purges and refills the scratch pool
+    releaseScratchWorkspace(False)
 